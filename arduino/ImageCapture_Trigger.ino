@@ -15,6 +15,20 @@ unsigned long lastCaptureTime = 0;
 
 boolean  toggle1 = 0;
 
+// Number of trigger pulses sent since the last start command
+volatile unsigned long pulseCount = 0;
+
+// Interval between "pulses <count>" reports to Python, in ms
+#define REPORT_INTERVAL 1000
+
+void reportPulses() {
+  noInterrupts();
+  unsigned long count = pulseCount;
+  interrupts();
+  Serial.print("pulses ");
+  Serial.println(count);
+}
+
 unsigned long readInteger() {
   unsigned long ret = 0;
   while (true) {
@@ -90,6 +104,7 @@ ISR(TIMER1_COMPA_vect)
   if (toggle1)
   {
     digitalWrite(CAMERA_PIN,HIGH);
+    pulseCount++;
     toggle1 = 0;
   }
   else
@@ -118,6 +133,8 @@ void loop() {
       // Temporarily disable interrupts
       noInterrupts();
 
+      pulseCount = 0;
+
       // Set up timer interrupts with the received fps value
       setTimerInterrupts(fps);
 
@@ -126,9 +143,14 @@ void loop() {
 
       // Capture images for the specified duration
       unsigned long startTime = millis();
+      unsigned long lastReport = startTime;
       
       while (millis() - startTime < duration * 1000) {
-        // Just wait while the ISR handles the image captures
+        // The ISR handles the image captures; report progress once per interval
+        if (millis() - lastReport >= REPORT_INTERVAL) {
+          lastReport += REPORT_INTERVAL;
+          reportPulses();
+        }
       }
       
       //delay(100);
@@ -136,6 +158,7 @@ void loop() {
       TIMSK1 &= ~(1 << OCIE1A);
       digitalWrite(CAMERA_PIN, LOW);
       delay(500);
+      reportPulses();
       // Send "done" message to Python script
       Serial.println("done");
     }
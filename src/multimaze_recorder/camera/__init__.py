@@ -1,3 +1,7 @@
-from multimaze_recorder.camera.tis import TIS, SinkFormats
+try:
+    from multimaze_recorder.camera.tis import TIS, SinkFormats
+except (ImportError, ValueError):
+    # PyGObject or tiscamera is missing; only camera.sim is usable
+    TIS = SinkFormats = None
 
 __all__ = ["TIS", "SinkFormats"]
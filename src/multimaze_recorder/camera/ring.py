@@ -0,0 +1,123 @@
+"""Preallocated ring of frame slots shared between the capture thread and consumers.
+
+The GStreamer callback copies each buffer once into a free slot; consumers
+borrow a slot with ``acquire`` and hand it back with ``release``.  Nothing is
+allocated per frame, so hour-long recordings do not churn frame-sized bytes
+objects through the allocator.
+"""
+
+import threading
+from collections import namedtuple
+
+import numpy
+
+
+Frame = namedtuple("Frame", "seq pts time slot image")
+
+
+class FrameRing:
+    """Fixed pool of ``slots`` frames of identical shape and dtype.
+
+    Every buffer offered to ``write`` gets a sequence number, including the
+    ones that had to be dropped because all slots were borrowed, so gaps in
+    the sequence of acquired frames reveal lost frames.
+    """
+
+    def __init__(self, slots, shape, dtype=numpy.uint8):
+        if slots < 2:
+            raise ValueError("A frame ring needs at least two slots")
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self._frames = numpy.empty((slots,) + self.shape, dtype=self.dtype)
+        self._seq = [-1] * slots
+        self._pts = [None] * slots
+        self._times = [None] * slots
+        self._refs = [0] * slots
+        self._lock = threading.Lock()
+        self._cursor = 0
+        self._latest = -1
+        self.next_seq = 0
+        self.dropped = 0
+
+    @property
+    def frame_bytes(self):
+        return self._frames[0].nbytes
+
+    def _claim_slot(self):
+        """Return the index of a slot that nobody holds, or None."""
+        for step in range(self.slots):
+            index = (self._cursor + step) % self.slots
+            if self._refs[index] == 0 and index != self._latest:
+                self._cursor = (index + 1) % self.slots
+                return index
+        return None
+
+    def write(self, data, pts=None, host_time=None, seq=None):
+        """Copy ``data`` (any buffer-protocol object) into the next free slot.
+
+        ``pts`` and ``host_time`` are stored alongside the frame and handed
+        back by ``acquire``.  ``seq`` keeps a sequence number assigned
+        upstream (e.g. by the camera service) instead of the next one.
+
+        Returns the sequence number of the stored frame, or None when every
+        slot is borrowed and the frame had to be dropped.
+        """
+        with self._lock:
+            if seq is None:
+                seq = self.next_seq
+            self.next_seq = seq + 1
+            index = self._claim_slot()
+            if index is None:
+                self.dropped += 1
+                return None
+            # Invalidate the slot while it is being overwritten
+            self._seq[index] = -1
+            self._refs[index] = 1
+
+        source = numpy.frombuffer(data, dtype=self.dtype, count=self._frames[index].size)
+        numpy.copyto(self._frames[index].reshape(-1), source)
+
+        with self._lock:
+            self._seq[index] = seq
+            self._pts[index] = pts
+            self._times[index] = host_time
+            self._refs[index] = 0
+            self._latest = index
+        return seq
+
+    def acquire(self, seq=None):
+        """Borrow the latest frame, or frame ``seq`` if it is still in the ring.
+
+        Returns a ``Frame`` whose ``image`` is a view on the slot, or None.
+        The slot is not reused until the frame is passed to ``release``.
+        """
+        with self._lock:
+            if seq is None:
+                index = self._latest
+            else:
+                index = next(
+                    (i for i in range(self.slots) if self._seq[i] == seq), -1
+                )
+            if index < 0 or self._seq[index] < 0:
+                return None
+            self._refs[index] += 1
+            return Frame(
+                self._seq[index], self._pts[index], self._times[index],
+                index, self._frames[index],
+            )
+
+    def release(self, frame):
+        """Hand a borrowed frame back to the ring."""
+        with self._lock:
+            if self._refs[frame.slot] > 0:
+                self._refs[frame.slot] -= 1
+
+    def latest_seq(self):
+        with self._lock:
+            return self._seq[self._latest] if self._latest >= 0 else -1
+
+    def in_use(self):
+        """Number of slots currently borrowed by consumers."""
+        with self._lock:
+            return sum(1 for r in self._refs if r > 0)
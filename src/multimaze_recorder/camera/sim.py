@@ -0,0 +1,376 @@
+"""Simulated TIS camera for running the recorders without tiscamera or a rig.
+
+``SimulatedTIS`` has the surface of ``camera.tis.TIS`` that the recorders use
+(``open_device``, ``start_pipeline``, ``snap_image``, ``set_image_callback``,
+the ring buffer and properties).  A producer thread delivers frames at the
+preset frame rate from one of these sources (``MMRECORDER_SIM_SOURCE``):
+
+    pattern        synthetic multimaze arenas with moving flies (default)
+    videotestsrc   GStreamer's test pattern (needs PyGObject, not tiscamera)
+    <folder>       the images of a recorded folder, replayed in a loop
+
+With the ``TriggerMode`` property "On" frames are only produced by
+``trigger()``; ``SoftwareTrigger`` calls it at a fixed rate and speaks the
+``TriggerLink`` interface in place of the Arduino.
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from fractions import Fraction
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from multimaze_recorder.camera.ring import FrameRing
+from multimaze_recorder.recording.trigger_link import (
+    DONE,
+    DURATION_ACK,
+    FPS_ACK,
+    PULSES,
+    READY,
+    Message,
+)
+
+SIM_SOURCE = os.environ.get("MMRECORDER_SIM_SOURCE", "pattern")
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+APPSINK_BUFFERS = 5
+
+
+class PatternSource:
+    """Grid of arenas on a textured background with one fly moving in each."""
+
+    def __init__(self, width, height, rows=3, columns=3):
+        rng = np.random.default_rng(0)
+        background = rng.normal(60, 6, (height, width)).clip(0, 255).astype(np.uint8)
+        self.arenas = []
+        cell_w, cell_h = width // columns, height // rows
+        for row in range(rows):
+            for column in range(columns):
+                x0, y0 = column * cell_w + cell_w // 8, row * cell_h + cell_h // 8
+                x1, y1 = x0 + cell_w * 3 // 4, y0 + cell_h * 3 // 4
+                cv2.rectangle(background, (x0, y0), (x1, y1), 170, -1)
+                cv2.rectangle(background, (x0, y0), (x1, y1), 30, 3)
+                self.arenas.append((x0, y0, x1, y1, rng.uniform(0, 2 * np.pi)))
+        self.background = background
+        self.radius = max(2, min(cell_w, cell_h) // 40)
+        self.index = 0
+
+    def next_frame(self):
+        frame = self.background.copy()
+        t = self.index / 30
+        for x0, y0, x1, y1, phase in self.arenas:
+            x = x0 + (x1 - x0) * (0.5 + 0.4 * np.sin(t + phase))
+            y = y0 + (y1 - y0) * (0.5 + 0.4 * np.cos(0.7 * t + phase))
+            cv2.circle(frame, (int(x), int(y)), self.radius, 20, -1)
+        self.index += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+class ReplaySource:
+    """Images of a recorded folder in frame order, looping at the end."""
+
+    def __init__(self, folder, width, height):
+        self.paths = sorted(
+            (p for p in Path(folder).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES),
+            key=lambda p: [int(n) for n in re.findall(r"\d+", p.stem)] or [0],
+        )
+        if not self.paths:
+            raise FileNotFoundError(f"No images to replay in {folder}")
+        self.size = (width, height)
+        self.index = 0
+
+    def next_frame(self):
+        path = self.paths[self.index % len(self.paths)]
+        self.index += 1
+        frame = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if frame is None:
+            raise RuntimeError(f"Could not read {path}")
+        if frame.shape[::-1] != self.size:
+            frame = cv2.resize(frame, self.size)
+        return frame
+
+    def close(self):
+        pass
+
+
+class VideoTestSource:
+    """Frames pulled from a non-live ``videotestsrc`` pipeline."""
+
+    def __init__(self, width, height, pattern="ball"):
+        import gi
+
+        gi.require_version("Gst", "1.0")
+        from gi.repository import Gst
+
+        if not Gst.is_initialized():
+            Gst.init(None)
+        self.Gst = Gst
+        self.pipeline = Gst.parse_launch(
+            f"videotestsrc pattern={pattern} ! "
+            f"video/x-raw,format=GRAY8,width={width},height={height} ! "
+            "appsink name=sink max-buffers=2 sync=false"
+        )
+        self.appsink = self.pipeline.get_by_name("sink")
+        self.shape = (height, width)
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def next_frame(self):
+        sample = self.appsink.emit("pull-sample")
+        if sample is None:
+            raise RuntimeError("videotestsrc stopped producing frames")
+        buf = sample.get_buffer()
+        data = buf.extract_dup(0, buf.get_size())
+        # GStreamer pads rows to four bytes
+        stride = len(data) // self.shape[0]
+        return np.frombuffer(data, np.uint8).reshape(self.shape[0], stride)[:, : self.shape[1]]
+
+    def close(self):
+        self.pipeline.set_state(self.Gst.State.NULL)
+
+
+def make_source(source, width, height):
+    """Frame source for a ``MMRECORDER_SIM_SOURCE`` value."""
+    if source == "pattern":
+        return PatternSource(width, height)
+    if source == "videotestsrc":
+        return VideoTestSource(width, height)
+    if Path(source).is_dir():
+        return ReplaySource(source, width, height)
+    raise ValueError(f"Unknown simulated camera source: {source}")
+
+
+class SimulatedTIS:
+    "Software stand-in for The Imaging Source Camera"
+
+    def __init__(self, properties, source=SIM_SOURCE):
+        self.source_name = source
+        self.serialnumber = ""
+        self.height = 0
+        self.width = 0
+        self.framerate = "15/1"
+        self.img_mat = None
+        self.ImageCallback = None
+        self.ImageCallbackData = ()
+        self.properties = properties
+        self.values = {"TriggerMode": "Off"}
+        self.ring_slots = 0
+        self.ring = None
+        self.frame_seq = None
+        self.frames_produced = 0
+        self._source = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._samples = deque(maxlen=APPSINK_BUFFERS)
+        self._sample_ready = threading.Condition()
+        self._triggers = queue.Queue()
+
+    def open_device(
+        self, serial, width, height, framerate, sinkformat, showvideo, conversion=""
+    ):
+        if getattr(sinkformat, "value", sinkformat) != "GRAY8":
+            raise ValueError("The simulated camera only produces GRAY8 frames")
+        self.serialnumber = serial or "simulated"
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self._source = make_source(self.source_name, width, height)
+
+    def enable_ring_buffer(self, slots):
+        self.ring_slots = slots
+        self.ring = None
+
+    def enable_native_recording(self, branch, preview_rate=5):
+        raise RuntimeError("Native recording needs the GStreamer pipeline of a real camera")
+
+    def start_pipeline(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._produce, name="sim-camera", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop_pipeline(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._source is not None:
+            self._source.close()
+
+    def trigger(self, when=None):
+        """Simulate a pulse on the trigger input at monotonic time ``when`` (now)."""
+        self._triggers.put(time.monotonic() if when is None else when)
+
+    @property
+    def triggered(self):
+        return self.values.get("TriggerMode") == "On"
+
+    def _produce(self):
+        # Like the camera clock, pts follows the exposure (the trigger pulse or
+        # the frame period), not the time Python gets around to the frame.
+        # It is in time.monotonic() nanoseconds, so latencies can be measured
+        period = 1 / float(Fraction(self.framerate))
+        exposure = time.monotonic()
+        while not self._stop.is_set():
+            if self.triggered:
+                try:
+                    exposure = self._triggers.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            else:
+                exposure += period
+                if self._stop.wait(max(0.0, exposure - time.monotonic())):
+                    break
+                if self.triggered:
+                    # Trigger mode was switched on during the frame period
+                    continue
+            image = self._source.next_frame()
+            self.frames_produced += 1
+            self._deliver(
+                np.ascontiguousarray(image), int(exposure * 1e9), time.monotonic()
+            )
+
+    def _deliver(self, image, pts, host_time):
+        if self.ImageCallback is None:
+            # Like an appsink with drop=true: the oldest samples are discarded
+            with self._sample_ready:
+                self._samples.append((image, pts, host_time))
+                self._sample_ready.notify()
+            return
+        if self.ring_slots:
+            if self._store_in_ring(image, pts, host_time) is None:
+                return
+        else:
+            self.img_mat = image[..., np.newaxis]
+        self.ImageCallback(self, *self.ImageCallbackData)
+
+    def _store_in_ring(self, image, pts, host_time):
+        shape = image.shape + (1,)
+        if self.ring is None or self.ring.shape != shape:
+            self.ring = FrameRing(self.ring_slots, shape, np.uint8)
+        seq = self.ring.write(image, pts=pts, host_time=host_time)
+        if seq is not None:
+            self.frame_seq = seq
+            frame = self.ring.acquire(seq)
+            if frame is not None:
+                self.img_mat = frame.image
+                self.ring.release(frame)
+        return seq
+
+    def snap_image(self, timeout, convert_to_mat=True):
+        if self.ImageCallback is not None:
+            print("Snap_image can not be called, if a callback is set.")
+            return None
+        with self._sample_ready:
+            if not self._samples and not self._sample_ready.wait_for(
+                lambda: self._samples, timeout
+            ):
+                return None
+            image, pts, host_time = self._samples.popleft()
+        if self.ring_slots:
+            return self._store_in_ring(image, pts, host_time)
+        if convert_to_mat:
+            self.img_mat = image[..., np.newaxis]
+        return image.tobytes()
+
+    def get_frame(self, seq=None):
+        if self.ring is None:
+            return None
+        return self.ring.acquire(seq)
+
+    def release_frame(self, frame):
+        if self.ring is not None and frame is not None:
+            self.ring.release(frame)
+
+    def get_image(self):
+        return self.img_mat
+
+    def set_image_callback(self, function, *data):
+        self.ImageCallback = function
+        self.ImageCallbackData = data
+
+    def get_source(self):
+        return self
+
+    def get_property(self, property_name):
+        if property_name == "tcam-properties-json":
+            return json.dumps(self.values)
+        if property_name not in self.values:
+            raise RuntimeError(f"Failed to get property '{property_name}'")
+        return self.values[property_name]
+
+    def set_property(self, property_name, value):
+        self.values[property_name] = value
+
+    def applyProperties(self):
+        for prop in self.properties:
+            self.set_property(prop["property"], prop["value"])
+
+
+class SoftwareTrigger:
+    """``TriggerLink`` stand-in pulsing a ``SimulatedTIS`` like the Arduino sketch."""
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.messages = []
+        self.pulses = []
+        self.done_time = None
+        self._done = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._say(READY)
+
+    def _say(self, text):
+        message = Message(time.monotonic(), text)
+        self.messages.append(message)
+        return message
+
+    def wait_ready(self, timeout=10):
+        return self.messages[0]
+
+    def start(self, fps, duration, timeout=10):
+        acks = [self._say(f"{FPS_ACK}{fps}"), self._say(f"{DURATION_ACK}{duration}")]
+        self._thread = threading.Thread(
+            target=self._pulse, args=(fps, duration), name="sim-trigger", daemon=True
+        )
+        self._thread.start()
+        return acks
+
+    def _pulse(self, fps, duration):
+        start = time.monotonic()
+        last_report = start
+        count = 0
+        while count < fps * duration and not self._stop.is_set():
+            # Pulses keep the Arduino's timer schedule even if this thread runs late
+            when = start + count / fps
+            if self._stop.wait(max(0.0, when - time.monotonic())):
+                break
+            self.camera.trigger(when)
+            count += 1
+            if time.monotonic() - last_report >= 1:
+                last_report = time.monotonic()
+                self.pulses.append((self._say(f"{PULSES}{count}").time, count))
+        self.pulses.append((self._say(f"{PULSES}{count}").time, count))
+        self.done_time = self._say(DONE).time
+        self._done.set()
+
+    def wait_done(self, timeout=None):
+        self._done.wait(timeout)
+        return self.done_time
+
+    @property
+    def pulse_count(self):
+        return self.pulses[-1][1] if self.pulses else None
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
@@ -13,6 +13,9 @@ os.environ['GST_DEBUG'] = '3'
 
 from gi.repository import GLib, Gst, Tcam
 
+from multimaze_recorder.camera.ring import FrameRing
+from multimaze_recorder.recording.native import pipeline_description
+
 
 DeviceInfo = namedtuple("DeviceInfo", "status name identifier connection_type")
 CameraProperty = namedtuple(
@@ -47,6 +50,13 @@ class TIS:
         self.source = None
         self.appsink = None
         self.properties = properties
+        self.ring_slots = 0
+        self.ring = None
+        self.frame_seq = None
+        self.record_branch = None
+        self.preview_rate = None
+        self.native_recording = False
+        self.native_finished = True
 
     def open_device(
         self,
@@ -71,15 +81,9 @@ class TIS:
         self.pipeline.get_state(40000000)
 
     def _create_pipeline(self, conversion: str, showvideo: bool):
-        if conversion and not conversion.strip().endswith("!"):
-            conversion += " !"
-        p = "tcambin name=source ! capsfilter name=caps"
-        if showvideo:
-             p += " ! tee name=t"
-             p += " t. ! queue ! videoconvert ! ximagesink"
-             p += f" t. ! queue ! {conversion} appsink name=sink"
-        else:
-            p += f" ! queue ! {conversion} appsink name=sink"
+        p = pipeline_description(
+            conversion, showvideo, self.record_branch, self.preview_rate
+        )
 
         print(p)
         try:
@@ -100,14 +104,114 @@ class TIS:
 
     def __on_new_buffer(self, appsink):
         sample = appsink.get_property("last-sample")
-        if sample and self.ImageCallback is not None:
+        if not sample:
+            return Gst.FlowReturn.OK
+        if self.ring_slots and (self.ImageCallback is not None or self.record_branch):
+            # With a record branch only sampled preview frames get here
+            if self.__store_in_ring(sample) is None:
+                return Gst.FlowReturn.OK
+        elif self.ImageCallback is not None:
             buf = sample.get_buffer()
             data = buf.extract_dup(0, buf.get_size())
             caps = sample.get_caps()
             self.img_mat = self.__convert_to_numpy(data, caps)
+        if self.ImageCallback is not None:
             self.ImageCallback(self, *self.ImageCallbackData)
         return Gst.FlowReturn.OK
 
+    def enable_ring_buffer(self, slots):
+        """Copy frames once into a preallocated ring of ``slots`` frames.
+
+        In this mode ``snap_image`` returns the frame sequence number instead
+        of a bytes copy, and consumers borrow frames with ``get_frame`` and
+        hand them back with ``release_frame``.  Pass 0 to disable.
+        """
+        self.ring_slots = slots
+        self.ring = None
+
+    def enable_native_recording(self, branch, preview_rate=5):
+        """Record every frame with the GStreamer elements of ``branch``.
+
+        Must be called before ``open_device``; ``branch`` comes from
+        ``recording.native.record_branch``.  The appsink then only receives
+        ``preview_rate`` frames per second.
+        """
+        self.record_branch = branch
+        self.preview_rate = preview_rate
+
+    def start_native_recording(self, location):
+        """Point the record branch at ``location`` and let frames through."""
+        self.pipeline.get_by_name("record_sink").set_property("location", location)
+        self.pipeline.get_by_name("record_valve").set_property("drop", False)
+        self.native_recording = True
+
+    def native_stats(self):
+        """Frames waiting in the record branch, and JPEGs written so far."""
+        stats = {
+            "queued": self.pipeline.get_by_name("record_queue").get_property(
+                "current-level-buffers"
+            )
+        }
+        sink = self.pipeline.get_by_name("record_sink")
+        if sink.find_property("index") is not None:
+            stats["written"] = sink.get_property("index")
+        return stats
+
+    def stop_native_recording(self, timeout=30):
+        """Drain the record branch and finalize its files with an EOS.
+
+        Returns False if the pipeline did not reach EOS within ``timeout``
+        seconds, also on later calls.
+        """
+        if not self.native_recording:
+            return self.native_finished
+        self.native_recording = False
+        self.pipeline.send_event(Gst.Event.new_eos())
+        message = self.pipeline.get_bus().timed_pop_filtered(
+            timeout * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR
+        )
+        self.native_finished = (
+            message is not None and message.type != Gst.MessageType.ERROR
+        )
+        if not self.native_finished:
+            print("Error finishing native recording: {0}".format(message))
+        return self.native_finished
+
+    def __store_in_ring(self, sample):
+        caps = sample.get_caps()
+        dtype, shape = _caps_layout(caps)
+        if self.ring is None or self.ring.shape != shape or self.ring.dtype != dtype:
+            self.ring = FrameRing(self.ring_slots, shape, dtype)
+
+        host_time = time.monotonic()
+        buf = sample.get_buffer()
+        ok, mapinfo = buf.map(Gst.MapFlags.READ)
+        if not ok:
+            return None
+        try:
+            seq = self.ring.write(mapinfo.data, pts=buf.pts, host_time=host_time)
+        finally:
+            buf.unmap(mapinfo)
+
+        if seq is not None:
+            self.frame_seq = seq
+            frame = self.ring.acquire(seq)
+            if frame is not None:
+                # Unborrowed view for get_image(); may be recycled later on
+                self.img_mat = frame.image
+                self.ring.release(frame)
+        return seq
+
+    def get_frame(self, seq=None):
+        """Borrow the latest ring frame (or frame ``seq``); see ``FrameRing.acquire``."""
+        if self.ring is None:
+            return None
+        return self.ring.acquire(seq)
+
+    def release_frame(self, frame):
+        if self.ring is not None and frame is not None:
+            self.ring.release(frame)
+
     def set_sink_format(self, sf: SinkFormats):
         self.sinkformat = sf
 
@@ -132,24 +236,8 @@ class TIS:
         return True
 
     def __convert_to_numpy(self, data, caps):
-        s = caps.get_structure(0)
-        fmt = s.get_value("format")
-
-        if fmt == "BGRx":
-            dtype = numpy.uint8
-            bpp = 4
-        elif fmt == "GRAY8":
-            dtype = numpy.uint8
-            bpp = 1
-        elif fmt == "GRAY16_LE":
-            dtype = numpy.uint16
-            bpp = 1
-        else:
-            raise RuntimeError(f"Unknown format in conversion to numpy array: {fmt}")
-
-        img_mat = numpy.ndarray(
-            (s.get_value("height"), s.get_value("width"), bpp), buffer=data, dtype=dtype
-        )
+        dtype, shape = _caps_layout(caps)
+        img_mat = numpy.ndarray(shape, buffer=data, dtype=dtype)
         return img_mat
 
     def snap_image(self, timeout, convert_to_mat=True):
@@ -158,6 +246,11 @@ class TIS:
             return None
 
         sample = self.appsink.emit("try-pull-sample", timeout * Gst.SECOND)
+        if self.ring_slots:
+            if sample is None:
+                return None
+            return self.__store_in_ring(sample)
+
         buf = sample.get_buffer()
         data = buf.extract_dup(0, buf.get_size())
         if convert_to_mat and sample is not None:
@@ -172,6 +265,7 @@ class TIS:
         return self.img_mat
 
     def stop_pipeline(self):
+        self.stop_native_recording()
         self.pipeline.set_state(Gst.State.NULL)
         self.pipeline.get_state(5000000000)
 
@@ -358,6 +452,26 @@ class TIS:
                 print(error)
 
 
+def _caps_layout(caps):
+    """Return the numpy dtype and (height, width, channels) shape described by caps."""
+    s = caps.get_structure(0)
+    fmt = s.get_value("format")
+
+    if fmt == "BGRx":
+        dtype = numpy.uint8
+        bpp = 4
+    elif fmt == "GRAY8":
+        dtype = numpy.uint8
+        bpp = 1
+    elif fmt == "GRAY16_LE":
+        dtype = numpy.uint16
+        bpp = 1
+    else:
+        raise RuntimeError(f"Unknown format in conversion to numpy array: {fmt}")
+
+    return numpy.dtype(dtype), (s.get_value("height"), s.get_value("width"), bpp)
+
+
 class ResDesc:
     def __init__(self, width: int, height: int, fps: list):
         self.width = width
@@ -3,6 +3,15 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 
 from multimaze_recorder.gui.widgets import CustomTableWidget, Metadata
+from multimaze_recorder.recording.broker import BrokerClient, broker_available
+from multimaze_recorder.recording.planner import (
+    PREFLIGHT,
+    format_plan,
+    grab_frames,
+    plan_recording,
+)
+from multimaze_recorder.recording.sinks import native_branch
+from multimaze_recorder.recording.watchdog import format_health, read_health
 
 import sys
 import time
@@ -20,6 +29,45 @@ class ExperimentWindowSignals(QObject):
     folder_created = pyqtSignal()
 
 
+class PreflightWorker(QThread):
+    """Run the disk preflight of a recording off the GUI thread.
+
+    Grabbing calibration frames and the write test take seconds; the plan
+    comes back through ``planned``, or the error message through ``failed``.
+    """
+
+    planned = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, camera_settings, fps, duration, local_path):
+        super().__init__()
+        self.camera_settings = camera_settings
+        self.fps = fps
+        self.duration = duration
+        self.local_path = local_path
+
+    def run(self):
+        try:
+            with open(self.camera_settings) as f:
+                camera_configs = json.load(f)
+            frames = None
+            if broker_available():
+                # Calibrate on real frames from the live camera
+                client = BrokerClient()
+                try:
+                    frames = grab_frames(client, 5)
+                finally:
+                    client.stop_pipeline()
+            plan = plan_recording(
+                self.camera_settings, camera_configs, self.fps, self.duration,
+                self.local_path, frames,
+            )
+        except Exception as error:
+            self.failed.emit(str(error))
+            return
+        self.planned.emit(plan)
+
+
 class ExperimentWindow(QWidget):
     def __init__(self, tab_widget, main_window, *args, **kwargs):
         super(ExperimentWindow, self).__init__(*args, **kwargs)
@@ -91,6 +139,13 @@ class ExperimentWindow(QWidget):
         hbox_record.addWidget(self.HardwareTrigger_checkbox)
         layout.addLayout(hbox_record)
 
+        self.health_label = QLabel()
+        self.health_label.setWordWrap(True)
+        self.health_label.hide()
+        layout.addWidget(self.health_label)
+        self.health_timer = QTimer(self)
+        self.health_timer.timeout.connect(self.update_health)
+
         hbox_style = QHBoxLayout()
         hbox_style.addWidget(QLabel("Metadata:"))
         hbox_style.addWidget(self.template_selector)
@@ -110,6 +165,7 @@ class ExperimentWindow(QWidget):
         self.setLayout(layout)
 
         self.recording_thread = None
+        self.recording_folder = None
         self.folder_path = None
         self.folder_open = False
         self.update_path_info()
@@ -199,6 +255,12 @@ class ExperimentWindow(QWidget):
         fps = self.fps_spinbox.value()
         camera_settings = str(self.main_window.settings.camera_settings)
 
+        if self.main_window.local and PREFLIGHT != "off":
+            self._start_preflight(camera_settings, fps, duration)
+            return
+        self.start_recording(camera_settings, fps, duration)
+
+    def start_recording(self, camera_settings, fps, duration):
         if not self.folder_open:
             self.create_data_folder()
             if not self.folder_path:
@@ -212,7 +274,9 @@ class ExperimentWindow(QWidget):
         np.save(self.folder_path / "fps.npy", fps)
         np.save(self.folder_path / "duration.npy", duration)
 
-        self.stop_live_stream()
+        shares_camera = self._shares_camera(camera_settings)
+        if not shares_camera:
+            self.stop_live_stream()
         self.record_button.setEnabled(False)
         self.duration_spinbox.setEnabled(False)
         self.fps_spinbox.setEnabled(False)
@@ -226,9 +290,17 @@ class ExperimentWindow(QWidget):
         if self.main_window.local:
             self.recording_thread = threading.Thread(
                 target=self.record_images,
-                args=(self._recording_module, folder, fps, duration, camera_settings),
+                args=(
+                    self._recording_module, folder, fps, duration, camera_settings,
+                    not shares_camera,
+                ),
             )
             self.recording_thread.start()
+            self.recording_folder = self.main_window.settings.local_path / folder
+            self.health_label.setText("Waiting for the recording to start")
+            self.health_label.setStyleSheet("")
+            self.health_label.show()
+            self.health_timer.start(1000)
         else:
             QMessageBox.information(
                 self,
@@ -236,16 +308,77 @@ class ExperimentWindow(QWidget):
                 "Experiment recording is only possible on the Maze recorder workstation",
             )
 
-    def record_images(self, module, folder, fps, duration, camera_settings):
+    def _start_preflight(self, camera_settings, fps, duration):
+        """Check in the background that the recording disk can absorb the recording.
+
+        The recording starts once the check passes, or the user accepts its
+        warning.
+        """
+        self.record_button.setEnabled(False)
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        worker = PreflightWorker(
+            camera_settings, fps, duration, self.main_window.settings.local_path
+        )
+        worker.planned.connect(
+            lambda plan: self._on_preflight_done(plan, camera_settings, fps, duration)
+        )
+        worker.failed.connect(self._on_preflight_failed)
+        # The previous worker may still be returning from run() after its signal
+        previous = getattr(self, "_preflight_worker", None)
+        if previous is not None:
+            previous.wait()
+        self._preflight_worker = worker
+        worker.start()
+
+    def _end_preflight(self):
+        QApplication.restoreOverrideCursor()
+        self.record_button.setEnabled(True)
+
+    def _on_preflight_failed(self, error):
+        self._end_preflight()
+        QMessageBox.critical(self, "Recording disk", f"The preflight check failed: {error}")
+
+    def _on_preflight_done(self, plan, camera_settings, fps, duration):
+        self._end_preflight()
+        if self._preflight_ok(plan):
+            self.start_recording(camera_settings, fps, duration)
+
+    def _preflight_ok(self, plan):
+        """Show the preflight result of a recording.
+
+        Returns False if the disk cannot absorb it, or if the user cancels
+        after a warning.
+        """
+        text = format_plan(plan)
+        print(text)
+        if plan.level == "block" and PREFLIGHT == "block":
+            QMessageBox.critical(self, "Recording disk", text)
+            return False
+        if plan.level != "ok":
+            answer = QMessageBox.warning(
+                self,
+                "Recording disk",
+                text + "\n\nRecord anyway?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            )
+            return answer == QMessageBox.StandardButton.Yes
+        return True
+
+    def record_images(
+        self, module, folder, fps, duration, camera_settings, restart_live_stream=True
+    ):
         env = os.environ.copy()
         env["MMRECORDER_LOCAL_PATH"] = str(self.main_window.settings.local_path)
         env["QT_LOGGING_RULES"] = "*.warning=false"
+        # The disk was checked before the button click was accepted
+        env["MMRECORDER_PREFLIGHT"] = "off"
         subprocess.run(
             [sys.executable, "-m", module, folder, str(fps), str(duration), camera_settings],
             env=env,
         )
-        time.sleep(1)
-        self.start_live_stream()
+        if restart_live_stream:
+            time.sleep(1)
+            self.start_live_stream()
         self.record_button.setEnabled(True)
         self.duration_spinbox.setEnabled(True)
         self.fps_spinbox.setEnabled(True)
@@ -254,21 +387,80 @@ class ExperimentWindow(QWidget):
         self.experiment_type_selector.setDisabled(False)
         self.template_selector.setDisabled(False)
 
+    def update_health(self):
+        """Show the recorder's latest health.jsonl line; red while alarms are active."""
+        health = read_health(self.recording_folder)
+        if health is not None:
+            text = format_health(health)
+            if health["alarms"]:
+                text += "\n" + "\n".join(health["alarms"])
+                self.health_label.setStyleSheet("QLabel { color: #ff5555; font-weight: bold; }")
+            else:
+                self.health_label.setStyleSheet("")
+            self.health_label.setText(text)
+        if not (self.recording_thread and self.recording_thread.is_alive()):
+            self.health_timer.stop()
+
     def on_stop_button_clicked(self):
         if self.recording_thread and self.recording_thread.is_alive():
             # Thread cannot be directly terminated; best effort via process kill
             print("Stop requested – recording will finish current frame cycle")
 
+    def _shares_camera(self, camera_settings):
+        """True if the recorder can attach to the camera service.
+
+        Native record formats build their own pipeline and need the camera
+        to themselves.
+        """
+        if not broker_available():
+            return False
+        with open(camera_settings) as f:
+            return native_branch(json.load(f)) is None
+
     def start_live_stream(self):
         if self.main_window.local:
             env = os.environ.copy()
             env["MMRECORDER_PRESETS"] = str(self.main_window.settings.camera_settings)
-            self.live_stream_process = subprocess.Popen(
-                [sys.executable, "-m", "multimaze_recorder.scripts.livestream"],
+            if broker_available():
+                self._launch_live_stream(env)
+                return
+            self.camera_service_process = subprocess.Popen(
+                [sys.executable, "-m", "multimaze_recorder.scripts.camera_service"],
                 env=env,
             )
+            # Waiting for the service on the Qt thread would freeze the window
+            threading.Thread(
+                target=self._launch_live_stream,
+                args=(env, self.camera_service_process),
+                daemon=True,
+            ).start()
+
+    def _launch_live_stream(self, env, service=None):
+        """Start the live stream, once ``service`` accepts clients (15 s at most)."""
+        if service is not None:
+            deadline = time.monotonic() + 15
+            while not broker_available() and time.monotonic() < deadline:
+                if service.poll() is not None:
+                    break
+                time.sleep(0.2)
+            if getattr(self, "camera_service_process", None) is not service:
+                # The live stream was stopped in the meantime
+                return
+        self.live_stream_process = subprocess.Popen(
+            [sys.executable, "-m", "multimaze_recorder.scripts.livestream"],
+            env=env,
+        )
 
     def stop_live_stream(self):
+        if hasattr(self, "camera_service_process"):
+            service = self.camera_service_process
+            del self.camera_service_process
+            service.terminate()
+            try:
+                service.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                service.kill()
+                service.wait()
         if hasattr(self, "live_stream_process"):
             self.live_stream_process.terminate()
 
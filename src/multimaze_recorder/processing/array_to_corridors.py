@@ -1,26 +1,34 @@
 from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import cv2
-import re
-from tqdm import tqdm
 import numpy as np
 from scipy import signal
 import matplotlib.pyplot as plt
-import shutil
 from itertools import repeat
 import subprocess
 import sys
 import os
-from joblib import Parallel, delayed
 import gc
 import multiprocessing as mp
 
+from multimaze_recorder.processing import crop_engine
+from multimaze_recorder.processing.crop_engine import load_regions
+from multimaze_recorder.processing.crop_plan import (
+    corridor_plan,
+    orient,
+    rotation_from_folder_name,
+)
+from multimaze_recorder.processing.frames import list_frames, load_frame
+
 # from multiprocessing import Pool
 # from multiprocessing import set_start_method
 # if __name__ == '__main__':
 #     set_start_method('spawn')
 
 
+# Detected geometry is kept in the plan store and reused while the rig does not move
+STORE_PLANS = True
+
 # Path definitions
 
 datafolder = Path(os.environ.get("MMRECORDER_LOCAL_PATH", Path.home() / "Videos"))
@@ -58,22 +66,16 @@ def check_process(data_folder):
                 print(
                     f"{folder.name} is already processed and its integrity is verified."
                 )
-            elif pending_folder.exists():
-                print(
-                    f"{folder.name} is currently being processed."
-                )
             else:
-                print(f"{folder.name} is not processed. Processing...")
+                if pending_folder.exists():
+                    print(f"{folder.name} was interrupted or is being processed. Resuming...")
+                else:
+                    print(f"{folder.name} is not processed. Processing...")
                 try:
                     process_folder(folder)
                 except Exception as e:
+                    # The frames cropped so far are kept; the next run resumes from them
                     print(f"Error processing {folder.name}: {e}")
-                    print("Cleaning up incomplete processing folder...")
-                    # Clean up any incomplete processing folder
-                    if pending_folder.exists():
-                        import shutil
-                        shutil.rmtree(pending_folder)
-                        print(f"Removed incomplete processing folder: {pending_folder}")
                     raise  # Re-raise the exception to stop execution
 
 
@@ -91,130 +93,8 @@ def modify_corridors(Corridors):
     return Corridors
 
 
-def process_image(image, Corridors, folder, processedfolder):
-    """Process a single image: crop according to corridors and save."""
-    try:
-        # Read and process the image
-        frame = cv2.imread(str(folder / image))
-        if frame is None:
-            print(f"Warning: Could not load image {image}")
-            return
-            
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # Convert the folder name to lowercase
-        folder_name = str(folder).lower()
-
-        # Check if the folder name contains '_flip', 'rotatel' or 'rotater' and rotate the image accordingly
-        if '_flip' in folder_name:
-            frame = cv2.rotate(frame, cv2.ROTATE_180)
-        elif 'rotatel' in folder_name:
-            frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        elif 'rotater' in folder_name:
-            frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-        for j, subset in enumerate(Corridors):
-            for k, corridor in enumerate(subset):
-                # Get the subfolder for this arena and corridor
-                subfolder = processedfolder / f"arena{j+1}" / f"corridor{k+1}"
-
-                # Crop the image
-                x1, y1, x2, y2 = corridor
-                cropped_image = frame[y1:y2, x1:x2]
-
-                # Save the cropped image
-                cropped_image_file = f"{Path(image).stem}_cropped.jpg"
-                cv2.imwrite(str(subfolder / cropped_image_file), cropped_image)
-    
-    except Exception as e:
-        print(f"Error processing {image}: {e}")
-    finally:
-        # Explicitly clean up large variables
-        if 'frame' in locals():
-            del frame
-
-
-def process_image_batch(image_batch, Corridors, folder, processedfolder):
-    """Process a batch of images to reduce overhead."""
-    for image in image_batch:
-        process_image(image, Corridors, folder, processedfolder)
-
-
-def process_folder(in_folder):
-    inputfolder = in_folder
-
-    folder = inputfolder
-
-    # Function to extract numerical value from filename for sorting
-    def extract_number(filename):
-        numbers = re.findall(r'\d+', filename.stem)
-        return int(numbers[0]) if numbers else 0
-
-    # Sort files numerically based on extracted number
-    image_files = sorted(inputfolder.glob('*.[jJ][pP][gG]'), key=extract_number)
-
-    if not image_files:
-        print("No image files found in the folder.")
-        return
-
-    processedfolder = inputfolder.with_name(inputfolder.stem.replace("_Recorded", "_Processing"))
-    processedfolder.mkdir(exist_ok=True)
-
-    # Debugging: Print the last image file to be processed
-    print(f"Last image file to be processed: {image_files[-1]}")
-
-    # Load the last frame
-    frame = cv2.imread(str(image_files[-1]))
-    if frame is None:
-        print(f"Error: Could not load image {image_files[-1]}")
-        return
-
-    # If it's not already, make it grayscale
-    if len(frame.shape) > 2:
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-    # Convert the folder name to lowercase
-    folder_name = str(folder).lower()
-
-    # Check if the folder name contains '_flip', 'rotatel' or 'rotater' and rotate the image accordingly
-    if '_flip' in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_180)
-    elif 'rotatel' in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-    elif 'rotater' in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-    # equalize the histogram to make thresholding easier
-    frame = cv2.equalizeHist(frame)
-
-    # Crop the image to the regions of interest
-
-    X1 = 0
-    X2 = 620
-    X3 = 1450
-    X4 = 2130
-    X5 = 2980
-    X6 = 3590
-
-    Y1 = 0
-    Y2 = 725
-    Y3 = 1140
-    Y4 = 1860
-    Y5 = 2350
-    Y6 = 2995
-
-    regions_of_interest = [
-        (X1, Y1, X2, Y2),
-        (X3, Y1, X4, Y2),
-        (X5, Y1, X6, Y2),
-        (X1, Y3, X2, Y4),
-        (X3, Y3, X4, Y4),
-        (X5, Y3, X6, Y4),
-        (X1, Y5, X2, Y6),
-        (X3, Y5, X4, Y6),
-        (X5, Y5, X6, Y6),
-    ]
-
+def detect_corridors(frame, regions_of_interest, folder):
+    """Corridor boxes of each region in an oriented, equalized frame."""
     # For each subset, find the cols and rows peaks and store the even peaks in a list
     Corridors = []
     for i in range(len(regions_of_interest)):
@@ -269,14 +149,7 @@ def process_folder(in_folder):
         if len(Colpos) < expected_num_peaks or len(Rowpos) < 2:
             error_msg = f"ERROR: Peak detection failed for region {i+1}. Found {len(Colpos)} column peaks and {len(Rowpos)} row peaks, but expected at least {expected_num_peaks} column peaks and 2 row peaks."
             print(error_msg)
-            print(f"Cannot proceed with processing {in_folder.name} - all regions must have valid peak detection.")
-            
-            # Clean up the processing folder if it was created
-            if processedfolder.exists():
-                import shutil
-                shutil.rmtree(processedfolder)
-                print(f"Cleaned up incomplete processing folder: {processedfolder}")
-            
+            print(f"Cannot proceed with processing {folder.name} - all regions must have valid peak detection.")
             raise RuntimeError(error_msg)
 
         subcors = [
@@ -328,13 +201,6 @@ def process_folder(in_folder):
     if len(Corridors) != len(regions_of_interest):
         error_msg = f"ERROR: Expected {len(regions_of_interest)} corridor sets, but only got {len(Corridors)}. Peak detection failed."
         print(error_msg)
-        
-        # Clean up the processing folder
-        if processedfolder.exists():
-            import shutil
-            shutil.rmtree(processedfolder)
-            print(f"Cleaned up incomplete processing folder: {processedfolder}")
-        
         raise RuntimeError(error_msg)
 
     # Verify each corridor set has the expected number of corridors
@@ -343,31 +209,49 @@ def process_folder(in_folder):
         if len(corridor_set) != expected_corridors_per_set:
             error_msg = f"ERROR: Arena {i+1} has {len(corridor_set)} corridors, expected {expected_corridors_per_set}."
             print(error_msg)
-            
-            # Clean up the processing folder
-            if processedfolder.exists():
-                import shutil
-                shutil.rmtree(processedfolder)
-                print(f"Cleaned up incomplete processing folder: {processedfolder}")
-            
             raise RuntimeError(error_msg)
 
     print(f"SUCCESS: All {len(Corridors)} regions detected with {expected_corridors_per_set} corridors each.")
 
+    return Corridors
+
+
+def plan_folder(folder, processedfolder, regions="corridors", plan=None):
+    """Detect the corridors of ``folder`` in its last frame; returns their crop plan.
+
+    ``regions`` names the arena grid in ``regions.json``.  Raises
+    RuntimeError if the corridors cannot be detected in every arena.  A
+    stored ``plan`` skips the detection and is only drawn into ``crop_check.png``.
+    """
+    image_files = list_frames(folder)
+
+    # Debugging: Print the last image file to be processed
+    print(f"Last image file to be processed: {image_files[-1]}")
+
+    # Load the last frame
+    frame = load_frame(folder, image_files[-1])
+    if frame is None:
+        raise RuntimeError(f"Could not load image {image_files[-1]}")
+
+    # If it's not already, make it grayscale
+    if len(frame.shape) > 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        
+    # Rotate the image according to the '_flip', 'rotatel' or 'rotater' in the folder name
+    rotation = rotation_from_folder_name(folder)
+    frame = orient(frame, rotation)
+
+    # equalize the histogram to make thresholding easier
+    frame = cv2.equalizeHist(frame)
+
+    if plan is None:
+        Corridors = detect_corridors(frame, load_regions(regions), folder)
+        plan = corridor_plan(Corridors, rotation)
+
     # Create visualization of all detected corridors
     fig, axs = plt.subplots(9, 6, figsize=(20, 20))
-    for i in range(9):
-        for j in range(6):
-            axs[i, j].axis("off")
-            axs[i, j].imshow(
-                frame[
-                    Corridors[i][j][1] : Corridors[i][j][3],
-                    Corridors[i][j][0] : Corridors[i][j][2],
-                ],
-                cmap="gray",
-                vmin=0,
-                vmax=255,
-            )
+    for k, roi in enumerate(plan.rois[:54]):
+        axs[k // 6, k % 6].imshow(plan.crop(frame, roi), cmap="gray", vmin=0, vmax=255)
 
     # Remove the axis of each subplot and draw them closer together
     for ax in axs.flat:
@@ -379,48 +263,11 @@ def process_folder(in_folder):
     )
     plt.close()  # Close the figure to free memory
 
-    # Get a list of all image files in the input folder
-    images = [f.name for f in folder.glob("*.[jJ][pP][gG]") if f.is_file()]
-
-    # Sort the list of images by their number (fix the regex syntax)
-    images.sort(key=lambda f: int(re.sub(r"\D", "", f)))
-
-    # Create the subfolders for each arena and corridor
-    for j, subset in enumerate(Corridors):
-        for k, corridor in enumerate(subset):
-            subfolder = processedfolder / f"arena{j+1}" / f"corridor{k+1}"
-            subfolder.mkdir(parents=True, exist_ok=True)
+    return plan
 
-    # Check if standard input is connected to a terminal
-    is_tty = os.isatty(sys.stdin.fileno())
 
-    print(f"Processing {len(images)} images...")
-
-    # Process images in batches to reduce memory usage and overhead
-    batch_size = max(1, len(images) // (mp.cpu_count() * 4))  # Adaptive batch size
-    image_batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
-    
-    # Prepare the arguments for the process_image_batch function
-    args = [(batch, Corridors, folder, processedfolder) for batch in image_batches]
-
-    # Use threading backend for better resource management
-    try:
-        with Parallel(n_jobs=-1, backend='threading', batch_size=1) as parallel:
-            results = parallel(delayed(process_image_batch)(*arg) for arg in tqdm(args, disable=not is_tty))
-    except Exception as e:
-        print(f"Error during parallel processing: {e}")
-        print("Falling back to sequential processing...")
-        # Fallback to sequential processing
-        for batch in tqdm(image_batches, disable=not is_tty):
-            process_image_batch(batch, Corridors, folder, processedfolder)
-    
-    # Force garbage collection to clean up any remaining resources
-    gc.collect()
-            
-    # rename the processed folder from _processing to _Cropped
-    croppedfolder = processedfolder.with_name(processedfolder.stem.replace("_Processing", "_Cropped"))
-    processedfolder.rename(croppedfolder)
-    print(f"Processing of {in_folder.name} finished! Folder renamed to {croppedfolder.name}")
+def process_folder(in_folder, regions="corridors"):
+    crop_engine.process_folder(in_folder, ["corridors"], regions={"corridors": regions})
 
 
 def main():
@@ -1,8 +1,6 @@
 from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import cv2
-import re
-from tqdm import tqdm
 import numpy as np
 from scipy import signal
 import matplotlib.pyplot as plt
@@ -13,37 +11,17 @@ import sys
 import os
 import json
 import argparse
-from joblib import Parallel, delayed
 import gc
 import multiprocessing as mp
 
+from multimaze_recorder.processing import crop_engine
+from multimaze_recorder.processing.crop_engine import CropOutput, crop_folder, load_regions
+from multimaze_recorder.processing.crop_plan import f1_plan, rotation_from_folder_name
+from multimaze_recorder.processing.frames import list_frames, load_frame
+
 # Path definitions
 datafolder = Path(os.environ.get("MMRECORDER_LOCAL_PATH", Path.home() / "Videos"))
 
-# Arena coordinate definitions (used by both test and processing functions)
-ARENA_COORDS = {
-    'X1': 60, 'X2': 620,
-    'X3': 1560, 'X4': 2110, 
-    'X5': 3055, 'X6': 3600,
-    'Y1': 30, 'Y2': 600,
-    'Y3': 1200, 'Y4': 1770,
-    'Y5': 2370, 'Y6': 2920
-}
-
-# Generate regions of interest from coordinates
-REGIONS_OF_INTEREST = [
-    (ARENA_COORDS['X1'], ARENA_COORDS['Y1'], ARENA_COORDS['X2'], ARENA_COORDS['Y2']),  # Arena 1
-    (ARENA_COORDS['X3'], ARENA_COORDS['Y1'], ARENA_COORDS['X4'], ARENA_COORDS['Y2']),  # Arena 2  
-    (ARENA_COORDS['X5'], ARENA_COORDS['Y1'], ARENA_COORDS['X6'], ARENA_COORDS['Y2']),  # Arena 3
-    (ARENA_COORDS['X1'], ARENA_COORDS['Y3'], ARENA_COORDS['X2'], ARENA_COORDS['Y4']),  # Arena 4
-    (ARENA_COORDS['X3'], ARENA_COORDS['Y3'], ARENA_COORDS['X4'], ARENA_COORDS['Y4']),  # Arena 5
-    (ARENA_COORDS['X5'], ARENA_COORDS['Y3'], ARENA_COORDS['X6'], ARENA_COORDS['Y4']),  # Arena 6
-    (ARENA_COORDS['X1'], ARENA_COORDS['Y5'], ARENA_COORDS['X2'], ARENA_COORDS['Y6']),  # Arena 7
-    (ARENA_COORDS['X3'], ARENA_COORDS['Y5'], ARENA_COORDS['X4'], ARENA_COORDS['Y6']),  # Arena 8
-    (ARENA_COORDS['X5'], ARENA_COORDS['Y5'], ARENA_COORDS['X6'], ARENA_COORDS['Y6']),  # Arena 9
-]
-
-
 def test_process_folder(folder_path, num_images=5):
     """Test processing on a specific folder with a limited number of images."""
     folder = Path(folder_path)
@@ -69,126 +47,19 @@ def test_process_folder(folder_path, num_images=5):
     
     test_processedfolder.mkdir(exist_ok=True)
 
-    # Load the first frame for arena detection
-    first_image = folder / "image0.jpg"
-    if not first_image.exists():
-        # Try to find any jpg file
-        jpg_files = list(folder.glob("*.jpg"))
-        if not jpg_files:
-            print(f"Error: No jpg files found in {folder}")
-            return
-        first_image = jpg_files[0]
-    
-    frame = cv2.imread(str(first_image))
-    if frame is None:
-        print(f"Error: Could not load image {first_image}")
+    images = list_frames(folder)
+    if not images:
+        print(f"Error: No frames found in {folder}")
         return
 
-    # If it's not already, make it grayscale
-    if len(frame.shape) > 2:
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-    # Convert the folder name to lowercase
-    folder_name = str(folder).lower()
-
-    # Apply global rotation based on folder name
-    if "_flip" in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_180)
-    elif "rotatel" in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-    elif "rotater" in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-    # Equalize the histogram to make thresholding easier
-    frame = cv2.equalizeHist(frame)
-
-    # Use shared arena coordinates
-    regions_of_interest = REGIONS_OF_INTEREST
-
-    # Get orientation information for each arena
-    orientations = []
-    for i in range(len(regions_of_interest)):
-        orientation = get_orientation_from_metadata(folder, i)
-        orientations.append(orientation)
-        print(f"Arena {i+1} orientation: {orientation}")
-
-    # Create visualization of detected arenas with split preview
-    # 3 rows x 6 columns to match 3x3 physical layout (each arena gets 2 columns: Left, Right)
-    fig, axs = plt.subplots(3, 6, figsize=(30, 15))
-    
-    for i in range(9):
-        # Calculate position in 3x3 grid
-        row = i // 3  # 0, 1, 2
-        col_offset = (i % 3) * 2  # 0, 2, 4 (each arena uses 2 columns)
-        
-        # Process the arena to show left and right splits
-        x1, y1, x2, y2 = regions_of_interest[i]
-        width = x2 - x1
-        height = y2 - y1
-
-        # Adjust the width and height to be multiples of 2
-        if width % 2 != 0:
-            width -= 1
-        if height % 2 != 0:
-            height -= 1
-
-        arena_image = frame[y1 : y1 + height, x1 : x1 + width]
-        
-        # Apply rotation if the orientation is "hz" (horizontal)
-        if orientations[i] == "hz":
-            arena_image = cv2.rotate(arena_image, cv2.ROTATE_90_CLOCKWISE)
-        
-        # Split the arena into left and right halves
-        arena_height, arena_width = arena_image.shape
-        half_width = arena_width // 2
-        
-        # Ensure half_width is even
-        if half_width % 2 != 0:
-            half_width -= 1
-            
-        left_half = arena_image[:, :half_width]
-        right_half = arena_image[:, arena_width - half_width:]
-        
-        # Rotate the right half 180 degrees
-        right_half_rotated = cv2.rotate(right_half, cv2.ROTATE_180)
-        
-        # Show left half
-        axs[row, col_offset].imshow(left_half, cmap="gray", vmin=0, vmax=255)
-        axs[row, col_offset].set_title(f"Arena {i+1} Left ({orientations[i]})")
-        axs[row, col_offset].axis("off")
-        
-        # Show right half (rotated)
-        axs[row, col_offset + 1].imshow(right_half_rotated, cmap="gray", vmin=0, vmax=255)
-        axs[row, col_offset + 1].set_title(f"Arena {i+1} Right")
-        axs[row, col_offset + 1].axis("off")
-
-    plt.tight_layout()
-    plt.savefig(
-        str(test_processedfolder / "test_crop_check.png"), dpi=300, bbox_inches="tight"
-    )
-    plt.close()
-    
+    plan = plan_folder(folder, test_processedfolder, check_name="test_crop_check.png")
     print(f"Arena detection visualization saved to: {test_processedfolder / 'test_crop_check.png'}")
 
-    # Get a list of first few image files
-    images = [f.name for f in folder.glob("*.[jJ][pP][gG]") if f.is_file()]
-    images.sort(key=lambda f: int(re.sub(r"\D", "", f)))
-    
     # Limit to the specified number of images
     test_images = images[:num_images]
     
     print(f"Processing {len(test_images)} test images: {test_images}")
-
-    # Create the subfolders for each arena's left and right tracks
-    for j in range(len(regions_of_interest)):
-        left_subfolder = test_processedfolder / f"arena{j+1}" / "Left"
-        right_subfolder = test_processedfolder / f"arena{j+1}" / "Right"
-        left_subfolder.mkdir(parents=True, exist_ok=True)
-        right_subfolder.mkdir(parents=True, exist_ok=True)
-
-    # Process the test images
-    for image in tqdm(test_images, desc="Processing test images"):
-        process_image(image, regions_of_interest, folder, test_processedfolder, orientations)
+    crop_folder(folder, [CropOutput(plan, test_processedfolder)], test_images)
 
     print(f"Test processing complete!")
     print(f"Results saved in: {test_processedfolder}")
@@ -247,10 +118,11 @@ def check_process(data_folder):
                 print(
                     f"{folder.name} is already processed and its integrity is verified."
                 )
-            elif pending_folder.exists():
-                print(f"{folder.name} is currently being processed.")
             else:
-                print(f"{folder.name} is not processed. Processing...")
+                if pending_folder.exists():
+                    print(f"{folder.name} was interrupted or is being processed. Resuming...")
+                else:
+                    print(f"{folder.name} is not processed. Processing...")
                 process_folder(folder)
 
 
@@ -281,232 +153,57 @@ def get_orientation_from_metadata(folder, arena_index):
         return "std"
 
 
-def process_image(image, regions_of_interest, folder, processedfolder, orientations):
-    """Process a single image: crop arenas and split into left/right halves."""
-    try:
-        # Read and process the image
-        frame = cv2.imread(str(folder / image))
-        if frame is None:
-            print(f"Warning: Could not load image {image}")
-            return
-            
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+def plan_folder(folder, processedfolder, regions="f1_tracks", check_name="crop_check.png"):
+    """Left/Right crop plan of the arenas of ``folder``, drawn into ``check_name``.
 
-        # Convert the folder name to lowercase
-        folder_name = str(folder).lower()
-
-        # Apply global rotation based on folder name
-        if "_flip" in folder_name:
-            frame = cv2.rotate(frame, cv2.ROTATE_180)
-        elif "rotatel" in folder_name:
-            frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        elif "rotater" in folder_name:
-            frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-        # Process each arena
-        for j, region in enumerate(regions_of_interest):
-            # Get the orientation for this arena
-            orientation = orientations[j]
-            
-            # Crop the arena
-            x1, y1, x2, y2 = region
-            width = x2 - x1
-            height = y2 - y1
-
-            # Adjust the width and height to be multiples of 2
-            if width % 2 != 0:
-                width -= 1
-            if height % 2 != 0:
-                height -= 1
-
-            arena_image = frame[y1 : y1 + height, x1 : x1 + width]
-            
-            # Apply rotation if the orientation is "hz" (horizontal)
-            if orientation == "hz":
-                arena_image = cv2.rotate(arena_image, cv2.ROTATE_90_CLOCKWISE)
-            
-            # Split the arena into left and right halves
-            arena_height, arena_width = arena_image.shape
-            half_width = arena_width // 2
-            
-            # Ensure half_width is even
-            if half_width % 2 != 0:
-                half_width -= 1
-                
-            left_half = arena_image[:, :half_width]
-            right_half = arena_image[:, arena_width - half_width:]
-            
-            # Rotate the right half 180 degrees (equivalent to transpose=2,transpose=2 in ffmpeg)
-            right_half_rotated = cv2.rotate(right_half, cv2.ROTATE_180)
-            
-            # Save the cropped and split images
-            image_stem = Path(image).stem
-            
-            # Left half
-            left_subfolder = processedfolder / f"arena{j+1}" / "Left"
-            left_image_file = f"{image_stem}_cropped.jpg"
-            cv2.imwrite(str(left_subfolder / left_image_file), left_half)
-            
-            # Right half (rotated)
-            right_subfolder = processedfolder / f"arena{j+1}" / "Right"
-            right_image_file = f"{image_stem}_cropped.jpg"
-            cv2.imwrite(str(right_subfolder / right_image_file), right_half_rotated)
-    
-    except Exception as e:
-        print(f"Error processing {image}: {e}")
-    finally:
-        # Explicitly clean up large variables
-        if 'frame' in locals():
-            del frame
-        if 'arena_image' in locals():
-            del arena_image
-
-
-def process_image_batch(image_batch, regions_of_interest, folder, processedfolder, orientations):
-    """Process a batch of images to reduce overhead."""
-    for image in image_batch:
-        process_image(image, regions_of_interest, folder, processedfolder, orientations)
-
-
-def process_folder(in_folder):
-    """Process a folder of images, detecting arenas and splitting them into left/right tracks."""
-    inputfolder = in_folder
-    folder = inputfolder
-
-    processedfolder = inputfolder.with_name(
-        inputfolder.stem.replace("_Recorded", "_Processing")
-    )
-
-    # Create the subfolder if it doesn't exist
-    processedfolder.mkdir(exist_ok=True)
+    ``regions`` names the arena grid in ``regions.json``; the orientation of
+    each arena comes from the folder's metadata.json.
+    """
+    images = list_frames(folder)
 
     # Load the first frame for arena detection
-    frame = cv2.imread(inputfolder.joinpath("image0.jpg").as_posix())
+    frame = load_frame(folder, images[0])
+    if frame is None:
+        raise RuntimeError(f"Could not load image {images[0]}")
 
     # If it's not already, make it grayscale
     if len(frame.shape) > 2:
         frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    # Convert the folder name to lowercase
-    folder_name = str(folder).lower()
-
-    # Apply global rotation based on folder name
-    if "_flip" in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_180)
-    elif "rotatel" in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-    elif "rotater" in folder_name:
-        frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-    # Equalize the histogram to make thresholding easier
-    frame = cv2.equalizeHist(frame)
-
-    # Use shared arena coordinates
-    regions_of_interest = REGIONS_OF_INTEREST
+    regions_of_interest = load_regions(regions)
 
     # Get orientation information for each arena
     orientations = []
     for i in range(len(regions_of_interest)):
-        orientation = get_orientation_from_metadata(inputfolder, i)
+        orientation = get_orientation_from_metadata(folder, i)
         orientations.append(orientation)
         print(f"Arena {i+1} orientation: {orientation}")
 
+    # Global rotation from the folder name, then the crop, "hz" rotation and split of each arena
+    plan = f1_plan(regions_of_interest, orientations, rotation_from_folder_name(folder))
+
+    # Equalize the histogram to make thresholding easier
+    frame = cv2.equalizeHist(plan.orient(frame))
+
     # Create visualization of detected arenas with split preview
     # 3 rows x 6 columns to match 3x3 physical layout (each arena gets 2 columns: Left, Right)
     fig, axs = plt.subplots(3, 6, figsize=(30, 15))
-    
-    for i in range(9):
-        # Calculate position in 3x3 grid
-        row = i // 3  # 0, 1, 2
-        col_offset = (i % 3) * 2  # 0, 2, 4 (each arena uses 2 columns)
-        
-        # Process the arena to show left and right splits
-        x1, y1, x2, y2 = regions_of_interest[i]
-        width = x2 - x1
-        height = y2 - y1
-
-        # Adjust the width and height to be multiples of 2
-        if width % 2 != 0:
-            width -= 1
-        if height % 2 != 0:
-            height -= 1
-
-        arena_image = frame[y1 : y1 + height, x1 : x1 + width]
-        
-        # Apply rotation if the orientation is "hz" (horizontal)
-        if orientations[i] == "hz":
-            arena_image = cv2.rotate(arena_image, cv2.ROTATE_90_CLOCKWISE)
-        
-        # Split the arena into left and right halves
-        arena_height, arena_width = arena_image.shape
-        half_width = arena_width // 2
-        
-        # Ensure half_width is even
-        if half_width % 2 != 0:
-            half_width -= 1
-            
-        left_half = arena_image[:, :half_width]
-        right_half = arena_image[:, arena_width - half_width:]
-        
-        # Rotate the right half 180 degrees
-        right_half_rotated = cv2.rotate(right_half, cv2.ROTATE_180)
-        
-        # Show left half
-        axs[row, col_offset].imshow(left_half, cmap="gray", vmin=0, vmax=255)
-        axs[row, col_offset].set_title(f"Arena {i+1} Left ({orientations[i]})")
-        axs[row, col_offset].axis("off")
-        
-        # Show right half (rotated)
-        axs[row, col_offset + 1].imshow(right_half_rotated, cmap="gray", vmin=0, vmax=255)
-        axs[row, col_offset + 1].set_title(f"Arena {i+1} Right")
-        axs[row, col_offset + 1].axis("off")
+    for index, roi in enumerate(plan.rois):
+        i, side = divmod(index, 2)
+        ax = axs[i // 3, (i % 3) * 2 + side]
+        ax.imshow(plan.crop(frame, roi), cmap="gray", vmin=0, vmax=255)
+        ax.set_title(f"Arena {i+1} Left ({orientations[i]})" if side == 0 else f"Arena {i+1} Right")
+        ax.axis("off")
 
     plt.tight_layout()
-    plt.savefig(
-        str(processedfolder.joinpath("crop_check.png")), dpi=300, bbox_inches="tight"
-    )
+    plt.savefig(str(processedfolder / check_name), dpi=300, bbox_inches="tight")
     plt.close()
+    return plan
 
-    # Get a list of all image files in the input folder
-    images = [f.name for f in folder.glob("*.[jJ][pP][gG]") if f.is_file()]
-
-    # Sort the list of images by their number
-    images.sort(key=lambda f: int(re.sub(r"\D", "", f)))
-
-    # Create the subfolders for each arena's left and right tracks
-    for j in range(len(regions_of_interest)):
-        left_subfolder = processedfolder / f"arena{j+1}" / "Left"
-        right_subfolder = processedfolder / f"arena{j+1}" / "Right"
-        left_subfolder.mkdir(parents=True, exist_ok=True)
-        right_subfolder.mkdir(parents=True, exist_ok=True)
-
-    # Check if standard input is connected to a terminal
-    is_tty = os.isatty(sys.stdin.fileno())
 
-    print(f"Processing {len(images)} images...")
-
-    # Process images in batches to reduce memory usage and overhead
-    batch_size = max(1, len(images) // (mp.cpu_count() * 4))  # Adaptive batch size
-    image_batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
-    
-    # Prepare the arguments for the process_image_batch function
-    args = [(batch, regions_of_interest, folder, processedfolder, orientations) for batch in image_batches]
-
-    # Use threading backend for better resource management
-    with Parallel(n_jobs=-1, backend='threading', batch_size=1) as parallel:
-        results = parallel(delayed(process_image_batch)(*arg) for arg in tqdm(args, disable=not is_tty))
-    
-    # Force garbage collection to clean up any remaining resources
-    gc.collect()
-
-    # Rename the processed folder from _Processing to _Cropped
-    croppedfolder = processedfolder.with_name(
-        processedfolder.stem.replace("_Processing", "_Cropped")
-    )
-    processedfolder.rename(croppedfolder)
-    print(
-        f"Processing of {in_folder.name} finished! Folder renamed to {croppedfolder.name}"
-    )
+def process_folder(in_folder, regions="f1_tracks"):
+    """Process a folder of images, detecting arenas and splitting them into left/right tracks."""
+    crop_engine.process_folder(in_folder, ["f1"], regions={"f1": regions})
 
 
 def main():
@@ -1,26 +1,13 @@
 from pathlib import Path
 import cv2
-import numpy as np
 import re
-from joblib import Parallel, delayed
-from tqdm import tqdm
 import matplotlib.pyplot as plt
-import shutil
-import sys
 import os
 
-# Configuration parameters
-REGION_COORDINATES = [
-    (90, 30, 620, 600),  # Region 1
-    (1590, 30, 2110, 600),  # Region 2
-    (3080, 30, 3600, 600),  # Region 3
-    (90, 1170, 620, 1750),  # Region 4
-    (1590, 1170, 2110, 1750),  # Region 5
-    (3080, 1170, 3600, 1750),  # Region 6
-    (90, 2370, 620, 2900),  # Region 7
-    (1590, 2370, 2110, 2900),  # Region 8
-    (3080, 2370, 3600, 2900),  # Region 9
-]
+from multimaze_recorder.processing import crop_engine
+from multimaze_recorder.processing.crop_engine import load_regions
+from multimaze_recorder.processing.crop_plan import h_corridor_plan, orient, rotation_from_folder_name
+from multimaze_recorder.processing.frames import list_frames, load_frame
 
 ADAPTIVE_THRESH_PARAMS = {
     "block_size": 61,
@@ -30,34 +17,22 @@ ADAPTIVE_THRESH_PARAMS = {
 
 CONTOUR_PARAMS = {"min_area": 15000, "max_area": 35000, "padding": 10}
 
+# Detected geometry is kept in the plan store and reused while the rig does not move
+STORE_PLANS = True
 
-def process_last_frame(image_path, rotation="rotater"):
-    """Process the first frame to find rectangles"""
 
-    # Find number of frames
-    cap = cv2.VideoCapture(str(image_path))
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+def process_last_frame(input_folder, image, rotation="rotater", regions="h_corridors"):
+    """Process the last frame to find rectangles"""
+    regions_of_interest = load_regions(regions)
 
-    # Read last frame
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count - 1)
-    ret, img = cap.read()
-
-    # Convert to grayscale
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    # img = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+    img = load_frame(input_folder, image)
 
     if rotation:
         print(rotation)
-        if rotation == "flip":
-            img = cv2.rotate(img, cv2.ROTATE_180)
-        elif rotation == "rotatel":
-            img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        elif rotation == "rotater":
-            img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+        img = orient(img, rotation)
 
     rectangles_per_region = []
-    for region_idx, region in enumerate(REGION_COORDINATES):
+    for region_idx, region in enumerate(regions_of_interest):
         x1, y1, x2, y2 = region
         region_img = img[y1:y2, x1:x2]
 
@@ -91,104 +66,42 @@ def process_last_frame(image_path, rotation="rotater"):
     return rectangles_per_region
 
 
-def process_image(image_path, output_base, rectangles_per_region, rotation=None):
-    """Process individual image using precomputed rectangles"""
-    img = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
-
-    if rotation:
-        print(rotation)
-
-    for region_idx, region in enumerate(REGION_COORDINATES):
-        x1, y1, x2, y2 = region
-        region_img = img[y1:y2, x1:x2]
-
-        # Rotate the cropped region if needed
-        if rotation:
-            if rotation == "flip":
-                region_img = cv2.rotate(region_img, cv2.ROTATE_180)
-            elif rotation == "rotatel":
-                region_img = cv2.rotate(region_img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            elif rotation == "rotater":
-                region_img = cv2.rotate(region_img, cv2.ROTATE_90_CLOCKWISE)
-
-        rectangles = rectangles_per_region[region_idx]
-        if not rectangles:
-            continue
-
-        # Process and save subcrops
-        for corridor_idx, (x, y, w, h) in enumerate(rectangles):
-            pad = CONTOUR_PARAMS["padding"]
-            subcrop = region_img[
-                max(0, y - pad) : min(region_img.shape[0], y + h + pad),
-                max(0, x - pad) : min(region_img.shape[1], x + w + pad),
-            ]
+def plan_folder(input_folder, output_folder, regions="h_corridors", plan=None):
+    """Corridor crop plan of ``input_folder``, drawn into ``crop_verification.png``.
 
-            # Ensure even dimensions
-            subcrop = subcrop[: subcrop.shape[0] // 2 * 2, : subcrop.shape[1] // 2 * 2]
-
-            output_dir = (
-                output_base / f"arena{region_idx+1}" / f"corridor{corridor_idx+1}"
-            )
-            output_dir.mkdir(parents=True, exist_ok=True)
-
-            # Save the image with "_cropped" suffix
-            output_filename = image_path.stem + "_cropped.jpg"
-            cv2.imwrite(str(output_dir / output_filename), subcrop)
+    The corridors are found in the last frame; each region is turned by the
+    rotation of the folder name before cropping its corridors.  A stored
+    ``plan`` skips the detection.
+    """
+    images = list_frames(input_folder)
+    rotation = rotation_from_folder_name(input_folder.name)
 
+    if plan is None:
+        # Process the last frame to find rectangles
+        rectangles_per_region = process_last_frame(input_folder, images[-1], rotation, regions)
+        plan = h_corridor_plan(
+            load_regions(regions), rectangles_per_region, rotation, CONTOUR_PARAMS["padding"]
+        )
 
-def process_folder(input_folder, output_folder):
-    """Process all images in a folder"""
-    images = sorted(
-        [f for f in input_folder.glob("*.[jJ][pP][gG]") if f.is_file()],
-        key=lambda x: int(re.findall(r"\d+", x.stem)[0]),
-    )
+    # Generate verification preview
+    generate_verification_preview(plan, load_frame(input_folder, images[-1]), output_folder)
+    return plan
 
-    # Determine rotation from folder name
-    folder_name = input_folder.name.lower()
-    rotation = None
-    if "_flip" in folder_name:
-        rotation = "flip"
-    elif "rotatel" in folder_name:
-        rotation = "rotatel"
-    elif "rotater" in folder_name:
-        rotation = "rotater"
-
-    # Process the first frame to find rectangles
-    rectangles_per_region = process_last_frame(images[0], rotation)
-
-    # Parallel processing with progress bar
-    Parallel(n_jobs=-1)(
-        delayed(process_image)(img, output_folder, rectangles_per_region, rotation)
-        for img in tqdm(images, desc=f"Processing {input_folder.name}")
-    )
 
-    # Generate verification preview
-    generate_verification_preview(input_folder, output_folder)
+def process_folder(in_folder, regions="h_corridors"):
+    crop_engine.process_folder(in_folder, ["h-corridors"], regions={"h-corridors": regions})
 
 
-def generate_verification_preview(input_folder, output_folder):
+def generate_verification_preview(plan, frame, output_folder):
     """Generate grid preview of cropping results"""
     fig, axs = plt.subplots(9, 6, figsize=(20, 20))
+    for ax in axs.flat:
+        ax.axis("off")
 
-    sample_img = next(output_folder.glob("**/*.jpg"))
-    sample = cv2.imread(str(sample_img), cv2.IMREAD_GRAYSCALE)
-
-    for region_idx in range(9):
-        for corridor_idx in range(6):
-            try:
-                img_path = next(
-                    (
-                        output_folder
-                        / f"arena{region_idx+1}"
-                        / f"corridor{corridor_idx+1}"
-                    ).glob("*.jpg")
-                )
-                axs[region_idx, corridor_idx].imshow(
-                    cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE), cmap="gray"
-                )
-            except (StopIteration, IndexError):
-                pass
-            axs[region_idx, corridor_idx].axis("off")
+    for name, crop in plan.crops(frame):
+        arena, corridor = (int(n) for n in re.findall(r"\d+", name))
+        if corridor <= 6:
+            axs[arena - 1, corridor - 1].imshow(crop, cmap="gray")
 
     plt.savefig(output_folder / "crop_verification.png", dpi=300, bbox_inches="tight")
     plt.close()
@@ -206,25 +119,22 @@ def main():
     args = parser.parse_args()
     data_folder = Path(args.data_folder)
 
-    for folder in data_folder.iterdir():
-        if folder.is_dir() and "_Recorded" in folder.name:
-            output_folder = folder.with_name(
-                folder.name.replace("_Recorded", "_Cropped")
-            )
-
-            if output_folder.exists():
-                print(f"Skipping {folder.name} - already processed")
-                continue
-
-            print(f"Processing {folder.name}")
-            output_folder.mkdir(exist_ok=True)
-
-            try:
-                process_folder(folder, output_folder)
-                print(f"Completed {folder.name}")
-            except Exception as e:
-                print(f"Failed processing {folder.name}: {str(e)}")
-                shutil.rmtree(output_folder)
+    for folder in sorted(data_folder.iterdir()):
+        if not (folder.is_dir() and folder.name.endswith("_Recorded")):
+            continue
+        done = [
+            folder.with_name(folder.stem.replace("_Recorded", suffix))
+            for suffix in ("_Cropped", "_Cropped_Checked")
+        ]
+        if any(path.exists() for path in done):
+            print(f"Skipping {folder.name} - already processed")
+            continue
+        # Interrupted runs leave a _Processing folder, which process_folder resumes
+        print(f"Processing {folder.name}")
+        try:
+            process_folder(folder)
+        except Exception as e:
+            print(f"Failed processing {folder.name}: {str(e)}")
 
 
 if __name__ == "__main__":
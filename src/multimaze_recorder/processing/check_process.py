@@ -6,6 +6,8 @@ import matplotlib.image as mpimg
 import os
 import sys
 
+from multimaze_recorder.processing.prefetch import ordered_map
+
 
 def check_integrity(folder, source_folder):
     folder = Path(folder)
@@ -26,8 +28,8 @@ def check_integrity(folder, source_folder):
     fig, axs = plt.subplots(len(image_files), figsize=(10, 10))
     if len(image_files) == 1:
         axs = [axs]  # make axs iterable
-    for ax, image_file in zip(axs, image_files):
-        img = mpimg.imread(str(image_file))
+    # Read the check images ahead in threads, one round trip each on network mounts
+    for ax, (image_file, img) in zip(axs, ordered_map(lambda f: mpimg.imread(str(f)), image_files)):
         ax.imshow(img)
     plt.show(block=False)  # display the image using matplotlib
     valid = input("Are the detected ROIs valid? (y/n): ")
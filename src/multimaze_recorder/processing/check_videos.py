@@ -17,6 +17,8 @@ except Exception:
         Utils = None
 import os
 
+from multimaze_recorder.recording.frame_log import load_frame_log
+
 # Known output roots to search for experiment folders (align with Images2Vids)
 OUTPUT_PATHS = [
     Path("/mnt/upramdya_data/MD/Infection_Exps/InfectionCorridors/Experiments"),
@@ -70,6 +72,31 @@ def validate_video_duration(video_path, expected_duration_sec, tolerance_sec=1.0
     return diff <= tolerance_sec, actual
 
 
+def get_video_frame_count(video_path):
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=nb_frames",
+                "-of",
+                "csv=p=0",
+                str(video_path),
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True,
+        )
+        return int(result.stdout.strip())
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+
 def check_video_integrity(video_path):
     try:
         result = subprocess.run(
@@ -142,7 +169,11 @@ def load_duration_data(experiment_folder: Path):
 
 
 def check_folder_integrity(
-    folder, no_duration_check=False, duration_tolerance=1.0, expected_durations=None
+    folder,
+    no_duration_check=False,
+    duration_tolerance=1.0,
+    expected_durations=None,
+    expected_frames=None,
 ):
     folder = Path(folder)
     video_count = 0
@@ -168,6 +199,19 @@ def check_folder_integrity(
                     print(f"Video {video_file.name} is corrupted or otherwise unusable")
                     return False, video_count
 
+                # Frame count from the recording's frame log, when there is one
+                if not no_duration_check and expected_frames is not None:
+                    actual = get_video_frame_count(video_file.as_posix())
+                    if actual is not None and actual != expected_frames:
+                        print(
+                            f"Frame count mismatch for {video_file.name}: expected "
+                            f"{expected_frames} frames, got {actual}"
+                        )
+                        return False, video_count
+                    if actual is not None:
+                        video_count += 1
+                        continue
+
                 # Optional duration validation
                 if not no_duration_check and expected_durations:
                     expected = None
@@ -221,11 +265,21 @@ def process_data_folder(
                 print(f"Loaded duration data for {len(durations)} entries")
             else:
                 print("Duration validation disabled by flag; ignoring duration.npy")
+        # Frame log copied next to the videos, else the one of the source images
+        frame_log = load_frame_log(folder)
+        if frame_log is None:
+            base = name.replace("_Videos_NotChecked", "").replace("_Videos", "")
+            frame_log = load_frame_log(source_data_folder / f"{base}_Cropped_Checked")
+        expected_frames = None
+        if frame_log is not None and not no_duration_check:
+            expected_frames = len(frame_log)
+            print(f"Checking frame counts against {expected_frames} logged frames")
         verified, video_count = check_folder_integrity(
             folder,
             no_duration_check=no_duration_check,
             duration_tolerance=duration_tolerance,
             expected_durations=durations,
+            expected_frames=expected_frames,
         )
 
         if verified and video_count > 0:
@@ -0,0 +1,734 @@
+"""Crop engine shared by the ``array_to_*`` scripts.
+
+A crop layout is a ``CropPlan`` (regions, sub-ROIs, per-ROI rotations and
+the Left/Right split of F1 tracks, see ``crop_plan.py``) together with the
+folder its ROIs are written to.  ``crop_folder`` reads every frame of a
+recording once, orients it once per distinct frame rotation and writes the
+ROIs of all layouts, so several layouts can be produced from one pass over
+the raw data::
+
+    mmrecorder-crop --layout arenas corridors
+
+writes ``arenas/arenaN`` and ``corridors/arenaN/corridorM`` into the same
+``_Cropped`` folder.  The arena grids that the layouts start from are the
+named region grids of ``regions.json`` (or of ``MMRECORDER_REGIONS``).
+
+Frames are cropped in worker processes.  The frame list is split into one
+contiguous range per worker; each worker receives the plans once, keeps its
+rotation buffers across frames and only sends the names of the frames it
+has written back to the parent, which draws the progress bar and appends
+them to the ``cropped_frames.txt`` manifest of every output.  A run that
+was interrupted leaves its ``_Processing`` folder behind; the next run
+checks the newest manifest entries against the images on disk and crops
+the remaining frames only.
+"""
+
+import argparse
+import ctypes
+import fcntl
+import importlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import sys
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from multimaze_recorder.processing.crop_plan import (
+    _TURN_ROTATIONS,
+    CROP_PLAN_FILE,
+    CropPlan,
+    rotation_from_folder_name,
+    turned_size,
+)
+from multimaze_recorder.processing.frames import frame_number, list_frames, load_frame
+from multimaze_recorder.processing.jpeg_transform import (
+    JPEGTransformError,
+    TurboDecoder,
+    TurboTransformer,
+    available as jpeg_available,
+    lossless_box,
+    mcu_size,
+    snap_plan,
+)
+from multimaze_recorder.processing.plan_store import (
+    PLAN_REUSE,
+    RIG_FILE,
+    UNKNOWN_CAMERA,
+    PlanStore,
+)
+from multimaze_recorder.processing.prefetch import ordered_map, read_ahead
+from multimaze_recorder.processing.shards import ShardReader, ShardWriter, is_sharded
+from multimaze_recorder.recording.frame_log import copy_frame_log
+
+REGIONS_FILE = Path(__file__).with_name("regions.json")
+REGIONS_PATH = Path(os.environ.get("MMRECORDER_REGIONS", REGIONS_FILE))
+# 0: one worker process per core
+CROP_WORKERS = int(os.environ.get("MMRECORDER_CROP_WORKERS", "0"))
+CROP_BACKEND = os.environ.get("MMRECORDER_CROP_BACKEND", "pixel")
+# "files": one image{N}_cropped.jpg per ROI and frame; "shards": see shards.py
+CROP_STORAGE = os.environ.get("MMRECORDER_CROP_STORAGE", "files")
+STORAGES = ("files", "shards")
+
+# Frames a worker crops between two progress messages (and manifest batches)
+REPORT_FRAMES = 25
+
+MANIFEST_FILE = "cropped_frames.txt"
+LOCK_FILE = "processing.lock"
+# Newest manifest entries whose images are checked before resuming
+VERIFY_TAIL = 1024
+
+# Layout name -> module whose ``plan_folder(folder, output)`` detects its geometry
+LAYOUTS = {
+    "arenas": "multimaze_recorder.processing.array_to_arenas",
+    "corridors": "multimaze_recorder.processing.array_to_corridors",
+    "f1": "multimaze_recorder.processing.array_to_f1_tracks",
+    "h-corridors": "multimaze_recorder.processing.array_to_h_corridors",
+}
+
+CropOutput = namedtuple("CropOutput", "plan folder")
+
+
+class Manifest:
+    """Append-only list of the frame numbers fully written into an output folder.
+
+    Entries are appended in batches and synced to disk, after the ROI images
+    of their frames (see ``CropEngine.flush``).  A line cut short by a crash
+    is dropped when the manifest is read back with ``completed``.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.path = self.folder / MANIFEST_FILE
+
+    def read(self):
+        """Frame numbers in the order they were completed."""
+        try:
+            text = self.path.read_text()
+        except FileNotFoundError:
+            return []
+        # Only lines terminated by a newline were written completely
+        return [int(line) for line in text.split("\n")[:-1] if line.isdigit()]
+
+    def append(self, numbers):
+        if not numbers:
+            return
+        with open(self.path, "a") as f:
+            f.write("".join(f"{n}\n" for n in numbers))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncate_partial_line(self):
+        try:
+            with open(self.path, "rb+") as f:
+                data = f.read()
+                f.truncate(data.rfind(b"\n") + 1)
+        except FileNotFoundError:
+            pass
+
+    def completed(self, plan, names):
+        """Frame numbers done, less those of the newest ``VERIFY_TAIL`` entries
+        whose ROI images are missing or truncated.
+
+        ``names`` maps frame numbers to frame names.
+        """
+        self._truncate_partial_line()
+        numbers = self.read()
+        done = set(numbers)
+        if stored_as_shards(self.folder, plan):
+            # Shard indexes only list images already synced to disk
+            tail = np.array(numbers[-VERIFY_TAIL:], dtype=np.uint64)
+            for name in plan.names:
+                stored = ShardReader(self.folder / name).frame_numbers
+                done.difference_update(tail[~np.isin(tail, stored)].tolist())
+            return done
+
+        def written(number):
+            name = names.get(number)
+            return name is not None and _written(self.folder, plan, name)
+
+        for number, ok in ordered_map(written, numbers[-VERIFY_TAIL:]):
+            if not ok:
+                done.discard(number)
+        return done
+
+
+def stored_as_shards(folder, plan):
+    """True if the ROIs of ``plan`` in ``folder`` were written to shards."""
+    return any(is_sharded(Path(folder) / name) for name in plan.names)
+
+
+def _written(folder, plan, image):
+    """Whether every ROI image of frame ``image`` is a complete JPEG."""
+    cropped_image_file = f"{Path(image).stem}_cropped.jpg"
+    for name in plan.names:
+        try:
+            with open(folder / name / cropped_image_file, "rb") as f:
+                f.seek(-2, os.SEEK_END)
+                if f.read() != b"\xff\xd9":
+                    return False
+        except OSError:
+            return False
+    return True
+
+
+def load_regions(name, path=REGIONS_PATH):
+    """The ``(x1, y1, x2, y2)`` regions of grid ``name``, row by row."""
+    with open(path) as f:
+        grids = json.load(f)
+    if name not in grids:
+        raise KeyError(f"No region grid named {name!r} in {path}")
+    grid = grids[name]
+    return [(x1, y1, x2, y2) for y1, y2 in grid["rows"] for x1, x2 in grid["columns"]]
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.syncfs.argtypes = [ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+def sync_filesystem(folder):
+    """Write the dirty data of the filesystem holding ``folder`` to disk.
+
+    Uses ``syncfs`` where the C library has it, ``os.sync`` otherwise.
+    """
+    if _libc is None:
+        os.sync()
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        if _libc.syncfs(fd) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), str(folder))
+    finally:
+        os.close(fd)
+
+
+class CropEngine:
+    """Writes the ROIs of one or more ``CropOutput`` for each frame.
+
+    Frames are never rotated as a whole: each ROI is cut out of the recorded
+    frame and turned once, by its frame and ROI rotations together.  With
+    libturbojpeg, frames are decoded to grayscale into a buffer kept from
+    one frame to the next, and only over the part the ROIs cover.  Turned
+    ROIs are written into buffers kept as well, so an engine must not be
+    shared between threads.
+    """
+
+    def __init__(self, outputs, storage="files"):
+        self.outputs = list(outputs)
+        self.storage = storage
+        self.decoder = TurboDecoder() if jpeg_available() else None
+        self._sources = {}
+        self._buffers = {}
+        self._shards = {}
+        self._unsynced = False
+
+    def make_folders(self):
+        for output in self.outputs:
+            output.plan.make_folders(output.folder)
+
+    def _rotate(self, image, turns, key):
+        height, width = turned_size(*image.shape[:2], turns)
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != (height, width):
+            buffer = self._buffers[key] = np.empty((height, width), dtype=image.dtype)
+        return cv2.rotate(image, _TURN_ROTATIONS[turns], dst=buffer)
+
+    def sources(self, width, height):
+        """``(subfolder, box, turns)`` of every ROI in a recorded frame."""
+        sources = self._sources.get((width, height))
+        if sources is None:
+            sources = self._sources[width, height] = [
+                (output.folder / roi["name"], *output.plan.source(roi, width, height))
+                for output in self.outputs
+                for roi in output.plan.rois
+            ]
+        return sources
+
+    def region(self, width, height):
+        """Box of a recorded frame that holds every ROI."""
+        boxes = [box for _, box, _ in self.sources(width, height)]
+        return (
+            min(box[0] for box in boxes),
+            min(box[1] for box in boxes),
+            max(box[2] for box in boxes),
+            max(box[3] for box in boxes),
+        )
+
+    def crops(self, frame, selected=None):
+        """Yield ``(subfolder, image)`` for every ROI of every output.
+
+        ``selected`` restricts the ROIs to a set of subfolders.  The images
+        are only valid until the next frame.
+        """
+        if frame.ndim == 3:
+            frame = frame[:, :, 0]
+        height, width = frame.shape
+        for subfolder, (x1, y1, x2, y2), turns in self.sources(width, height):
+            if selected is not None and subfolder not in selected:
+                continue
+            image = frame[y1:y2, x1:x2]
+            if turns:
+                image = self._rotate(image, turns, subfolder)
+            yield subfolder, image
+
+    def save(self, subfolder, image, data):
+        """Store ``data``, the JPEG of ROI ``subfolder`` of frame ``image``."""
+        if self.storage == "files":
+            with open(subfolder / f"{Path(image).stem}_cropped.jpg", "wb") as f:
+                f.write(data)
+            self._unsynced = True
+            return
+        shard = self._shards.get(subfolder)
+        if shard is None:
+            shard = self._shards[subfolder] = ShardWriter(subfolder, frame_number(image))
+        shard.write(frame_number(image), data)
+
+    def flush(self):
+        """Sync the ROIs saved so far; done before frames are reported.
+
+        ROI files are synced with one ``sync_filesystem`` per output disk
+        rather than one fsync per file, so that no frame enters the manifest
+        before its images are on disk.
+        """
+        if self._unsynced:
+            devices = {}
+            for output in self.outputs:
+                devices.setdefault(os.stat(output.folder).st_dev, output.folder)
+            for folder in devices.values():
+                sync_filesystem(folder)
+            self._unsynced = False
+        for shard in self._shards.values():
+            shard.flush()
+
+    def close(self):
+        for shard in self._shards.values():
+            shard.close()
+        self._shards = {}
+
+    def process(self, folder, image, data=None):
+        """Crop frame ``image`` of ``folder``; returns False if it could not be read.
+
+        ``data`` is the content of the frame file if it was read ahead.
+        """
+        frame = load_frame(folder, image, self.decoder, self.region, data)
+        if frame is None:
+            print(f"Warning: Could not load image {image}")
+            return False
+        for subfolder, cropped_image in self.crops(frame):
+            self.save(subfolder, image, cv2.imencode(".jpg", cropped_image)[1])
+        return True
+
+    def process_range(self, folder, images, report=None):
+        """Crop ``images`` in order; returns those that could not be read.
+
+        Every ``REPORT_FRAMES`` frames and once at the end, ``report(written,
+        n)`` is called with the frames written and the number of frames
+        processed since the previous call.
+        """
+        failed, written, count = [], [], 0
+        try:
+            for image, data in read_ahead(folder, images):
+                if self.process(folder, image, data):
+                    written.append(image)
+                else:
+                    failed.append(image)
+                count += 1
+                if report is not None and count == REPORT_FRAMES:
+                    self.flush()
+                    report(written, count)
+                    written, count = [], 0
+            if report is not None and count:
+                self.flush()
+                report(written, count)
+        finally:
+            self.close()
+        return failed
+
+
+class LosslessCropEngine(CropEngine):
+    """Cuts the ROIs out of the recorded JPEGs without decoding them.
+
+    Each ROI is the recorded data, losslessly cropped and rotated in the
+    DCT domain (see ``jpeg_transform.py``).  ROIs that do not start on an
+    MCU boundary, and frames that are not JPEG files (raw chunk
+    recordings), are cropped from decoded pixels instead.
+    """
+
+    def __init__(self, outputs, storage="files", transformer=None):
+        super().__init__(outputs, storage)
+        self.transformer = transformer or TurboTransformer()
+        self._regions = None
+
+    def _regions_for(self, header):
+        """``(regions, subfolders, fallback)`` of the frames described by ``header``."""
+        if self._regions is None or self._regions[0] != header:
+            width, height, subsamp = header
+            regions, subfolders, fallback = [], [], set()
+            for output in self.outputs:
+                for roi in output.plan.rois:
+                    subfolder = output.folder / roi["name"]
+                    region = lossless_box(output.plan, roi, width, height, mcu_size(subsamp))
+                    if region is None:
+                        fallback.add(subfolder)
+                    else:
+                        regions.append(region)
+                        subfolders.append(subfolder)
+            if fallback:
+                print(f"{len(fallback)} ROIs are not MCU-aligned; cropping them from pixels")
+            self._regions = (header, regions, subfolders, fallback)
+        return self._regions[1:]
+
+    def process(self, folder, image, data=None):
+        if data is None:
+            try:
+                data = (Path(folder) / image).read_bytes()
+            except OSError:
+                return super().process(folder, image)
+        try:
+            header = self.transformer.header(data)
+            regions, subfolders, fallback = self._regions_for(header)
+            crops = self.transformer.transform(data, regions) if regions else []
+        except JPEGTransformError as e:
+            print(f"Warning: Could not crop {image} losslessly ({e})")
+            return super().process(folder, image, data)
+
+        for subfolder, crop in zip(subfolders, crops):
+            self.save(subfolder, image, crop)
+        if fallback:
+            frame = None
+            if self.decoder is not None:
+                try:
+                    frame = self.decoder.decode(data, self.region(*header[:2]))
+                except JPEGTransformError:
+                    pass
+            if frame is None:
+                frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+            if frame is None:
+                print(f"Warning: Could not load image {image}")
+                return False
+            for subfolder, cropped_image in self.crops(frame, fallback):
+                self.save(subfolder, image, cv2.imencode(".jpg", cropped_image)[1])
+        return True
+
+
+BACKENDS = {"pixel": CropEngine, "lossless": LosslessCropEngine}
+
+
+def snap_to_frames(plan, folder):
+    """``plan`` with its ROIs moved onto the MCU boundaries of the JPEGs of ``folder``."""
+    path = Path(folder) / list_frames(folder)[0]
+    if not path.is_file():
+        # Raw chunk recordings are always cropped from pixels
+        return plan
+    width, height, subsamp = TurboTransformer().header(path.read_bytes())
+    return snap_plan(plan, width, height, mcu_size(subsamp))
+
+
+def _crop_worker(folder, outputs, images, progress, backend, storage):
+    """Worker process: crop one contiguous range of frames.
+
+    Sends ``("done", (written, n))`` as frames are written, then
+    ``("failed", images)`` (or ``("error", message)``) once the range is
+    finished.
+    """
+    try:
+        engine = BACKENDS[backend](outputs, storage)
+        failed = engine.process_range(
+            folder, images, lambda written, n: progress.put(("done", (written, n)))
+        )
+        progress.put(("failed", failed))
+    except Exception as e:
+        progress.put(("error", f"{type(e).__name__}: {e}"))
+
+
+def frame_ranges(images, workers):
+    """Split ``images`` into at most ``workers`` contiguous, near-equal ranges."""
+    workers = max(1, min(workers, len(images)))
+    size, extra = divmod(len(images), workers)
+    ranges, start = [], 0
+    for n in range(workers):
+        end = start + size + (n < extra)
+        ranges.append(images[start:end])
+        start = end
+    return ranges
+
+
+def crop_folder(
+    folder, outputs, images=None, workers=None, progress=None, backend=None, storage=None
+):
+    """Crop ``images`` (default: all frames) of ``folder`` into ``outputs``.
+
+    Frames listed in the manifests of all outputs are skipped, so an
+    interrupted run continues where it stopped.  ``workers`` defaults to
+    ``MMRECORDER_CROP_WORKERS`` or the number of cores; with 1 the frames
+    are cropped in this process.  ``backend`` (default
+    ``MMRECORDER_CROP_BACKEND``) is ``"pixel"`` to decode frames and encode
+    every ROI, or ``"lossless"`` to cut the ROIs out of the recorded JPEGs.
+    ``storage`` (default ``MMRECORDER_CROP_STORAGE``) is ``"files"`` or
+    ``"shards"``; outputs already holding shards are always continued in
+    shards.  Returns the names of the frames that could not be read.
+    """
+    outputs = list(outputs)
+    backend = backend or CROP_BACKEND
+    storage = storage or CROP_STORAGE
+    if any(stored_as_shards(output.folder, output.plan) for output in outputs):
+        storage = "shards"
+    engine = BACKENDS[backend](outputs, storage)
+    engine.make_folders()
+    if images is None:
+        images = list_frames(folder)
+    if progress is None:
+        progress = os.isatty(sys.stdin.fileno())
+    if workers is None:
+        workers = CROP_WORKERS or os.cpu_count() or 1
+
+    names = {frame_number(image): image for image in images}
+    manifests = [Manifest(output.folder) for output in outputs]
+    done = set.intersection(
+        *(manifest.completed(output.plan, names) for manifest, output in zip(manifests, outputs))
+    )
+    if done:
+        images = [image for image in images if frame_number(image) not in done]
+        print(f"Resuming: {len(done)} frames were already cropped")
+    ranges = frame_ranges(images, workers)
+
+    print(f"Processing {len(images)} images in {len(ranges)} worker(s)...")
+
+    with tqdm(total=len(images), disable=not progress) as bar:
+
+        def record(written, count):
+            numbers = [frame_number(image) for image in written]
+            for manifest in manifests:
+                manifest.append(numbers)
+            bar.update(count)
+
+        if len(ranges) <= 1:
+            return engine.process_range(folder, images, record)
+
+        ctx = mp.get_context("spawn")
+        messages = ctx.Queue()
+        processes = [
+            ctx.Process(
+                target=_crop_worker,
+                args=(folder, outputs, chunk, messages, backend, storage),
+                daemon=True,
+            )
+            for chunk in ranges
+        ]
+        for process in processes:
+            process.start()
+        failed, errors, finished = [], [], 0
+        try:
+            while finished < len(processes):
+                try:
+                    kind, value = messages.get(timeout=1)
+                except queue.Empty:
+                    exited = sum(not process.is_alive() for process in processes)
+                    if exited > finished:
+                        raise RuntimeError("Crop worker exited before finishing its frames")
+                    continue
+                if kind == "done":
+                    record(*value)
+                    continue
+                finished += 1
+                if kind == "failed":
+                    failed.extend(value)
+                else:
+                    errors.append(value)
+        finally:
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+    if errors:
+        raise RuntimeError(f"Cropping {folder} failed: {'; '.join(errors)}")
+    return failed
+
+
+def plan_layout(layout, folder, output, regions=None):
+    """Crop plan of ``layout`` for ``folder``, with its check figure drawn into ``output``.
+
+    Layouts whose module sets ``STORE_PLANS`` reuse the plan stored for the
+    rig and camera of the recording while a frame still matches it, and
+    store the geometry they detect otherwise (see ``plan_store.py``).
+    """
+    module = importlib.import_module(LAYOUTS[layout])
+    options = {"regions": regions} if regions else {}
+    if not (PLAN_REUSE and getattr(module, "STORE_PLANS", False)):
+        return module.plan_folder(folder, output, **options)
+
+    store = PlanStore.for_recording(folder)
+    if store.camera_serial == UNKNOWN_CAMERA:
+        print(f"No {RIG_FILE} in {folder}; detecting the crop plan without the plan store")
+        return module.plan_folder(folder, output, **options)
+    key = store.key(layout, regions, rotation_from_folder_name(folder.name))
+    images = list_frames(folder)
+    frame = load_frame(folder, images[-1]) if images else None
+    stored = store.match(key, frame) if frame is not None else None
+    if stored is not None:
+        return module.plan_folder(folder, output, plan=stored.plan, **options)
+    plan = module.plan_folder(folder, output, **options)
+    if frame is not None:
+        version = store.save(key, plan, frame, folder.name)
+        print(f"Stored crop plan {key} v{version} in {store.root}")
+    return plan
+
+
+def plan_layouts(folder, processedfolder, layouts, regions=None, backend=None):
+    """Detect the geometry of each layout; returns their ``CropOutput``.
+
+    A single layout writes straight into ``processedfolder``, several into
+    one subfolder each.  ``regions`` maps layouts to the name of the grid of
+    ``regions.json`` they start from, if not their default one.  For the
+    lossless backend the plans are snapped to the MCUs of the recording.
+    """
+    regions = regions or {}
+    outputs = []
+    for layout in layouts:
+        output = processedfolder if len(layouts) == 1 else processedfolder / layout
+        output.mkdir(parents=True, exist_ok=True)
+        plan = plan_layout(layout, folder, output, regions.get(layout))
+        if (backend or CROP_BACKEND) == "lossless":
+            plan = snap_to_frames(plan, folder)
+        plan.save(output / CROP_PLAN_FILE)
+        outputs.append(CropOutput(plan, output))
+    return outputs
+
+
+@contextmanager
+def _locked(processedfolder):
+    """Hold the lock of a ``_Processing`` folder; yields False if another run holds it.
+
+    The lock is released by the system when its process dies, so an
+    interrupted run never blocks the next one.
+    """
+    with open(processedfolder / LOCK_FILE, "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            (processedfolder / LOCK_FILE).unlink(missing_ok=True)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def saved_outputs(processedfolder, layouts):
+    """The ``CropOutput`` of an interrupted run, or None if it did not finish planning."""
+    if len(layouts) == 1:
+        folders = [processedfolder]
+    else:
+        folders = [processedfolder / layout for layout in layouts]
+    if not all((folder / CROP_PLAN_FILE).exists() for folder in folders):
+        return None
+    return [CropOutput(CropPlan.load(folder / CROP_PLAN_FILE), folder) for folder in folders]
+
+
+def process_folder(folder, layouts, regions=None, backend=None, storage=None):
+    """Crop a ``_Recorded`` folder into all ``layouts`` and rename it ``_Cropped``.
+
+    An existing ``_Processing`` folder of an interrupted run is resumed with
+    the crop plans it was started with.
+    """
+    images = list_frames(folder)
+    if not images:
+        print(f"No image files found in {folder}.")
+        return
+
+    processedfolder = folder.with_name(folder.stem.replace("_Recorded", "_Processing"))
+    processedfolder.mkdir(exist_ok=True)
+    with _locked(processedfolder) as locked:
+        if not locked:
+            print(f"{folder.name} is being processed by another run, skipping")
+            return
+
+        outputs = saved_outputs(processedfolder, layouts)
+        if outputs is not None:
+            print(f"Resuming the interrupted processing of {folder.name}")
+        else:
+            # Nothing is cropped before every plan is saved; start over
+            for path in processedfolder.iterdir():
+                if path.is_dir():
+                    shutil.rmtree(path)
+                elif path.name != LOCK_FILE:
+                    path.unlink()
+            try:
+                outputs = plan_layouts(folder, processedfolder, layouts, regions, backend)
+            except Exception:
+                shutil.rmtree(processedfolder)
+                print(f"Cleaned up incomplete processing folder: {processedfolder}")
+                raise
+            copy_frame_log(folder, processedfolder)
+
+        failed = crop_folder(folder, outputs, images, backend=backend, storage=storage)
+        if failed:
+            print(f"Warning: {len(failed)} frames could not be read")
+
+    croppedfolder = processedfolder.with_name(
+        processedfolder.stem.replace("_Processing", "_Cropped")
+    )
+    processedfolder.rename(croppedfolder)
+    print(f"Processing of {folder.name} finished! Folder renamed to {croppedfolder.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Crop recorded images into one or more layouts in a single pass"
+    )
+    parser.add_argument(
+        "--layout", "-l", nargs="+", choices=sorted(LAYOUTS), default=["corridors"],
+        help="Layouts to write; several are read from the raw frames only once",
+    )
+    parser.add_argument(
+        "--data-folder", "-d",
+        default=os.environ.get("MMRECORDER_LOCAL_PATH", str(Path.home() / "Videos")),
+        help="Folder containing *_Recorded experiment directories",
+    )
+    parser.add_argument(
+        "--backend", "-b", choices=sorted(BACKENDS), default=CROP_BACKEND,
+        help="pixel: decode frames and encode every ROI; "
+             "lossless: cut MCU-aligned ROIs out of the recorded JPEGs (needs libturbojpeg)",
+    )
+    parser.add_argument(
+        "--storage", "-s", choices=STORAGES, default=CROP_STORAGE,
+        help="files: one JPEG per ROI and frame; "
+             "shards: append each ROI's frames to a few indexed MJPEG shard files",
+    )
+    args = parser.parse_args()
+
+    data_folder = Path(args.data_folder)
+    for folder in sorted(data_folder.iterdir()):
+        if not (folder.is_dir() and folder.name.endswith("_Recorded")):
+            continue
+        done = [
+            folder.with_name(folder.stem.replace("_Recorded", suffix))
+            for suffix in ("_Cropped", "_Cropped_Checked")
+        ]
+        if any(path.exists() for path in done):
+            print(f"Skipping {folder.name} - already processed")
+            continue
+        # Interrupted runs leave a _Processing folder, which process_folder resumes
+        print(f"Processing {folder.name} into {', '.join(args.layout)}")
+        process_folder(folder, args.layout, backend=args.backend, storage=args.storage)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Precomputed crop plans: the ROI rectangles and rotations of a rig geometry.
+
+A crop plan describes how a full recorded frame is turned into the per-ROI
+images of a ``_Cropped`` folder.  It is stored as JSON::
+
+    {
+        "rotation": "rotater",
+        "rois": [
+            {"name": "arena1/corridor1", "box": [x1, y1, x2, y2], "rotate": null},
+            ...
+        ]
+    }
+
+``rotation`` is the whole-frame rotation that the ``_flip``/``rotatel``/
+``rotater`` folder suffixes select in the ``array_to_*`` scripts, ``box`` is
+given in the coordinates of the rotated frame and ``rotate`` is an optional
+rotation applied to the cropped ROI (``"cw"``, ``"ccw"`` or ``"180"``).  The
+ROI ``name`` is the output subfolder, so a plan built from the corridor
+detection reproduces the ``arenaN/corridorM`` layout exactly.
+"""
+
+import json
+from pathlib import Path
+
+import cv2
+
+CROP_PLAN_FILE = "crop_plan.json"
+
+_FRAME_ROTATIONS = {
+    "flip": cv2.ROTATE_180,
+    "rotatel": cv2.ROTATE_90_COUNTERCLOCKWISE,
+    "rotater": cv2.ROTATE_90_CLOCKWISE,
+}
+
+_ROI_ROTATIONS = {
+    "cw": cv2.ROTATE_90_CLOCKWISE,
+    "ccw": cv2.ROTATE_90_COUNTERCLOCKWISE,
+    "180": cv2.ROTATE_180,
+}
+
+# Clockwise quarter turns of the frame and ROI rotations
+FRAME_TURNS = {None: 0, "rotater": 1, "flip": 2, "rotatel": 3}
+ROI_TURNS = {None: 0, "cw": 1, "180": 2, "ccw": 3}
+_TURN_ROTATIONS = {
+    1: cv2.ROTATE_90_CLOCKWISE,
+    2: cv2.ROTATE_180,
+    3: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def rotation_from_folder_name(folder):
+    """Return the frame rotation encoded in a recording folder name, or None."""
+    folder_name = str(folder).lower()
+    if "_flip" in folder_name:
+        return "flip"
+    elif "rotatel" in folder_name:
+        return "rotatel"
+    elif "rotater" in folder_name:
+        return "rotater"
+    return None
+
+
+def orient(frame, rotation):
+    """Apply a whole-frame rotation (``"flip"``, ``"rotatel"``, ``"rotater"`` or None)."""
+    if rotation is None:
+        return frame
+    return cv2.rotate(frame, _FRAME_ROTATIONS[rotation])
+
+
+def turned_size(width, height, turns):
+    """Size of a ``width`` x ``height`` image turned by ``turns`` quarter turns."""
+    return (height, width) if turns % 2 else (width, height)
+
+
+def rotate_box(box, width, height, turns):
+    """Map a box of a ``width`` x ``height`` image rotated clockwise by ``turns`` quarter turns."""
+    x1, y1, x2, y2 = box
+    turns %= 4
+    if turns == 1:
+        return height - y2, x1, height - y1, x2
+    if turns == 2:
+        return width - x2, height - y2, width - x1, height - y1
+    if turns == 3:
+        return y1, width - x2, y2, width - x1
+    return box
+
+
+class CropPlan:
+    """Ordered list of named ROIs cut out of a (possibly rotated) frame."""
+
+    def __init__(self, rois, rotation=None):
+        if rotation is not None and rotation not in _FRAME_ROTATIONS:
+            raise ValueError(f"Unknown frame rotation: {rotation}")
+        self.rotation = rotation
+        self.rois = []
+        for roi in rois:
+            rotate = roi.get("rotate")
+            if rotate is not None and rotate not in _ROI_ROTATIONS:
+                raise ValueError(f"Unknown rotation for ROI {roi['name']}: {rotate}")
+            x1, y1, x2, y2 = (int(v) for v in roi["box"])
+            if x2 <= x1 or y2 <= y1:
+                raise ValueError(f"Empty box for ROI {roi['name']}: {roi['box']}")
+            self.rois.append({"name": roi["name"], "box": (x1, y1, x2, y2), "rotate": rotate})
+
+    def __len__(self):
+        return len(self.rois)
+
+    @property
+    def names(self):
+        return [roi["name"] for roi in self.rois]
+
+    def orient(self, frame):
+        """Apply the whole-frame rotation of the plan."""
+        return orient(frame, self.rotation)
+
+    def crops(self, frame):
+        """Yield ``(name, image)`` for every ROI of a full, unrotated frame.
+
+        Unrotated ROIs are views on ``frame``; copy them if they must outlive it.
+        """
+        if frame.ndim == 3:
+            frame = frame[:, :, 0]
+        frame = self.orient(frame)
+        for roi in self.rois:
+            yield roi["name"], self.crop(frame, roi)
+
+    @staticmethod
+    def crop(oriented, roi):
+        """Cut ``roi`` out of a frame that ``orient`` has already been applied to."""
+        x1, y1, x2, y2 = roi["box"]
+        image = oriented[y1:y2, x1:x2]
+        if roi["rotate"] is not None:
+            image = cv2.rotate(image, _ROI_ROTATIONS[roi["rotate"]])
+        return image
+
+    def source(self, roi, width, height):
+        """``(box, turns)`` of ``roi`` in an unrotated ``width`` x ``height`` frame.
+
+        Cutting ``box`` out of the recorded frame and turning it clockwise by
+        ``turns`` quarter turns gives the same image as ``crop`` on the
+        oriented frame, without rotating the whole frame.  Like slicing, the
+        box is clipped to the frame.
+        """
+        frame_turns = FRAME_TURNS[self.rotation]
+        oriented_width, oriented_height = turned_size(width, height, frame_turns)
+        x1, y1, x2, y2 = roi["box"]
+        box = (
+            min(max(x1, 0), oriented_width),
+            min(max(y1, 0), oriented_height),
+            min(x2, oriented_width),
+            min(y2, oriented_height),
+        )
+        box = rotate_box(box, oriented_width, oriented_height, -frame_turns)
+        return box, (frame_turns + ROI_TURNS[roi["rotate"]]) % 4
+
+    def make_folders(self, root):
+        for name in self.names:
+            (Path(root) / name).mkdir(parents=True, exist_ok=True)
+
+    def to_dict(self):
+        return {
+            "rotation": self.rotation,
+            "rois": [
+                {"name": r["name"], "box": list(r["box"]), "rotate": r["rotate"]}
+                for r in self.rois
+            ],
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["rois"], rotation=data.get("rotation"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def _even(x1, y1, x2, y2):
+    """Shrink a box so that its width and height are even (required by x264/x265)."""
+    return x1, y1, x2 - (x2 - x1) % 2, y2 - (y2 - y1) % 2
+
+
+def arena_plan(regions_of_interest, rotation=None):
+    """Plan with one ``arenaN`` ROI per region, as written by array_to_arenas."""
+    rois = [
+        {"name": f"arena{j+1}", "box": _even(*region)}
+        for j, region in enumerate(regions_of_interest)
+    ]
+    return CropPlan(rois, rotation=rotation)
+
+
+def corridor_plan(corridors, rotation=None):
+    """Plan with ``arenaN/corridorM`` ROIs, as written by array_to_corridors."""
+    rois = [
+        {"name": f"arena{j+1}/corridor{k+1}", "box": corridor}
+        for j, subset in enumerate(corridors)
+        for k, corridor in enumerate(subset)
+    ]
+    return CropPlan(rois, rotation=rotation)
+
+
+def f1_plan(regions_of_interest, orientations, rotation=None):
+    """Plan with ``arenaN/Left`` and ``arenaN/Right`` ROIs, as written by array_to_f1_tracks.
+
+    The F1 script rotates "hz" arenas clockwise before splitting them, then
+    turns the right half by 180 degrees.  Both steps are folded into frame
+    coordinates and a per-ROI rotation here.
+    """
+    rois = []
+    for j, (region, orientation) in enumerate(zip(regions_of_interest, orientations)):
+        x1, y1, x2, y2 = _even(*region)
+        # Width of the arena as split by the F1 script (after its optional rotation)
+        split_extent = (y2 - y1) if orientation == "hz" else (x2 - x1)
+        half = split_extent // 2
+        if half % 2 != 0:
+            half -= 1
+
+        if orientation == "hz":
+            # Columns of the clockwise-rotated arena are rows from the bottom up
+            left = {"box": (x1, y2 - half, x2, y2), "rotate": "cw"}
+            right = {"box": (x1, y1, x2, y1 + half), "rotate": "ccw"}
+        else:
+            left = {"box": (x1, y1, x1 + half, y2), "rotate": None}
+            right = {"box": (x2 - half, y1, x2, y2), "rotate": "180"}
+
+        rois.append({"name": f"arena{j+1}/Left", **left})
+        rois.append({"name": f"arena{j+1}/Right", **right})
+    return CropPlan(rois, rotation=rotation)
+
+
+# The h-corridor script rotates each region by the folder-name rotation
+_REGION_ROTATIONS = {"flip": "180", "rotatel": "ccw", "rotater": "cw"}
+
+
+def _source_box(box, height, width, rotate):
+    """Map a box of a ``height`` x ``width`` image rotated by ``rotate`` back onto the image."""
+    xa, ya, xb, yb = box
+    if rotate == "cw":
+        return ya, height - xb, yb, height - xa
+    if rotate == "ccw":
+        return width - yb, xa, width - ya, xb
+    if rotate == "180":
+        return width - xb, height - yb, width - xa, height - ya
+    return box
+
+
+def h_corridor_plan(regions_of_interest, rectangles_per_region, rotation=None, padding=10):
+    """Plan with ``arenaN/corridorM`` ROIs, as written by array_to_h_corridors.
+
+    That script cuts each region out of the unrotated frame, rotates the
+    region by the folder-name ``rotation``, and crops the padded corridor
+    rectangles (``x, y, w, h`` in the rotated region) trimmed to even sizes.
+    The rectangles are mapped back to frame coordinates here, and the region
+    rotation becomes the rotation of each ROI.
+    """
+    rotate = _REGION_ROTATIONS.get(rotation)
+    rois = []
+    for j, (region, rectangles) in enumerate(zip(regions_of_interest, rectangles_per_region)):
+        x1, y1, x2, y2 = region
+        height, width = y2 - y1, x2 - x1
+        rotated_height, rotated_width = (
+            (width, height) if rotate in ("cw", "ccw") else (height, width)
+        )
+        for k, (x, y, w, h) in enumerate(rectangles):
+            xa, ya = max(0, x - padding), max(0, y - padding)
+            xb, yb = min(rotated_width, x + w + padding), min(rotated_height, y + h + padding)
+            xa, ya, xb, yb = _even(xa, ya, xb, yb)
+            sx1, sy1, sx2, sy2 = _source_box((xa, ya, xb, yb), height, width, rotate)
+            rois.append({
+                "name": f"arena{j+1}/corridor{k+1}",
+                "box": (x1 + sx1, y1 + sy1, x1 + sx2, y1 + sy2),
+                "rotate": rotate,
+            })
+    return CropPlan(rois)
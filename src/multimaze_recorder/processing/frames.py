@@ -0,0 +1,70 @@
+"""Frame access for recorded folders, whether JPEG files or a raw chunk container.
+
+The cropping scripts list frames with ``list_frames`` and read them with
+``load_frame``.  Both work on per-frame ``image{N}.jpg`` folders and on
+recordings made with the ``raw`` record format, where the names are virtual
+and frames are read from memory-mapped chunks without any decoding.
+"""
+
+import re
+from functools import lru_cache
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from multimaze_recorder.processing.jpeg_transform import JPEGTransformError
+from multimaze_recorder.recording.chunks import ChunkReader, is_chunked
+
+
+def frame_number(name):
+    """Return the frame number in an ``image{N}...`` name."""
+    numbers = re.findall(r"\d+", Path(name).stem)
+    return int(numbers[0]) if numbers else 0
+
+
+@lru_cache(maxsize=8)
+def _reader(folder):
+    return ChunkReader(folder)
+
+
+def list_frames(folder):
+    """Return the frame names of a recording, sorted by frame number."""
+    folder = Path(folder)
+    if is_chunked(folder):
+        return [f"image{n}.jpg" for n in _reader(str(folder)).frame_numbers]
+    images = [f.name for f in folder.glob("*.[jJ][pP][gG]") if f.is_file()]
+    images.sort(key=frame_number)
+    return images
+
+
+def load_frame(folder, image, decoder=None, region=None, data=None):
+    """Return frame ``image`` of ``folder`` as a 2D grayscale array, or None.
+
+    Frames of a raw container are read-only memmap views.  With a
+    ``jpeg_transform.TurboDecoder``, JPEG frames are decoded into its reused
+    buffer, and only within the box ``region(width, height)`` returns.
+    ``data`` is the content of the file when it was already read (see
+    ``prefetch.read_ahead``).
+    """
+    folder = Path(folder)
+    if is_chunked(folder):
+        try:
+            return _reader(str(folder)).frame(frame_number(image))
+        except KeyError:
+            return None
+    if data is None:
+        if decoder is None:
+            return cv2.imread(str(folder / image), cv2.IMREAD_GRAYSCALE)
+        try:
+            data = (folder / image).read_bytes()
+        except OSError:
+            return None
+    if decoder is None:
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    try:
+        width, height, _ = decoder.header(data)
+        return decoder.decode(data, region(width, height) if region else None)
+    except JPEGTransformError:
+        # Not a JPEG, or damaged: let OpenCV decode what it can
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
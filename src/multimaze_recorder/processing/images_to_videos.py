@@ -4,10 +4,12 @@ Enhanced Images2Vids Script with Data Protection and Robust Validation
 Key improvements:
 1. NEVER REMOVES ORIGINAL IMAGES - All processing is done on copies/outputs only
 2. CUDA failsafe - Automatically falls back to CPU if CUDA fails
-3. Duration validation - Validates video duration against duration.npy data
+3. Duration validation - Validates video frame counts against the recording's
+   frame_times.npy, or video duration against duration.npy data
 4. Comprehensive error handling and logging
 5. Detailed progress reporting and failure logs
 6. Command line options for CPU-only mode and skipping validation
+7. Several videos encoded at once, sized to the machine's cores, memory and disk
 
 Usage:
     python Images2Vids.py                                  # Normal operation (auto-fix invalid videos by default)
@@ -23,10 +25,17 @@ from tqdm import tqdm
 import subprocess
 import os
 import sys
+import time
 import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 from datetime import datetime
 
+from multimaze_recorder.processing.prefetch import ordered_map
+from multimaze_recorder.processing.shards import ShardReader, is_sharded
+from multimaze_recorder.recording.frame_log import copy_frame_log, load_frame_log
+
 data_folder = Path(os.environ.get("MMRECORDER_LOCAL_PATH", Path.home() / "Videos"))
 # Known output roots to search for the experiment folder. Edit this list to include all
 # locations where experiment folders may already be created. The script will pick the
@@ -44,6 +53,28 @@ output_path = None
 
 # fps = "29"
 
+# Videos encoded at once; 0 picks a number from the machine (see encode_slots)
+ENCODE_JOBS = int(os.environ.get("MMRECORDER_ENCODE_JOBS", "0"))
+# x265 threads per encode; 0 shares the cores between the running encodes
+ENCODE_THREADS = int(os.environ.get("MMRECORDER_ENCODE_THREADS", "0"))
+# x265 gains little from more threads on ROI-sized frames, so cores are
+# better spent on more encodes once each has this many
+MIN_JOB_THREADS = 4
+# Peak memory of one ffmpeg/x265 encode of a cropped ROI, lookahead included
+JOB_MEMORY = 768 * 2**20
+# Frames per second one encode reads, to budget disk throughput
+JOB_FPS = 150
+
+EncodeJob = namedtuple("EncodeJob", "images output name expected_duration")
+
+# Filters turning the frames as they are encoded, named like the frame
+# rotations of crop plans (processing/crop_plan.py)
+ROTATION_FILTERS = {
+    "rotater": "transpose=1",
+    "rotatel": "transpose=2",
+    "flip": "hflip,vflip",
+}
+
 
 def check_video_integrity(video_path):
     """Check basic video integrity using ffprobe"""
@@ -115,6 +146,63 @@ def validate_video_duration(video_path, expected_duration_sec, fps, tolerance_se
     return is_valid
 
 
+def get_video_frame_count(video_path):
+    """Get the frame count stored in the video container using ffprobe"""
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=nb_frames",
+                "-of",
+                "csv=p=0",
+                str(video_path),
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+            text=True,
+        )
+        return int(result.stdout.strip())
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def validate_video_frames(video_path, expected_frames, fps, tolerance_sec=1.0):
+    """
+    Validate that a video holds exactly the frames of the recording.
+
+    The expected count comes from the recording's frame log. When the
+    container does not store a frame count, falls back to the duration check.
+
+    Args:
+        video_path: Path to video file
+        expected_frames: Number of frames in the recording
+        fps: Frames per second
+        tolerance_sec: Allowed difference in seconds for the fallback
+
+    Returns:
+        bool: True if the video matches the recording, False otherwise
+    """
+    actual_frames = get_video_frame_count(video_path)
+    if actual_frames is None:
+        return validate_video_duration(
+            video_path, expected_frames / float(fps), fps, tolerance_sec=tolerance_sec
+        )
+
+    is_valid = actual_frames == expected_frames
+    if not is_valid:
+        print(
+            f"Frame count mismatch for {video_path.name}: "
+            f"expected {expected_frames} frames, got {actual_frames}"
+        )
+    return is_valid
+
+
 def check_ffmpeg_available():
     """Check if ffmpeg is available and working"""
     try:
@@ -151,9 +239,16 @@ def check_ffprobe_available():
         return False
 
 
+def has_cropped_images(folder):
+    """True if ``folder`` holds cropped frames, as JPEG files or in shards."""
+    return is_sharded(folder) or any(folder.glob("image*_cropped.jpg"))
+
+
 def count_images_in_folder(images_folder):
     """Count the number of cropped images in a folder"""
     try:
+        if is_sharded(images_folder):
+            return len(ShardReader(images_folder))
         image_files = list(images_folder.glob("image*_cropped.jpg"))
         return len(image_files)
     except Exception as e:
@@ -161,6 +256,122 @@ def count_images_in_folder(images_folder):
         return 0
 
 
+def run_ffmpeg(command, log, frames=None, timeout=None):
+    """Run an ffmpeg command line, logging to ``log``; returns its exit code.
+
+    ``frames`` (JPEG images as bytes) are written to its stdin.
+    """
+    if frames is None:
+        return subprocess.run(
+            command, shell=True, stdout=log, stderr=subprocess.STDOUT, timeout=timeout
+        ).returncode
+    process = subprocess.Popen(
+        command, shell=True, stdin=subprocess.PIPE, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        try:
+            for data in frames:
+                process.stdin.write(data)
+            process.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg stopped reading; its exit code tells why
+            pass
+        return process.wait(timeout=timeout)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+
+def available_memory():
+    """Bytes of memory available to new processes, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def frame_images(images_folder):
+    """Yield the cropped JPEG images of a folder as bytes, in frame order.
+
+    Frames dropped while recording leave gaps in the ``image{N}`` numbering,
+    where an ``image%d`` ffmpeg input would stop, so the files are listed.
+    """
+    if is_sharded(images_folder):
+        yield from ShardReader(images_folder).images()
+        return
+    numbered = []
+    for path in images_folder.glob("image*_cropped.jpg"):
+        number = path.name[len("image") : -len("_cropped.jpg")]
+        if number.isdigit():
+            numbered.append((int(number), path))
+    numbered.sort()
+    for _, data in ordered_map(Path.read_bytes, (path for _, path in numbered)):
+        yield data
+
+
+def measure_read_rate(folders, budget=64 * 2**20, max_seconds=1.0):
+    """Read a sample of the frames of ``folders`` to see how fast the disk serves them.
+
+    Returns ``(bytes per second, mean bytes per frame)``, or ``(None, None)``
+    if nothing could be read.
+    """
+    if not folders:
+        return None, None
+    share = budget // len(folders)
+    total = frames = 0
+    start = time.perf_counter()
+    try:
+        for folder in folders:
+            read = 0
+            for data in frame_images(folder):
+                read += len(data)
+                frames += 1
+                if read >= share:
+                    break
+            total += read
+            if time.perf_counter() - start > max_seconds:
+                break
+    except OSError as e:
+        print(f"Could not measure read throughput: {e}")
+    elapsed = time.perf_counter() - start
+    if not frames or not total:
+        return None, None
+    return total / max(elapsed, 1e-6), total / frames
+
+
+def encode_slots(jobs, cores=None, memory=None, read_rate=None, frame_bytes=None):
+    """Choose how many of ``jobs`` encodes to run at once, and their threads.
+
+    Each encode gets at least ``MIN_JOB_THREADS`` cores and ``JOB_MEMORY`` of
+    the available memory, and all of them together should not read frames
+    faster than the disk serves them.  ``MMRECORDER_ENCODE_JOBS`` and
+    ``MMRECORDER_ENCODE_THREADS`` override the choice.
+
+    Returns:
+        tuple: (concurrent encodes, x265 threads per encode)
+    """
+    cores = cores or os.cpu_count() or 1
+    if ENCODE_JOBS > 0:
+        slots = ENCODE_JOBS
+    else:
+        slots = max(1, cores // MIN_JOB_THREADS)
+        if memory:
+            slots = min(slots, max(1, memory // JOB_MEMORY))
+        if read_rate and frame_bytes:
+            slots = min(slots, max(1, int(read_rate // (frame_bytes * JOB_FPS))))
+    slots = max(1, min(slots, jobs))
+    threads = ENCODE_THREADS if ENCODE_THREADS > 0 else max(1, cores // slots)
+    return slots, threads
+
+
 def create_video_from_images(
     images_folder,
     output_folder,
@@ -171,6 +382,8 @@ def create_video_from_images(
     dry_run=False,
     cpu_only=False,
     duration_tolerance=1.0,
+    expected_frames=None,
+    threads=None,
 ):
     """
     Create video from images with fallback options and validation.
@@ -181,8 +394,12 @@ def create_video_from_images(
         video_name: Name of the video (without extension)
         fps: Frames per second
         expected_duration_sec: Expected duration in seconds for validation
-        rotation: Rotation to apply ('rotater' for 90° clockwise)
+        rotation: Rotation applied while encoding ('rotater' for 90° clockwise,
+            'rotatel' or 'flip'); frames cropped from a rotated recording are
+            already upright, as the crop stage turns them
         dry_run: If True, only print what would be done
+        expected_frames: Frame count of the recording, checked instead of the duration
+        threads: x265 worker threads, when several videos are encoded at once
 
     Returns:
         dict: Status information with 'success', 'method_used', 'message'
@@ -200,7 +417,7 @@ def create_video_from_images(
     if dry_run:
         print(f"DRY RUN: would run ffmpeg to create {video_path}")
         if rotation:
-            print(f"DRY RUN: would apply rotation {rotation} to {video_path}")
+            print(f"DRY RUN: would encode {video_path} rotated {rotation}")
         return {
             "success": True,
             "method_used": "dry_run",
@@ -215,11 +432,17 @@ def create_video_from_images(
             "method_used": "none",
             "message": "No images found in folder",
         }
+    if expected_frames is not None and num_images != expected_frames:
+        print(
+            f"Warning: {images_folder} has {num_images} images but the recording "
+            f"logged {expected_frames} frames"
+        )
 
     # Get current timestamp for log file
     now = datetime.now()
     now_str = now.strftime("%Y-%m-%d_%H-%M-%S")
-    log_file_name = f"ffmpeg_log_{video_name}_{now_str}.txt"
+    # Videos of different arenas share names and may be encoded at the same time
+    log_file_name = output_folder / f"ffmpeg_log_{video_name}_{now_str}.txt"
 
     # Get the full path to the conda environment's ffmpeg
     import shutil
@@ -228,6 +451,18 @@ def create_video_from_images(
     if not ffmpeg_path:
         ffmpeg_path = "ffmpeg"  # Fallback to PATH lookup
 
+    # Frames are streamed to ffmpeg's stdin as MJPEG, in frame order, across any
+    # numbering gaps left by frames dropped while recording
+    input_args = f"-r {fps} -f image2pipe -c:v mjpeg -i -"
+    encoder_args = "-pix_fmt yuv420p -c:v libx265 -crf 15"
+    # Rotating in the encode's filter graph saves re-encoding the whole video
+    if rotation in ROTATION_FILTERS:
+        encoder_args = f"-vf {ROTATION_FILTERS[rotation]} {encoder_args}"
+    elif rotation:
+        print(f"Unknown rotation {rotation}, encoding {video_name} unrotated")
+    if threads:
+        encoder_args += f" -x265-params pools={threads}"
+
     # Try CUDA first (unless cpu_only is specified), then fallback to CPU
     methods_to_try = []
     if not cpu_only:
@@ -235,7 +470,7 @@ def create_video_from_images(
             {
                 "name": "cuda",
                 "command": (
-                    f"{ffmpeg_path} -y -loglevel error -hwaccel cuda -r {fps} -i {images_folder.as_posix()}/image%d_cropped.jpg -pix_fmt yuv420p -c:v libx265 -crf 15 {temp_video_path.as_posix()}"
+                    f"{ffmpeg_path} -y -loglevel error -hwaccel cuda {input_args} {encoder_args} {temp_video_path.as_posix()}"
                 ),
             }
         )
@@ -244,7 +479,7 @@ def create_video_from_images(
         {
             "name": "cpu",
             "command": (
-                f"{ffmpeg_path} -y -loglevel error -r {fps} -i {images_folder.as_posix()}/image%d_cropped.jpg -pix_fmt yuv420p -c:v libx265 -crf 15 {temp_video_path.as_posix()}"
+                f"{ffmpeg_path} -y -loglevel error {input_args} {encoder_args} {temp_video_path.as_posix()}"
             ),
         }
     )
@@ -263,20 +498,19 @@ def create_video_from_images(
 
             # Run ffmpeg command
             with open(log_file_name, "w") as f:
-                result = subprocess.run(
+                returncode = run_ffmpeg(
                     method["command"],
-                    shell=True,
-                    stdout=f,
-                    stderr=subprocess.STDOUT,
+                    f,
+                    frames=frame_images(images_folder),
                     timeout=3600,  # 1 hour timeout
                 )
 
             # Check if ffmpeg succeeded
-            if result.returncode != 0:
+            if returncode != 0:
                 with open(log_file_name, "r") as f:
                     error_output = f.read()
                 error_messages.append(
-                    f"{method['name']}: FFmpeg failed with return code {result.returncode}. Error: {error_output}"
+                    f"{method['name']}: FFmpeg failed with return code {returncode}. Error: {error_output}"
                 )
                 continue
 
@@ -296,8 +530,19 @@ def create_video_from_images(
                 error_messages.append(f"{method['name']}: Video integrity check failed")
                 continue
 
-            # Validate duration if expected duration is provided
-            if expected_duration_sec is not None:
+            # Validate frame count, or duration, if expected values are provided
+            if expected_frames is not None:
+                if not validate_video_frames(
+                    temp_video_path,
+                    expected_frames,
+                    fps,
+                    tolerance_sec=duration_tolerance,
+                ):
+                    error_messages.append(
+                        f"{method['name']}: Video frame count validation failed"
+                    )
+                    continue
+            elif expected_duration_sec is not None:
                 if not validate_video_duration(
                     temp_video_path,
                     expected_duration_sec,
@@ -323,35 +568,8 @@ def create_video_from_images(
 
     # Handle results
     if success:
-        # Apply rotation if specified
-        final_video_path = video_path
-        if rotation:
-            rotated_video_path = output_folder / f"{video_name}_rotated.mp4"
-            if rotation == "rotater":
-                print("Rotating video 90 degrees clockwise")
-                try:
-                    ffmpeg_command = f"{ffmpeg_path} -y -loglevel error -i {temp_video_path} -vf 'transpose=1' {rotated_video_path}"
-                    result = subprocess.run(
-                        ffmpeg_command, shell=True, timeout=1800
-                    )  # 30 min timeout
-
-                    if result.returncode == 0 and rotated_video_path.exists():
-                        final_video_path = rotated_video_path
-                        temp_video_path.unlink()  # Remove unrotated temp file
-                    else:
-                        print("Rotation failed, keeping unrotated video")
-                        final_video_path = temp_video_path
-                except Exception as e:
-                    print(f"Rotation failed: {e}, keeping unrotated video")
-                    final_video_path = temp_video_path
-            else:
-                final_video_path = temp_video_path
-        else:
-            final_video_path = temp_video_path
-
         # Move temp file to final location
-        if final_video_path != video_path:
-            final_video_path.rename(video_path)
+        temp_video_path.rename(video_path)
 
         # Clean up log file on success
         if os.path.exists(log_file_name):
@@ -387,6 +605,7 @@ def search_folder_for_images(
     no_duration_check=False,
     auto_fix_invalid=False,
     duration_tolerance=1.0,
+    expected_frames=None,
 ):
     """
     Search for image folders and create videos with comprehensive validation.
@@ -397,11 +616,18 @@ def search_folder_for_images(
         fps: Frames per second
         expected_durations: Dict mapping folder names to expected durations in seconds
         dry_run: If True, only show what would be done
+        expected_frames: Frame count of the recording from its frame log; when
+            given, videos are checked against it instead of expected_durations
+
+    Existing videos are checked first, one folder at a time, as this may ask
+    before removing one.  The videos to make are then encoded several at once
+    (see encode_slots), and those that fail are tried again on their own on
+    the CPU.
     """
     subdirs = []
     # Only consider folders that contain cropped image frames to avoid needless traversal
     for subdir in folder_path.glob("**/*"):
-        if subdir.is_dir() and any(subdir.glob("image*_cropped.jpg")):
+        if subdir.is_dir() and has_cropped_images(subdir):
             subdirs.append(subdir)
 
     # Track statistics
@@ -413,6 +639,7 @@ def search_folder_for_images(
         "corrupted_removed": 0,
     }
     failed_videos = []
+    jobs = []
 
     with tqdm(total=len(subdirs), desc="Processing videos") as pbar:
         for subdir in subdirs:
@@ -437,7 +664,11 @@ def search_folder_for_images(
                     f"DRY RUN: would ensure output folder {video_output_folder} exists"
                 )
                 print(f"DRY RUN: would create video named {video_path} with fps={fps}")
-                if expected_duration:
+                if expected_frames is not None and not no_duration_check:
+                    print(
+                        f"DRY RUN: would validate frame count against {expected_frames} logged frames"
+                    )
+                elif expected_duration:
                     print(
                         f"DRY RUN: would validate duration against {expected_duration:.2f}s (tolerance {duration_tolerance:.2f}s)"
                     )
@@ -451,16 +682,23 @@ def search_folder_for_images(
             if video_path.exists():
                 if check_video_integrity(video_path.as_posix()):
                     # Check duration if we have expected duration and duration check is enabled
-                    if (
-                        no_duration_check
-                        or expected_duration is None
-                        or validate_video_duration(
+                    if no_duration_check:
+                        length_ok = True
+                    elif expected_frames is not None:
+                        length_ok = validate_video_frames(
+                            video_path,
+                            expected_frames,
+                            fps,
+                            tolerance_sec=duration_tolerance,
+                        )
+                    else:
+                        length_ok = expected_duration is None or validate_video_duration(
                             video_path,
                             expected_duration,
                             fps,
                             tolerance_sec=duration_tolerance,
                         )
-                    ):
+                    if length_ok:
                         print(
                             f"Video {video_name} already exists and is valid, skipping"
                         )
@@ -468,7 +706,7 @@ def search_folder_for_images(
                         video_needs_creation = False
                     else:
                         print(
-                            f"Video {video_name} exists but has wrong duration (tolerance {duration_tolerance:.2f}s)"
+                            f"Video {video_name} exists but has the wrong length"
                         )
                 else:
                     print(f"Video {video_name} exists but is corrupted")
@@ -498,35 +736,72 @@ def search_folder_for_images(
                             stats["skipped_existing"] += 1
                             video_needs_creation = False
 
-            # Create video if needed
+            # Queue the video to be created
             if video_needs_creation:
-                print(f"Creating video for {video_name}...")
-                result = create_video_from_images(
-                    subdir,
-                    video_output_folder,
-                    video_name,
-                    fps,
-                    expected_duration_sec=expected_duration,
-                    cpu_only=cpu_only,
-                    duration_tolerance=duration_tolerance,
+                jobs.append(
+                    EncodeJob(subdir, video_output_folder, video_name, expected_duration)
                 )
+            else:
+                pbar.update(1)
 
-                if result["success"]:
-                    print(f"✓ {video_name}: {result['message']}")
-                    stats["created_successfully"] += 1
-                else:
-                    print(f"✗ {video_name}: {result['message']}")
-                    stats["failed"] += 1
-                    failed_videos.append(
-                        {
-                            "name": video_name,
-                            "folder": str(subdir),
-                            "error": result["message"],
-                        }
-                    )
+        def encode(job, threads, cpu_only):
+            print(f"Creating video for {job.name}...")
+            return create_video_from_images(
+                job.images,
+                job.output,
+                job.name,
+                fps,
+                expected_duration_sec=job.expected_duration,
+                cpu_only=cpu_only,
+                duration_tolerance=duration_tolerance,
+                expected_frames=None if no_duration_check else expected_frames,
+                threads=threads,
+            )
 
+        def record(job, result):
+            if result["success"]:
+                print(f"✓ {job.name}: {result['message']}")
+                stats["created_successfully"] += 1
+            else:
+                print(f"✗ {job.name}: {result['message']}")
+                stats["failed"] += 1
+                failed_videos.append(
+                    {
+                        "name": job.name,
+                        "folder": str(job.images),
+                        "error": result["message"],
+                    }
+                )
             pbar.update(1)
 
+        if jobs:
+            read_rate, frame_bytes = measure_read_rate([job.images for job in jobs])
+            slots, threads = encode_slots(
+                len(jobs),
+                memory=available_memory(),
+                read_rate=read_rate,
+                frame_bytes=frame_bytes,
+            )
+            print(
+                f"Encoding {len(jobs)} videos, {slots} at a time with {threads} threads each"
+            )
+            retry = []
+            with ThreadPoolExecutor(max_workers=slots) as pool:
+                futures = {pool.submit(encode, job, threads, cpu_only): job for job in jobs}
+                for future in as_completed(futures):
+                    job, result = futures[future], future.result()
+                    if result["success"] or slots == 1:
+                        record(job, result)
+                    else:
+                        # May have run out of memory next to the other encodes
+                        retry.append(job)
+            for job in retry:
+                print(f"Retrying {job.name} alone on the CPU...")
+                record(job, encode(job, os.cpu_count(), True))
+            # Report failures in folder order, whichever encode finished first
+            order = {str(job.images): n for n, job in enumerate(jobs)}
+            failed_videos.sort(key=lambda failed: order.get(failed["folder"], -1))
+
     # Print summary
     print("\n" + "=" * 60)
     print("VIDEO CREATION SUMMARY")
@@ -800,6 +1075,15 @@ def process_all(
         else:
             print("Duration validation disabled by --no-duration-check flag")
 
+        # The recording's frame log gives the exact frame count of every video,
+        # and is kept with the videos for analysis once the images are removed
+        expected_frames = None
+        frame_log = load_frame_log(folder)
+        if frame_log is not None:
+            expected_frames = len(frame_log)
+            print(f"Frame log lists {expected_frames} recorded frames")
+            copy_frame_log(folder, processing_output_folder)
+
         # Process the images with enhanced validation
         try:
             stats = search_folder_for_images(
@@ -812,6 +1096,7 @@ def process_all(
                 no_duration_check=no_duration_check,
                 auto_fix_invalid=auto_fix_invalid,
                 duration_tolerance=duration_tolerance,
+                expected_frames=expected_frames,
             )
             print(f"Processing of {folder.name} complete.")
             experiment_results[output_folder_name] = stats or {"status": "unknown"}
@@ -0,0 +1,269 @@
+"""Lossless JPEG crops and rotations, as ``jpegtran -crop -rotate`` does,
+and grayscale decoding of the part of a frame that is cropped.
+
+``TurboTransformer`` calls the transform API of libturbojpeg (the
+``libturbojpeg0`` package on Ubuntu) through ctypes: the DCT coefficients
+of a recorded frame are read once and every ROI is cut out of them, and
+rotated by quarter turns, without an inverse and forward DCT.  The ROI
+images are the recorded data, bit for bit, and no JPEG is encoded again.
+
+Two constraints come with it.  The top-left corner of a crop must fall on
+an MCU boundary (8 pixels for grayscale frames, 16 for subsampled colour)
+of the rotated image, and a rotation mirrors whole MCUs only, so the partial
+MCU row or column at the far edge of the mirrored axis is dropped
+(``TJXOPT_TRIM``).  ``lossless_box`` maps a crop plan ROI onto the rotated,
+trimmed frame, and ``snap_plan`` moves the ROI corners onto MCU boundaries.
+
+``TurboDecoder`` decodes frames straight to a single channel, into a
+buffer reused from frame to frame.  With libjpeg-turbo 3 it only decodes
+the rows and MCU columns that the ROIs cover.
+"""
+
+import ctypes
+import ctypes.util
+
+import numpy as np
+
+from multimaze_recorder.processing.crop_plan import (
+    CropPlan,
+    FRAME_TURNS,
+    rotate_box,
+    turned_size,
+)
+
+# TurboJPEG constants (turbojpeg.h)
+_TJXOP = {0: 0, 1: 5, 2: 6, 3: 7}  # TJXOP_NONE, TJXOP_ROT90, TJXOP_ROT180, TJXOP_ROT270
+_TJXOPT_TRIM = 2
+_TJXOPT_CROP = 4
+_TJXOPT_GRAY = 8
+_TJPF_GRAY = 6
+# MCU width and height of each TJSAMP_* subsampling
+_MCU_SIZES = [(8, 8), (16, 8), (16, 16), (8, 8), (8, 16), (32, 8), (8, 32)]
+
+
+class JPEGTransformError(RuntimeError):
+    pass
+
+
+class _Region(ctypes.Structure):
+    _fields_ = [("x", ctypes.c_int), ("y", ctypes.c_int), ("w", ctypes.c_int), ("h", ctypes.c_int)]
+
+
+class _Transform(ctypes.Structure):
+    _fields_ = [
+        ("r", _Region),
+        ("op", ctypes.c_int),
+        ("options", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("customFilter", ctypes.c_void_p),
+    ]
+
+
+def _load_library():
+    for name in (ctypes.util.find_library("turbojpeg"), "libturbojpeg.so.0", "libturbojpeg.so"):
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name)
+        except OSError:
+            continue
+        lib.tjInitTransform.restype = ctypes.c_void_p
+        lib.tjDestroy.argtypes = [ctypes.c_void_p]
+        lib.tjGetErrorStr2.restype = ctypes.c_char_p
+        lib.tjGetErrorStr2.argtypes = [ctypes.c_void_p]
+        lib.tjFree.argtypes = [ctypes.c_void_p]
+        lib.tjDecompressHeader3.argtypes = [
+            ctypes.c_void_p, ctypes.c_char_p, ctypes.c_ulong,
+            ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+        ]
+        lib.tjTransform.argtypes = [
+            ctypes.c_void_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_int,
+            ctypes.POINTER(ctypes.c_void_p), ctypes.POINTER(ctypes.c_ulong),
+            ctypes.POINTER(_Transform), ctypes.c_int,
+        ]
+        lib.tjDecompress2.argtypes = [
+            ctypes.c_void_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_void_p,
+            ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+        ]
+        if hasattr(lib, "tj3SetCroppingRegion"):
+            lib.tj3DecompressHeader.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
+            lib.tj3SetCroppingRegion.argtypes = [ctypes.c_void_p, _Region]
+            lib.tj3Decompress8.argtypes = [
+                ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t, ctypes.c_void_p,
+                ctypes.c_int, ctypes.c_int,
+            ]
+        return lib
+    return None
+
+
+_lib = _load_library()
+# libjpeg-turbo 3 can decode a region of a frame
+_partial = _lib is not None and hasattr(_lib, "tj3SetCroppingRegion")
+
+
+def available():
+    """Whether libturbojpeg could be loaded."""
+    return _lib is not None
+
+
+def mcu_size(subsamp):
+    """``(width, height)`` in pixels of the MCU of a TJSAMP_* subsampling."""
+    return _MCU_SIZES[subsamp]
+
+
+class _TurboHandle:
+    """One libturbojpeg handle; not to be shared between threads."""
+
+    def __init__(self):
+        if _lib is None:
+            raise JPEGTransformError("libturbojpeg is not installed (sudo apt install libturbojpeg0)")
+        self._handle = _lib.tjInitTransform()
+        if not self._handle:
+            raise JPEGTransformError("Could not create a libturbojpeg handle")
+
+    def _error(self):
+        return _lib.tjGetErrorStr2(self._handle).decode(errors="replace")
+
+    def header(self, data):
+        """``(width, height, subsamp)`` of a JPEG."""
+        width, height, subsamp, colorspace = (ctypes.c_int() for _ in range(4))
+        if _lib.tjDecompressHeader3(
+            self._handle, data, len(data), ctypes.byref(width), ctypes.byref(height),
+            ctypes.byref(subsamp), ctypes.byref(colorspace),
+        ) != 0:
+            raise JPEGTransformError(self._error())
+        return width.value, height.value, subsamp.value
+
+    def close(self):
+        if getattr(self, "_handle", None):
+            _lib.tjDestroy(self._handle)
+            self._handle = None
+
+    def __del__(self):
+        self.close()
+
+
+class TurboTransformer(_TurboHandle):
+    """Cuts lossless crops out of JPEG data."""
+
+    def transform(self, data, regions):
+        """Cut ``regions`` (``(turns, (x, y, w, h))`` each) out of JPEG ``data``.
+
+        The coefficients are read once for all regions; returns one JPEG
+        (bytes) per region.
+        """
+        n = len(regions)
+        transforms = (_Transform * n)()
+        for transform, (turns, (x, y, w, h)) in zip(transforms, regions):
+            transform.r = _Region(x, y, w, h)
+            transform.op = _TJXOP[turns]
+            transform.options = _TJXOPT_CROP | _TJXOPT_TRIM | _TJXOPT_GRAY
+        buffers = (ctypes.c_void_p * n)()
+        sizes = (ctypes.c_ulong * n)()
+        try:
+            if _lib.tjTransform(self._handle, data, len(data), n, buffers, sizes, transforms, 0):
+                raise JPEGTransformError(self._error())
+            return [ctypes.string_at(buffers[i], sizes[i]) for i in range(n)]
+        finally:
+            for buffer in buffers:
+                if buffer:
+                    _lib.tjFree(buffer)
+
+
+class TurboDecoder(_TurboHandle):
+    """Decodes grayscale frames into one buffer reused from frame to frame."""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = None
+
+    def decode(self, data, region=None):
+        """JPEG ``data`` as a 2D array, valid until the next call.
+
+        Only ``region`` ``(x1, y1, x2, y2)`` (default: the whole frame) is
+        certain to be decoded; libjpeg-turbo 2 always decodes everything.
+        """
+        width, height, subsamp = self.header(data)
+        if self._buffer is None or self._buffer.shape != (height, width):
+            self._buffer = np.empty((height, width), dtype=np.uint8)
+        buffer = self._buffer
+        if not _partial:
+            if _lib.tjDecompress2(
+                self._handle, data, len(data), buffer.ctypes.data, width, width, height, _TJPF_GRAY, 0
+            ):
+                raise JPEGTransformError(self._error())
+            return buffer
+
+        x1, y1, x2, y2 = region or (0, 0, width, height)
+        # The left edge of a decoded region must be on an MCU boundary
+        x1 = max(x1 - x1 % mcu_size(subsamp)[0], 0)
+        y1, x2, y2 = max(y1, 0), min(x2, width), min(y2, height)
+        if x2 <= x1 or y2 <= y1:
+            x1, y1, x2, y2 = 0, 0, width, height
+        if (
+            _lib.tj3DecompressHeader(self._handle, data, len(data))
+            or _lib.tj3SetCroppingRegion(self._handle, _Region(x1, y1, x2 - x1, y2 - y1))
+            or _lib.tj3Decompress8(
+                self._handle, data, len(data), buffer[y1:, x1:].ctypes.data, width, _TJPF_GRAY
+            )
+        ):
+            raise JPEGTransformError(self._error())
+        return buffer
+
+
+def _source_geometry(plan, roi, width, height, mcu):
+    """Source box, total turns and trimmed source size of ``roi`` in a ``width`` x ``height`` frame."""
+    source, turns = plan.source(roi, width, height)
+    mcu_width, mcu_height = mcu
+    # The mirrored axes lose their partial MCU
+    trimmed_width = width - width % mcu_width if turns in (2, 3) else width
+    trimmed_height = height - height % mcu_height if turns in (1, 2) else height
+    return source, turns, trimmed_width, trimmed_height
+
+
+def lossless_box(plan, roi, width, height, mcu=(8, 8)):
+    """``(turns, (x, y, w, h))`` transform of ``roi``, or None if it cannot be cut losslessly.
+
+    ``width``, ``height`` and ``mcu`` describe the recorded (unrotated) frame.
+    """
+    source, turns, trimmed_width, trimmed_height = _source_geometry(plan, roi, width, height, mcu)
+    x1, y1, x2, y2 = source
+    if x1 < 0 or y1 < 0 or x2 > trimmed_width or y2 > trimmed_height:
+        return None
+    out_mcu_width, out_mcu_height = turned_size(*mcu, turns)
+    x1, y1, x2, y2 = rotate_box(source, trimmed_width, trimmed_height, turns)
+    if x1 % out_mcu_width or y1 % out_mcu_height:
+        return None
+    return turns, (x1, y1, x2 - x1, y2 - y1)
+
+
+def snap_plan(plan, width, height, mcu=(8, 8)):
+    """Copy of ``plan`` whose ROIs start on MCU boundaries of their rotated frame.
+
+    Each corner that must be aligned moves outwards by less than an MCU, and
+    the opposite edge moves inwards by at most one pixel to keep the ROI
+    sizes even.  ROIs that reach into a trimmed partial MCU are left as they
+    are and are cropped from decoded pixels.
+    """
+    frame_turns = FRAME_TURNS[plan.rotation]
+    rois = []
+    for roi in plan.rois:
+        source, turns, trimmed_width, trimmed_height = _source_geometry(
+            plan, roi, width, height, mcu
+        )
+        x1, y1, x2, y2 = source
+        if x1 < 0 or y1 < 0 or x2 > trimmed_width or y2 > trimmed_height:
+            rois.append(roi)
+            continue
+        out_mcu_width, out_mcu_height = turned_size(*mcu, turns)
+        x1, y1, x2, y2 = rotate_box(source, trimmed_width, trimmed_height, turns)
+        x1 -= x1 % out_mcu_width
+        y1 -= y1 % out_mcu_height
+        x2 -= (x2 - x1) % 2
+        y2 -= (y2 - y1) % 2
+        out_width, out_height = turned_size(trimmed_width, trimmed_height, turns)
+        source = rotate_box((x1, y1, x2, y2), out_width, out_height, -turns)
+        box = rotate_box(source, width, height, frame_turns)
+        rois.append({**roi, "box": box})
+    return CropPlan(rois, rotation=plan.rotation)
@@ -0,0 +1,173 @@
+"""Crop plans kept per rig and camera, and reused while the rig has not moved.
+
+Corridor detection (``array_to_corridors``, ``array_to_h_corridors``) is
+slow and fails on unlucky frames, although the geometry only changes when
+a rig or its camera is moved.  The recorders write ``rig.json`` (rig name
+and camera serial) into every recording; the first detection for a rig and
+layout is saved into the store as a versioned crop plan::
+
+    <store>/<rig>_<serial>/<layout>_<regions>_<rotation>/v1.json
+                                                        /v1.png
+
+``v1.json`` is a regular crop plan file with ``version``, ``created`` and
+``source`` keys added, and ``v1.png`` a downsampled raw frame of the
+recording it was detected on.  Later recordings compare one of their frames
+with that reference: if it has not shifted by more than
+``MMRECORDER_PLAN_MAX_SHIFT`` pixels and still correlates by at least
+``MMRECORDER_PLAN_SIMILARITY``, the plan is reused; otherwise the geometry
+is detected again and saved as the next version.
+"""
+
+import json
+import os
+import re
+import socket
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import cv2
+import numpy as np
+from platformdirs import user_data_dir
+
+from multimaze_recorder.processing.crop_plan import CropPlan
+
+RIG_FILE = "rig.json"
+UNKNOWN_CAMERA = "unknown"
+PLAN_STORE = Path(
+    os.environ.get("MMRECORDER_PLAN_STORE") or Path(user_data_dir("mmrecorder")) / "crop_plans"
+)
+RIG = os.environ.get("MMRECORDER_RIG") or socket.gethostname()
+PLAN_REUSE = os.environ.get("MMRECORDER_PLAN_REUSE", "on").lower() not in ("0", "off", "no")
+MAX_SHIFT = float(os.environ.get("MMRECORDER_PLAN_MAX_SHIFT", "6"))
+MIN_SIMILARITY = float(os.environ.get("MMRECORDER_PLAN_SIMILARITY", "0.8"))
+
+# Reference frames are compared at 1/THUMBNAIL_SCALE of the camera resolution
+THUMBNAIL_SCALE = 4
+
+StoredPlan = namedtuple("StoredPlan", "plan version path")
+
+
+def write_rig(folder, camera_configs):
+    """Record the rig and camera serial of a recording in ``folder``."""
+    info = {"rig": RIG, "camera_serial": str(camera_configs["format"]["serial"])}
+    with open(Path(folder) / RIG_FILE, "w") as f:
+        json.dump(info, f, indent=4)
+
+
+def read_rig(folder):
+    """``(rig, camera_serial)`` of a recording.
+
+    Recordings made before ``rig.json`` existed are attributed to this
+    machine and ``UNKNOWN_CAMERA``; plans are neither stored nor reused for
+    them, since recordings of different rigs would share that key.
+    """
+    try:
+        with open(Path(folder) / RIG_FILE) as f:
+            info = json.load(f)
+        return info["rig"], info["camera_serial"]
+    except (OSError, ValueError, KeyError):
+        return RIG, UNKNOWN_CAMERA
+
+
+def thumbnail(frame):
+    """Downsampled, contrast-equalised copy of a raw frame used as reference."""
+    if frame.ndim == 3:
+        frame = frame[:, :, 0]
+    height, width = frame.shape
+    small = cv2.resize(
+        frame, (width // THUMBNAIL_SCALE, height // THUMBNAIL_SCALE), interpolation=cv2.INTER_AREA
+    )
+    return cv2.equalizeHist(small)
+
+
+def compare(reference, frame):
+    """``(shift, similarity)`` of a frame against a reference thumbnail.
+
+    ``shift`` is the translation between both in full-resolution pixels,
+    ``similarity`` their correlation coefficient.
+    """
+    current = thumbnail(frame)
+    if current.shape != reference.shape:
+        return float("inf"), 0.0
+    a = reference.astype(np.float32)
+    b = current.astype(np.float32)
+    window = cv2.createHanningWindow(a.shape[::-1], cv2.CV_32F)
+    (dx, dy), _ = cv2.phaseCorrelate(a, b, window)
+    similarity = float(np.corrcoef(a.ravel(), b.ravel())[0, 1])
+    return float(np.hypot(dx, dy)) * THUMBNAIL_SCALE, similarity
+
+
+def _safe(name):
+    return re.sub(r"[^A-Za-z0-9.-]+", "-", str(name)).strip("-") or "none"
+
+
+class PlanStore:
+    """Versioned crop plans of one rig and camera."""
+
+    def __init__(self, rig, camera_serial, root=None):
+        self.camera_serial = str(camera_serial)
+        self.root = Path(root or PLAN_STORE) / f"{_safe(rig)}_{_safe(camera_serial)}"
+
+    @classmethod
+    def for_recording(cls, folder, root=None):
+        return cls(*read_rig(folder), root=root)
+
+    @staticmethod
+    def key(layout, regions=None, rotation=None):
+        return "_".join(_safe(part) for part in (layout, regions or layout, rotation))
+
+    def _versions(self, key):
+        folder = self.root / key
+        if not folder.is_dir():
+            return []
+        return sorted(int(path.stem[1:]) for path in folder.glob("v*.json") if path.stem[1:].isdigit())
+
+    def latest(self, key):
+        """The newest ``StoredPlan`` for ``key``, or None."""
+        versions = self._versions(key)
+        if not versions:
+            return None
+        path = self.root / key / f"v{versions[-1]}.json"
+        return StoredPlan(CropPlan.load(path), versions[-1], path)
+
+    def save(self, key, plan, frame, source=""):
+        """Store ``plan`` with ``frame`` as its reference; returns the new version."""
+        versions = self._versions(key)
+        version = versions[-1] + 1 if versions else 1
+        folder = self.root / key
+        folder.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(folder / f"v{version}.png"), thumbnail(frame))
+        data = {
+            "version": version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": str(source),
+            **plan.to_dict(),
+        }
+        path = folder / f"v{version}.json"
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+        return version
+
+    def match(self, key, frame, max_shift=None, min_similarity=None):
+        """The newest plan for ``key`` if ``frame`` still matches its reference, else None."""
+        stored = self.latest(key)
+        if stored is None:
+            return None
+        reference = cv2.imread(str(stored.path.with_suffix(".png")), cv2.IMREAD_GRAYSCALE)
+        if reference is None:
+            return None
+        max_shift = MAX_SHIFT if max_shift is None else max_shift
+        min_similarity = MIN_SIMILARITY if min_similarity is None else min_similarity
+        shift, similarity = compare(reference, frame)
+        if shift > max_shift or similarity < min_similarity:
+            print(
+                f"Stored crop plan {key} v{stored.version} no longer matches "
+                f"(shift {shift:.1f} px, similarity {similarity:.2f}); detecting again"
+            )
+            return None
+        print(
+            f"Reusing stored crop plan {key} v{stored.version} "
+            f"(shift {shift:.1f} px, similarity {similarity:.2f})"
+        )
+        return stored
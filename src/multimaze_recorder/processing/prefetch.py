@@ -0,0 +1,68 @@
+"""Read-ahead of recorded frames for the crop and verification stages.
+
+Reading frames one ``imread`` at a time costs a full round trip per file,
+which dominates on the network mounts recordings are often cropped from.
+``read_ahead`` keeps ``MMRECORDER_PREFETCH_FRAMES`` files in flight on a
+pool of ``MMRECORDER_PREFETCH_THREADS`` threads, in the order they are
+consumed, and hands out their bytes to be decoded from memory.  At most
+that many files are held at once, so memory stays bounded whatever the
+length of the recording.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from multimaze_recorder.recording.chunks import is_chunked
+
+# 0 disables read-ahead
+PREFETCH_FRAMES = int(os.environ.get("MMRECORDER_PREFETCH_FRAMES", "32"))
+PREFETCH_THREADS = int(os.environ.get("MMRECORDER_PREFETCH_THREADS", "8"))
+
+
+def ordered_map(fn, items, depth=None, threads=None):
+    """Yield ``(item, fn(item))`` in order, computing up to ``depth`` ahead in threads."""
+    depth = PREFETCH_FRAMES if depth is None else depth
+    if depth <= 0:
+        for item in items:
+            yield item, fn(item)
+        return
+    items = iter(items)
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=threads or PREFETCH_THREADS)
+    try:
+        for item in islice(items, depth):
+            pending.append((item, pool.submit(fn, item)))
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+            for following in islice(items, 1):
+                pending.append((following, pool.submit(fn, following)))
+            yield item, result
+    finally:
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown()
+
+
+def _read(path):
+    try:
+        return path.read_bytes()
+    except OSError:
+        return None
+
+
+def read_ahead(folder, images, depth=None, threads=None):
+    """Yield ``(image, data)`` for the frames of ``folder``, read ahead in threads.
+
+    ``data`` is None for frames that could not be read, and for every frame
+    of a raw chunk recording, which is memory-mapped instead.
+    """
+    folder = Path(folder)
+    if is_chunked(folder):
+        for image in images:
+            yield image, None
+        return
+    yield from ordered_map(lambda image: _read(folder / image), images, depth, threads)
@@ -0,0 +1,125 @@
+"""Append-only shard files for the cropped frames of one ROI.
+
+Writing every ROI of every frame as its own ``image{N}_cropped.jpg`` makes
+tens of millions of small files per recording, and file creation and
+directory listings then dominate both cropping and encoding.  With shard
+storage each ROI folder holds a few large files instead::
+
+    frames_000000000.mjpeg   JPEG images back to back, i.e. an MJPEG stream
+    frames_000000000.idx     one (frame, offset, size) record per image
+    frames_000045000.mjpeg   shard of the next worker range
+    frames_000045000.idx
+
+Each shard is written by a single crop worker and named after the first
+frame of its range.  Index records are only written once the images they
+point to have been synced to disk, and the index is synced in turn before
+the frames are reported, so an interrupted run leaves a shard whose index
+lists complete images only; a later run appends to it.
+``ShardReader`` gives the images in frame order, without duplicates.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+SHARD_PATTERN = "frames_{:09d}.mjpeg"
+INDEX_SUFFIX = ".idx"
+INDEX_DTYPE = np.dtype([("frame", "<u8"), ("offset", "<u8"), ("size", "<u4")])
+
+
+def is_sharded(folder):
+    """True if ``folder`` holds shard files."""
+    return any(Path(folder).glob(f"frames_*{INDEX_SUFFIX}"))
+
+
+class ShardWriter:
+    """Appends JPEG images to one shard of an ROI folder."""
+
+    def __init__(self, folder, first_frame):
+        self.path = Path(folder) / SHARD_PATTERN.format(first_frame)
+        self._file = open(self.path, "ab")
+        self._offset = self._file.tell()
+        index_path = self.path.with_suffix(INDEX_SUFFIX)
+        self._index = open(index_path, "ab")
+        # Drop a record cut short by an earlier crash
+        self._index.truncate(self._index.tell() // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize)
+        self._index.seek(0, os.SEEK_END)
+        self._pending = []
+
+    def write(self, frame_number, data):
+        size = len(data)
+        self._file.write(data)
+        self._pending.append((frame_number, self._offset, size))
+        self._offset += size
+
+    def flush(self):
+        """Sync the images written so far, then index them and sync the index."""
+        if not self._pending:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._index.write(np.array(self._pending, dtype=INDEX_DTYPE).tobytes())
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+
+class ShardReader:
+    """The images of an ROI folder in frame order."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.shards = sorted(self.folder.glob(f"frames_*{INDEX_SUFFIX}"))
+        indexes = []
+        for n, index_path in enumerate(self.shards):
+            data = index_path.read_bytes()
+            data = data[: len(data) // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize]
+            index = np.frombuffer(data, dtype=INDEX_DTYPE)
+            shard = index_path.with_suffix(".mjpeg")
+            size = shard.stat().st_size if shard.exists() else 0
+            index = index[index["offset"] + index["size"] <= size]
+            indexes.append((index, np.full(len(index), n, dtype=np.uint32)))
+        if indexes:
+            self.index = np.concatenate([index for index, _ in indexes])
+            self._shard = np.concatenate([shard for _, shard in indexes])
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+            self._shard = np.zeros(0, dtype=np.uint32)
+        # Frames cropped again after an interruption are kept once
+        order = np.argsort(self.index["frame"], kind="stable")
+        self.index, self._shard = self.index[order], self._shard[order]
+        unique = np.ones(len(self.index), dtype=bool)
+        unique[1:] = self.index["frame"][1:] != self.index["frame"][:-1]
+        self.index, self._shard = self.index[unique], self._shard[unique]
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def frame_numbers(self):
+        return self.index["frame"]
+
+    def __iter__(self):
+        """Yield ``(frame_number, jpeg_bytes)`` in frame order."""
+        files = {}
+        try:
+            for record, shard in zip(self.index, self._shard):
+                f = files.get(shard)
+                if f is None:
+                    f = files[shard] = open(self.shards[shard].with_suffix(".mjpeg"), "rb")
+                f.seek(int(record["offset"]))
+                yield int(record["frame"]), f.read(int(record["size"]))
+        finally:
+            for f in files.values():
+                f.close()
+
+    def images(self):
+        """The JPEG images alone, in frame order."""
+        for _, data in self:
+            yield data
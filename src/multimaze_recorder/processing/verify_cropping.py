@@ -10,11 +10,17 @@ from pathlib import Path
 import argparse
 from collections import defaultdict
 
+from multimaze_recorder.processing.frames import list_frames
+from multimaze_recorder.processing.prefetch import ordered_map
+from multimaze_recorder.processing.shards import ShardReader, is_sharded
+
 def count_images(folder_path):
-    """Count the number of .jpg files in a folder."""
+    """Count the number of .jpg files, or of sharded images, in a folder."""
     folder = Path(folder_path)
     if not folder.exists():
         return 0
+    if is_sharded(folder):
+        return len(ShardReader(folder))
     
     # Count both .jpg and .JPG files
     jpg_files = list(folder.glob("*.[jJ][pP][gG]"))
@@ -27,7 +33,7 @@ def verify_single_folder(recorded_folder, cropped_folder):
     print(f"{'='*60}")
     
     # Count original images
-    original_count = count_images(recorded_folder)
+    original_count = len(list_frames(recorded_folder)) if recorded_folder.exists() else 0
     print(f"Original folder images: {original_count}")
     
     if original_count == 0:
@@ -41,6 +47,14 @@ def verify_single_folder(recorded_folder, cropped_folder):
     
     print(f"Cropped folder: {cropped_folder.name}")
     
+    # List the Left/Right subfolders of every arena in threads rather than one after another
+    subfolders = [
+        cropped_folder / f"arena{arena_num}" / side
+        for arena_num in range(1, 10)
+        for side in ("Left", "Right")
+    ]
+    counts = dict(ordered_map(count_images, subfolders))
+
     # Check each arena
     all_good = True
     arena_summary = []
@@ -67,8 +81,8 @@ def verify_single_folder(recorded_folder, cropped_folder):
             continue
         
         # Count images in each subfolder
-        left_count = count_images(left_folder)
-        right_count = count_images(right_folder)
+        left_count = counts[left_folder]
+        right_count = counts[right_folder]
         
         arena_status = "✅"
         if left_count != original_count or right_count != original_count:
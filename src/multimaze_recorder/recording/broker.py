@@ -0,0 +1,393 @@
+"""Camera service sharing one TIS session between processes.
+
+``FrameBroker`` owns the camera (a ring-mode ``TIS``) and publishes every
+frame into a shared-memory ring.  A Unix control socket answers JSON-line
+requests and streams frame sequence numbers to subscribers.
+``BrokerClient`` implements the consumer side of the ``TIS`` interface
+(``snap_image``, ``get_frame``/``release_frame``, ``set_image_callback``,
+properties), so recorders, the live preview and vision loops attach to a
+running service within milliseconds instead of re-opening the camera.
+
+Shared memory layout::
+
+    slots x SLOT_DTYPE     (seq, pts, host_time) of each slot
+    slots x frame          frames of ``shape``, back to back
+
+A slot's ``seq`` is -1 while the broker overwrites it, and readers compare
+it before and after copying the frame out.
+"""
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from multimaze_recorder.camera.ring import FrameRing
+
+SOCKET_PATH = os.environ.get(
+    "MMRECORDER_CAMERA_SOCKET",
+    os.path.join(tempfile.gettempdir(), "mmrecorder-camera.sock"),
+)
+BROKER_SLOTS = int(os.environ.get("MMRECORDER_BROKER_SLOTS", "32"))
+SLOT_DTYPE = np.dtype([("seq", "<i8"), ("pts", "<u8"), ("host_time", "<f8")])
+PTS_NONE = 2**64 - 1
+
+
+def _send(conn, message):
+    conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def _lines(conn):
+    """Yield the JSON messages received on ``conn`` until it closes."""
+    buffer = b""
+    while True:
+        try:
+            chunk = conn.recv(4096)
+        except OSError:
+            return
+        if not chunk:
+            return
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _attach(name):
+    """Open the broker's shared memory without letting this process unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attaching process registers the block with
+        # its resource tracker, which would destroy it when the client exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class _SharedRing:
+    """Slot metadata and frames laid out in one shared memory block."""
+
+    def __init__(self, slots, shape, dtype, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        meta_bytes = slots * SLOT_DTYPE.itemsize
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=meta_bytes + slots * frame_bytes
+            )
+        else:
+            self.shm = _attach(name)
+        self.meta = np.ndarray((slots,), dtype=SLOT_DTYPE, buffer=self.shm.buf)
+        self.frames = np.ndarray(
+            (slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf, offset=meta_bytes
+        )
+        if name is None:
+            self.meta["seq"] = -1
+
+    def close(self, unlink=False):
+        self.meta = self.frames = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class FrameBroker:
+    """Publish the frames of ``camera`` to any number of local processes.
+
+    ``camera`` is a ``TIS`` with its ring buffer enabled; the broker takes
+    over its image callback.  ``camera_format`` (the preset ``format`` it
+    was opened with) is passed on to clients, which check it against theirs.
+    """
+
+    def __init__(self, camera, socket_path=SOCKET_PATH, slots=BROKER_SLOTS, camera_format=None):
+        self.camera = camera
+        self.camera_format = camera_format
+        self.socket_path = socket_path
+        self.slots = slots
+        self.ring = None
+        self.published = 0
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(socket_path)
+        self._server.listen()
+        camera.set_image_callback(self._publish)
+
+    def _publish(self, camera):
+        frame = camera.get_frame(camera.frame_seq)
+        if frame is None:
+            return
+        with self._lock:
+            try:
+                if self._stop.is_set():
+                    return
+                if self.ring is None:
+                    self.ring = _SharedRing(self.slots, frame.image.shape, frame.image.dtype)
+                slot = frame.seq % self.slots
+                meta = self.ring.meta
+                meta["seq"][slot] = -1
+                np.copyto(self.ring.frames[slot], frame.image)
+                meta["pts"][slot] = PTS_NONE if frame.pts is None else frame.pts
+                meta["host_time"][slot] = np.nan if frame.time is None else frame.time
+                meta["seq"][slot] = frame.seq
+                del meta
+            finally:
+                camera.release_frame(frame)
+            self.published += 1
+
+            note = f"{frame.seq}\n".encode("utf-8")
+            for conn in list(self._subscribers):
+                try:
+                    conn.send(note)
+                except BlockingIOError:
+                    # A slow subscriber misses this frame and sees a sequence gap
+                    pass
+                except OSError:
+                    self._subscribers.remove(conn)
+
+    def _info(self):
+        if self.ring is None:
+            return {"ready": False}
+        return {
+            "ready": True,
+            "shm": self.ring.shm.name,
+            "slots": self.slots,
+            "shape": list(self.ring.shape),
+            "dtype": self.ring.dtype.str,
+            "format": self.camera_format,
+        }
+
+    def _handle(self, conn):
+        for request in _lines(conn):
+            command = request.get("cmd")
+            try:
+                if command == "info":
+                    reply = self._info()
+                elif command == "subscribe":
+                    # Acknowledge under the lock so no frame is announced first
+                    with self._lock:
+                        _send(conn, {"ok": True})
+                        conn.setblocking(False)
+                        self._subscribers.append(conn)
+                    return
+                elif command == "get_property":
+                    reply = {"value": self.camera.get_property(request["name"])}
+                elif command == "set_property":
+                    self.camera.set_property(request["name"], request["value"])
+                    reply = {"ok": True}
+                elif command == "shutdown":
+                    _send(conn, {"ok": True})
+                    self.stop()
+                    return
+                else:
+                    reply = {"error": f"Unknown command: {command}"}
+            except Exception as error:
+                reply = {"error": str(error)}
+            _send(conn, reply)
+        conn.close()
+
+    def serve_forever(self):
+        """Accept clients until ``stop`` is called or a client sends shutdown."""
+        self._server.settimeout(0.5)
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.settimeout(None)
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def start(self):
+        """Serve clients from a background thread."""
+        threading.Thread(target=self.serve_forever, name="broker", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.camera.set_image_callback(None)
+        self._server.close()
+        with self._lock:
+            for conn in self._subscribers:
+                conn.close()
+            self._subscribers = []
+            if self.ring is not None:
+                self.ring.close(unlink=True)
+                self.ring = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def broker_available(socket_path=SOCKET_PATH):
+    """True if a camera service is listening on ``socket_path``."""
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+class BrokerClient:
+    """Consumer-side ``TIS`` stand-in attached to a running ``FrameBroker``.
+
+    Frames are copied once from shared memory into a local ``FrameRing``
+    and keep the broker's sequence numbers, so gaps still reveal lost frames.
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, ring_slots=8, timeout=5):
+        self.socket_path = socket_path
+        self._control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._control.connect(socket_path)
+        self._control_lines = _lines(self._control)
+        deadline = time.monotonic() + timeout
+        info = self._request({"cmd": "info"})
+        while not info["ready"]:
+            if time.monotonic() > deadline:
+                raise TimeoutError("The camera service has not produced a frame yet")
+            time.sleep(0.05)
+            info = self._request({"cmd": "info"})
+        self.shared = _SharedRing(info["slots"], info["shape"], info["dtype"], name=info["shm"])
+        # Preset format the service opened the camera with, if it said
+        self.format = info.get("format")
+        self.ring = FrameRing(ring_slots, self.shared.shape, self.shared.dtype)
+        self.frame_seq = None
+        self.img_mat = None
+        self.ImageCallback = None
+        self.ImageCallbackData = ()
+        self.properties = {}
+        self._feed = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._feed.connect(socket_path)
+        _send(self._feed, {"cmd": "subscribe"})
+        self._pending = b""
+        # Frames published after the acknowledgement are announced to us
+        lines = self._read_lines(timeout)
+        if not lines:
+            raise TimeoutError("The camera service did not accept the subscription")
+        self._pending = b"".join(line + b"\n" for line in lines[1:]) + self._pending
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _request(self, message):
+        _send(self._control, message)
+        reply = next(self._control_lines)
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def _read_lines(self, timeout):
+        """Complete lines received on the feed, waiting up to ``timeout`` s for one."""
+        self._feed.settimeout(timeout)
+        while b"\n" not in self._pending:
+            try:
+                chunk = self._feed.recv(4096)
+            except socket.timeout:
+                return []
+            if not chunk:
+                raise ConnectionError("The camera service closed the connection")
+            self._pending += chunk
+        *lines, self._pending = self._pending.split(b"\n")
+        return lines
+
+    def _announced(self, timeout):
+        """Sequence numbers announced by the broker since the last call.
+
+        Waits up to ``timeout`` seconds for at least one; returns [] otherwise.
+        """
+        return [int(line) for line in self._read_lines(timeout)]
+
+    def _copy(self, seq):
+        """Copy frame ``seq`` out of shared memory; None if it was overwritten."""
+        slot = seq % self.shared.slots
+        meta = self.shared.meta
+        if meta["seq"][slot] != seq:
+            return None
+        pts, host_time = int(meta["pts"][slot]), float(meta["host_time"][slot])
+        stored = self.ring.write(
+            self.shared.frames[slot],
+            pts=None if pts == PTS_NONE else pts,
+            host_time=host_time,
+            seq=seq,
+        )
+        if stored is None or meta["seq"][slot] != seq:
+            return None
+        self.frame_seq = seq
+        frame = self.ring.acquire(seq)
+        if frame is not None:
+            self.img_mat = frame.image
+            self.ring.release(frame)
+        return seq
+
+    def snap_image(self, timeout, convert_to_mat=True):
+        """Wait up to ``timeout`` s for the next frame; returns its seq or None."""
+        if self.ImageCallback is not None:
+            print("Snap_image can not be called, if a callback is set.")
+            return None
+        announced = self._announced(timeout)
+        return self._copy(announced[-1]) if announced else None
+
+    def get_frame(self, seq=None):
+        return self.ring.acquire(seq)
+
+    def release_frame(self, frame):
+        if frame is not None:
+            self.ring.release(frame)
+
+    def get_image(self):
+        return self.img_mat
+
+    def set_image_callback(self, function, *data):
+        self.ImageCallback = function
+        self.ImageCallbackData = data
+        if function is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._dispatch, name="broker-client", daemon=True)
+            self._thread.start()
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            try:
+                announced = self._announced(0.5)
+            except (ConnectionError, OSError):
+                return
+            for seq in announced:
+                if self._copy(seq) is not None and self.ImageCallback:
+                    self.ImageCallback(self, *self.ImageCallbackData)
+
+    def get_property(self, property_name):
+        return self._request({"cmd": "get_property", "name": property_name})["value"]
+
+    def set_property(self, property_name, value):
+        """Set a camera property for every client; the old value is restored on close."""
+        if property_name not in self.properties:
+            self.properties[property_name] = self.get_property(property_name)
+        self._request({"cmd": "set_property", "name": property_name, "value": value})
+
+    def stop_pipeline(self):
+        """Detach from the service; the camera itself keeps running."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        for name, value in self.properties.items():
+            try:
+                self._request({"cmd": "set_property", "name": name, "value": value})
+            except (RuntimeError, OSError, StopIteration):
+                pass
+        self.properties = {}
+        self._feed.close()
+        self._control.close()
+        self.shared.close()
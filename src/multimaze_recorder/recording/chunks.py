@@ -0,0 +1,133 @@
+"""Chunked raw GRAY8 frame container.
+
+Frames of one recording all have the same size and are appended, without any
+encoding, to segment files of about ``chunk_mb`` megabytes::
+
+    frames_00000.mmraw   64-byte header, then frames back to back
+    frames_00001.mmraw
+    ...
+    frames.idx           one (frame, chunk, slot) record per stored frame
+
+The index maps the recorder's frame number to its position, so frames
+missing from a recording simply have no entry.  ``ChunkReader`` returns
+``np.memmap`` views, making random access and sequential scans decode-free.
+"""
+
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"MMRAWv1\0"
+VERSION = 1
+HEADER_SIZE = 64
+# magic, version, header size, height, width, frames per chunk, first frame
+HEADER_FORMAT = "<8sHHIIIQ"
+CHUNK_PATTERN = "frames_{:05d}.mmraw"
+INDEX_FILE = "frames.idx"
+INDEX_DTYPE = np.dtype([("frame", "<u8"), ("chunk", "<u4"), ("slot", "<u4")])
+CHUNK_MB = int(os.environ.get("MMRECORDER_CHUNK_MB", "1024"))
+
+
+def is_chunked(folder):
+    """True if ``folder`` holds a chunked raw recording."""
+    return (Path(folder) / INDEX_FILE).exists()
+
+
+class ChunkWriter:
+    """Append fixed-size 2D uint8 frames to a folder of chunk files."""
+
+    def __init__(self, folder, height, width, chunk_mb=CHUNK_MB):
+        self.folder = Path(folder)
+        self.height = height
+        self.width = width
+        self.frame_bytes = height * width
+        self.frames_per_chunk = max(1, chunk_mb * 1024 * 1024 // self.frame_bytes)
+        self.frames = 0
+        self._chunk = -1
+        self._slot = 0
+        self._file = None
+        self._index = open(self.folder / INDEX_FILE, "ab")
+
+    def _next_chunk(self, frame_number):
+        if self._file is not None:
+            self._file.close()
+        self._chunk += 1
+        self._slot = 0
+        self._file = open(self.folder / CHUNK_PATTERN.format(self._chunk), "wb")
+        header = struct.pack(
+            HEADER_FORMAT, MAGIC, VERSION, HEADER_SIZE,
+            self.height, self.width, self.frames_per_chunk, frame_number,
+        )
+        self._file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def write(self, frame_number, frame):
+        if frame.shape != (self.height, self.width):
+            raise ValueError(
+                f"Frame of shape {frame.shape} does not fit a {self.height}x{self.width} container"
+            )
+        if self._file is None or self._slot == self.frames_per_chunk:
+            self._next_chunk(frame_number)
+        self._file.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        record = np.array([(frame_number, self._chunk, self._slot)], dtype=INDEX_DTYPE)
+        self._index.write(record.tobytes())
+        self._slot += 1
+        self.frames += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._index.close()
+
+
+class ChunkReader:
+    """Random and sequential read access to a chunked raw recording."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.index = np.fromfile(self.folder / INDEX_FILE, dtype=INDEX_DTYPE)
+        order = np.argsort(self.index["frame"], kind="stable")
+        self.index = self.index[order]
+        self._maps = {}
+        if len(self.index):
+            with open(self.folder / CHUNK_PATTERN.format(0), "rb") as f:
+                header = struct.unpack(HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT)))
+            magic, version, header_size, height, width = header[:5]
+            if magic != MAGIC:
+                raise ValueError(f"{self.folder} is not a raw frame container")
+            self.header_size = header_size
+            self.shape = (height, width)
+        else:
+            self.header_size = HEADER_SIZE
+            self.shape = (0, 0)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def frame_numbers(self):
+        return self.index["frame"]
+
+    def _chunk(self, chunk):
+        if chunk not in self._maps:
+            path = self.folder / CHUNK_PATTERN.format(chunk)
+            frame_bytes = self.shape[0] * self.shape[1]
+            count = (path.stat().st_size - self.header_size) // frame_bytes
+            self._maps[chunk] = np.memmap(
+                path, dtype=np.uint8, mode="r", offset=self.header_size,
+                shape=(count, *self.shape),
+            )
+        return self._maps[chunk]
+
+    def frame(self, frame_number):
+        """Return a read-only memmap view of frame ``frame_number``."""
+        position = np.searchsorted(self.index["frame"], frame_number)
+        if position == len(self.index) or self.index["frame"][position] != frame_number:
+            raise KeyError(f"Frame {frame_number} is not in {self.folder}")
+        record = self.index[position]
+        return self._chunk(int(record["chunk"]))[int(record["slot"])]
+
+    def __iter__(self):
+        for record in self.index:
+            yield int(record["frame"]), self._chunk(int(record["chunk"]))[int(record["slot"])]
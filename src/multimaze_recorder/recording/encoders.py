@@ -0,0 +1,97 @@
+"""Long-lived ffmpeg encoder processes fed with raw GRAY8 frames.
+
+Each encoder owns an ffmpeg subprocess reading ``rawvideo`` from stdin and a
+feeder thread that drains a bounded queue into that pipe.  ``write`` blocks
+when the queue is full, so a slow encoder applies backpressure to the
+recorder instead of letting frames pile up in memory.
+"""
+
+import os
+import queue
+import shlex
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# Same output settings as processing/images_to_videos.create_video_from_images
+DEFAULT_ENCODER_ARGS = "-pix_fmt yuv420p -c:v libx265 -crf 15"
+ENCODER_ARGS = os.environ.get("MMRECORDER_ENCODER_ARGS", DEFAULT_ENCODER_ARGS)
+ENCODER_QUEUE_SIZE = int(os.environ.get("MMRECORDER_ENCODER_QUEUE", "64"))
+
+_STOP = object()
+
+
+class FFmpegEncoder:
+    """Encode a stream of equally sized 2D uint8 frames into one video file."""
+
+    def __init__(self, path, width, height, fps, encoder_args=ENCODER_ARGS,
+                 queue_size=ENCODER_QUEUE_SIZE):
+        self.path = Path(path)
+        self.width = width
+        self.height = height
+        self.frames = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+
+        ffmpeg_path = shutil.which("ffmpeg") or "ffmpeg"
+        command = [
+            ffmpeg_path, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "gray",
+            "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            *shlex.split(encoder_args),
+            self.path.as_posix(),
+        ]
+        self._log = open(self.path.with_suffix(".log"), "w")
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        self._thread = threading.Thread(target=self._feed, daemon=True)
+        self._thread.start()
+
+    def _feed(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _STOP:
+                break
+            if self._error is not None:
+                continue
+            try:
+                self._process.stdin.write(frame)
+            except (BrokenPipeError, OSError) as error:
+                self._error = error
+
+    def write(self, frame):
+        """Queue a copy of ``frame``; blocks while the encoder is behind."""
+        if self._error is not None:
+            raise RuntimeError(f"Encoder for {self.path} failed: {self._error}")
+        if frame.shape != (self.height, self.width):
+            raise ValueError(
+                f"Frame of shape {frame.shape} does not fit {self.width}x{self.height} encoder"
+            )
+        self._queue.put(np.ascontiguousarray(frame).tobytes())
+        self.frames += 1
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Flush the queue, finish the file and raise if ffmpeg failed."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = self._process.wait()
+        self._log.close()
+        if returncode != 0 or self._error is not None:
+            raise RuntimeError(
+                f"ffmpeg exited with code {returncode} for {self.path}, "
+                f"see {self._log.name}"
+            )
+        os.remove(self._log.name)
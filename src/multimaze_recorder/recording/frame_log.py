@@ -0,0 +1,127 @@
+"""Per-frame timing sidecar written next to every recording.
+
+One fixed-size record is appended per frame handed to the sink::
+
+    frame      recorder frame number (the N of image{N}.jpg)
+    seq        camera buffer sequence number from the frame ring
+    pts        GstBuffer presentation timestamp in ns (PTS_NONE if unset)
+    host_time  time.monotonic() when the buffer reached the appsink
+    pulse      trigger pulse index, or -1 for software-triggered recordings
+
+Records go to ``frame_times.bin`` while recording, so a crash loses at most
+the buffered tail, and are converted to ``frame_times.npy`` on ``close``.
+Gaps in ``seq`` are frames the camera delivered but the recorder lost; gaps
+in ``pulse`` are trigger pulses without a frame.  The Arduino does not report
+its pulses, so the pulse index is derived from the PTS spacing at the
+trigger rate.
+"""
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+FRAME_LOG_FILE = "frame_times.npy"
+PARTIAL_FILE = "frame_times.bin"
+PTS_NONE = 2**64 - 1
+FRAME_LOG_DTYPE = np.dtype(
+    [
+        ("frame", "<u8"),
+        ("seq", "<i8"),
+        ("pts", "<u8"),
+        ("host_time", "<f8"),
+        ("pulse", "<i8"),
+    ]
+)
+
+
+class FrameLog:
+    """Append one timing record per recorded frame to ``folder``."""
+
+    def __init__(self, folder, fps=None, triggered=False):
+        self.folder = Path(folder)
+        self.fps = fps
+        self.triggered = triggered
+        self.frames = 0
+        self._first_pts = None
+        self._file = open(self.folder / PARTIAL_FILE, "wb")
+
+    def _pulse(self, pts):
+        if not self.triggered or not self.fps or pts is None:
+            return -1
+        if self._first_pts is None:
+            self._first_pts = pts
+        return round((pts - self._first_pts) * self.fps / 1e9)
+
+    def append(self, frame_number, frame):
+        """Record ``frame``, a ``FrameRing`` frame stored as ``frame_number``."""
+        pts = frame.pts if frame.pts not in (None, PTS_NONE) else None
+        record = np.array(
+            [(
+                frame_number,
+                frame.seq,
+                PTS_NONE if pts is None else pts,
+                np.nan if frame.time is None else frame.time,
+                self._pulse(pts),
+            )],
+            dtype=FRAME_LOG_DTYPE,
+        )
+        self._file.write(record.tobytes())
+        self.frames += 1
+
+    def close(self):
+        """Convert the partial log into ``frame_times.npy``."""
+        if self._file.closed:
+            return
+        self._file.close()
+        partial = self.folder / PARTIAL_FILE
+        np.save(self.folder / FRAME_LOG_FILE, np.fromfile(partial, dtype=FRAME_LOG_DTYPE))
+        partial.unlink()
+
+
+def copy_frame_log(source, target):
+    """Carry the frame log of ``source`` over to a derived folder, if it has one."""
+    source, target = Path(source), Path(target)
+    if (source / FRAME_LOG_FILE).exists():
+        shutil.copy2(source / FRAME_LOG_FILE, target / FRAME_LOG_FILE)
+
+
+def load_frame_log(folder):
+    """Return the frame log of ``folder`` as a structured array, or None.
+
+    Falls back to the partial log of a recording that did not finish.
+    """
+    folder = Path(folder)
+    if (folder / FRAME_LOG_FILE).exists():
+        return np.load(folder / FRAME_LOG_FILE)
+    if (folder / PARTIAL_FILE).exists():
+        return np.fromfile(folder / PARTIAL_FILE, dtype=FRAME_LOG_DTYPE)
+    return None
+
+
+def frame_times(log):
+    """Frame times in seconds from the first frame, from the PTS when known."""
+    pts = log["pts"]
+    if len(log) and np.all(pts != PTS_NONE):
+        return (pts - pts[0]).astype(np.float64) / 1e9
+    return log["host_time"] - log["host_time"][0] if len(log) else np.zeros(0)
+
+
+def summarize(log):
+    """Frame count, lost frames, duration and effective frame rate of a log."""
+    frames = len(log)
+    if frames == 0:
+        return {"frames": 0, "dropped": 0, "missed_pulses": 0, "duration": 0.0, "fps": 0.0}
+    seq = log["seq"]
+    dropped = int(seq.max() - seq.min() + 1 - frames)
+    pulses = np.unique(log["pulse"][log["pulse"] >= 0])
+    missed = int(pulses.max() - pulses.min() + 1 - len(pulses)) if len(pulses) else 0
+    times = frame_times(log)
+    duration = float(times[-1])
+    return {
+        "frames": frames,
+        "dropped": dropped,
+        "missed_pulses": missed,
+        "duration": duration,
+        "fps": (frames - 1) / duration if duration > 0 else 0.0,
+    }
@@ -0,0 +1,109 @@
+"""GStreamer pipeline descriptions, including the native recording branch.
+
+With a record branch the camera caps are teed into GStreamer elements that
+crop, encode and write every frame, and the appsink only gets frames
+sampled at ``preview_rate`` for preview and stats::
+
+    tcambin ! capsfilter ! tee ─ valve ! queue ! videocrop ! jpegenc ! multifilesink
+                               └ queue (leaky) ! videorate ! appsink
+
+The ``record_valve`` drops everything until the recorder opens it, and
+``record_sink`` gets its location at that point (see
+``TIS.start_native_recording``).  The descriptions are plain strings so they
+can be tried with ``videotestsrc`` in place of ``tcambin``.
+"""
+
+import os
+from pathlib import Path
+
+NATIVE_FORMATS = ("native-jpeg", "native-video")
+NATIVE_ENCODER = os.environ.get(
+    "MMRECORDER_NATIVE_ENCODER", "x265enc option-string=crf=15 ! h265parse"
+)
+NATIVE_QUEUE = int(os.environ.get("MMRECORDER_NATIVE_QUEUE", "256"))
+SOURCE = "tcambin name=source"
+
+
+def videocrop(cropping, frame_size, even=False):
+    """``videocrop`` element keeping the preset ``cropping`` box of a frame.
+
+    With ``even`` the kept width and height are trimmed to even numbers, as
+    needed by 4:2:0 encoders.
+    """
+    width, height = frame_size
+    left, top, right, bottom = (
+        cropping["Left"], cropping["Top"], cropping["Right"], cropping["Bottom"]
+    )
+    if even:
+        right -= (right - left) % 2
+        bottom -= (bottom - top) % 2
+    return (
+        f"videocrop left={left} top={top} right={width - right} bottom={height - bottom}"
+    )
+
+
+def record_branch(record_format, cropping=None, frame_size=None, quality=75, max_rate=None):
+    """Elements after the tee that record every frame in ``record_format``.
+
+    With ``max_rate`` the branch keeps at most that many frames per second
+    of a free-running camera, as the snap recorder does.
+    """
+    if record_format not in NATIVE_FORMATS:
+        raise ValueError(f"Unknown native record format: {record_format}")
+    video = record_format == "native-video"
+    branch = [
+        "valve name=record_valve drop=true",
+        f"queue name=record_queue max-size-buffers={NATIVE_QUEUE} "
+        "max-size-bytes=0 max-size-time=0",
+    ]
+    if max_rate:
+        branch.append(f"videorate drop-only=true max-rate={max_rate}")
+    if cropping is not None and frame_size is not None:
+        branch.append(videocrop(cropping, frame_size, even=video))
+    if video:
+        branch += [
+            "videoconvert",
+            "video/x-raw,format=I420",
+            NATIVE_ENCODER,
+            "splitmuxsink name=record_sink muxer-factory=mp4mux",
+        ]
+    else:
+        branch += [f"jpegenc quality={quality}", "multifilesink name=record_sink"]
+    return " ! ".join(branch)
+
+
+def record_location(record_format, folder):
+    """Where ``record_sink`` writes a recording into ``folder``.
+
+    Matches the files written by ``JpegSink`` and the full-frame ``VideoSink``.
+    """
+    folder = Path(folder)
+    if record_format == "native-video":
+        return str(folder / f"{folder.name}.mp4")
+    return str(folder / "image%d.jpg")
+
+
+def pipeline_description(
+    conversion="", showvideo=False, branch=None, preview_rate=5, source=SOURCE
+):
+    """Camera pipeline ending in ``appsink name=sink``, teed into ``branch`` if given."""
+    if conversion and not conversion.strip().endswith("!"):
+        conversion += " !"
+    p = f"{source} ! capsfilter name=caps"
+    if branch:
+        p += " ! tee name=t"
+        p += f" t. ! {branch}"
+        if showvideo:
+            p += " t. ! queue ! videoconvert ! ximagesink"
+        p += (
+            " t. ! queue leaky=downstream max-size-buffers=1"
+            f" ! videorate drop-only=true max-rate={preview_rate}"
+            f" ! {conversion} appsink name=sink"
+        )
+    elif showvideo:
+        p += " ! tee name=t"
+        p += " t. ! queue ! videoconvert ! ximagesink"
+        p += f" t. ! queue ! {conversion} appsink name=sink"
+    else:
+        p += f" ! queue ! {conversion} appsink name=sink"
+    return p
@@ -0,0 +1,212 @@
+"""Pre-flight check that the recording disk can absorb a recording.
+
+Before a recording starts, a short calibration burst of frames is written by
+the recording's own sink and writer (see ``sinks.make_sink``) into a
+temporary folder on the target filesystem.  The resulting bytes per frame
+give the total size and the sustained write rate that ``fps`` x ``duration``
+needs.  These are compared with the free space and with the write speed
+measured for files of that size on the same filesystem:
+
+``block``
+    The recording does not fit, or the disk is slower than required.
+``warn``
+    Less than 10% of free space would be left, or the disk is faster than
+    required but by less than ``MMRECORDER_PREFLIGHT_HEADROOM``.
+
+``MMRECORDER_PREFLIGHT`` decides what the recorders do with a ``block``:
+refuse to start (``block``, default), only print it (``warn``), or skip
+the check (``off``).
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from multimaze_recorder.camera.sim import PatternSource
+from multimaze_recorder.recording.native import NATIVE_FORMATS
+from multimaze_recorder.recording.sinks import get_record_format, make_sink
+from multimaze_recorder.recording.writer import STATS_FILE, make_writer
+
+PREFLIGHT = os.environ.get("MMRECORDER_PREFLIGHT", "block")
+PREFLIGHT_FRAMES = int(os.environ.get("MMRECORDER_PREFLIGHT_FRAMES", "30"))
+PREFLIGHT_MB = int(os.environ.get("MMRECORDER_PREFLIGHT_MB", "256"))
+HEADROOM = float(os.environ.get("MMRECORDER_PREFLIGHT_HEADROOM", "2"))
+FREE_MARGIN = 0.1
+MAX_TEST_FILES = 2000
+
+RecordingPlan = namedtuple(
+    "RecordingPlan",
+    "record_format frame_bytes total_bytes required_mb_per_s free_bytes "
+    "write_mb_per_s level messages",
+)
+
+
+def grab_frames(camera, count, timeout=1):
+    """Copies of up to ``count`` frames snapped from a running ``camera``.
+
+    Stops at the first timeout, e.g. on a camera waiting for triggers.
+    """
+    frames = []
+    for _ in range(count):
+        if camera.snap_image(timeout) is None:
+            break
+        image = camera.get_image()
+        if image is None:
+            break
+        frames.append(np.array(image))
+    return frames
+
+
+def calibration_frames(camera_configs, count=PREFLIGHT_FRAMES, frames=None):
+    """``count`` frames to calibrate with: ``frames`` repeated, or synthetic ones."""
+    if frames:
+        return [frames[i % len(frames)] for i in range(count)]
+    fmt = camera_configs["format"]
+    source = PatternSource(fmt["width"], fmt["height"])
+    return [source.next_frame()[..., np.newaxis] for _ in range(count)]
+
+
+def _folder_bytes(folder):
+    return sum(
+        p.stat().st_size for p in Path(folder).rglob("*")
+        if p.is_file() and p.name != STATS_FILE
+    )
+
+
+def estimate_frame_bytes(folder, presets, camera_configs, fps, frames, record_format):
+    """Bytes per frame written by the ``record_format`` sink for ``frames``.
+
+    Native formats are estimated with the matching Python format.
+    """
+    if record_format in NATIVE_FORMATS:
+        record_format = record_format[len("native-"):]
+    folder = Path(folder)
+    folder.mkdir()
+    writer = make_writer(folder, camera_configs)
+    try:
+        sink = make_sink(folder, presets, camera_configs, writer, fps, record_format=record_format)
+        for index, frame in enumerate(frames):
+            sink.write(index, frame)
+        sink.close()
+    finally:
+        writer.shutdown(wait=True)
+    return _folder_bytes(folder) / len(frames)
+
+
+def measure_write_speed(folder, file_bytes, total_mb=PREFLIGHT_MB):
+    """Sustained MB/s for writing files of ``file_bytes`` into ``folder``.
+
+    ``total_mb`` (in at most ``MAX_TEST_FILES`` files) are written and
+    synced to disk one file at a time, then removed.  Only the test files are
+    synced, so other mounts such as the NAS are left alone.
+    """
+    file_bytes = int(min(max(file_bytes, 4096), 64 * 2**20))
+    count = min(max(1, int(total_mb * 2**20 // file_bytes)), MAX_TEST_FILES)
+    block = np.random.default_rng(0).integers(0, 256, file_bytes, dtype=np.uint8).tobytes()
+    folder = Path(folder)
+    start = time.perf_counter()
+    for index in range(count):
+        with open(folder / f"speed{index}.bin", "wb") as f:
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+    elapsed = time.perf_counter() - start
+    for index in range(count):
+        (folder / f"speed{index}.bin").unlink()
+    return count * file_bytes / elapsed / 1e6
+
+
+def evaluate(frame_bytes, fps, duration, free_bytes, write_mb_per_s, headroom=HEADROOM):
+    """Level (``ok``, ``warn`` or ``block``) and messages for the measurements."""
+    total_bytes = frame_bytes * fps * duration
+    required = frame_bytes * fps / 1e6
+    level, messages = "ok", []
+
+    if total_bytes > free_bytes:
+        level = "block"
+        messages.append(
+            f"The recording needs {total_bytes / 1e9:.1f} GB but only "
+            f"{free_bytes / 1e9:.1f} GB are free"
+        )
+    elif total_bytes > free_bytes * (1 - FREE_MARGIN):
+        level = "warn"
+        messages.append(
+            f"The recording would leave only {(free_bytes - total_bytes) / 1e9:.1f} GB free"
+        )
+
+    if write_mb_per_s < required:
+        level = "block"
+        messages.append(
+            f"The disk writes {write_mb_per_s:.0f} MB/s but the recording needs "
+            f"{required:.0f} MB/s"
+        )
+    elif write_mb_per_s < required * headroom:
+        level = "warn" if level == "ok" else level
+        messages.append(
+            f"The disk writes {write_mb_per_s:.0f} MB/s, less than {headroom:g}x the "
+            f"{required:.0f} MB/s the recording needs"
+        )
+    return total_bytes, required, level, messages
+
+
+def plan_recording(presets, camera_configs, fps, duration, local_path, frames=None):
+    """Calibrate and measure on the filesystem of ``local_path``; returns a RecordingPlan."""
+    local_path = Path(local_path)
+    local_path.mkdir(parents=True, exist_ok=True)
+    record_format = get_record_format(camera_configs)
+    frames = calibration_frames(camera_configs, frames=frames)
+    scratch = Path(tempfile.mkdtemp(prefix=".preflight-", dir=local_path))
+    notes = []
+    try:
+        try:
+            frame_bytes = estimate_frame_bytes(
+                scratch / "calibration", presets, camera_configs, fps, frames, record_format
+            )
+        except (OSError, RuntimeError) as error:
+            # e.g. no ffmpeg; uncompressed frames are an upper bound
+            notes.append(f"Could not calibrate {record_format} ({error}); assuming raw frames")
+            frame_bytes = estimate_frame_bytes(
+                scratch / "raw", presets, camera_configs, fps, frames, "raw"
+            )
+        write_mb_per_s = measure_write_speed(scratch, frame_bytes)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    free_bytes = shutil.disk_usage(local_path).free
+
+    total_bytes, required, level, messages = evaluate(
+        frame_bytes, fps, duration, free_bytes, write_mb_per_s
+    )
+    if notes and level == "ok":
+        level = "warn"
+    messages = notes + messages
+    return RecordingPlan(
+        record_format, frame_bytes, total_bytes, required, free_bytes,
+        write_mb_per_s, level, messages,
+    )
+
+
+def format_plan(plan):
+    lines = [
+        f"Pre-flight ({plan.record_format}): {plan.frame_bytes / 1e3:.0f} kB/frame, "
+        f"{plan.total_bytes / 1e9:.1f} GB in total at {plan.required_mb_per_s:.1f} MB/s; "
+        f"disk has {plan.free_bytes / 1e9:.1f} GB free and writes "
+        f"{plan.write_mb_per_s:.0f} MB/s"
+    ]
+    if plan.messages:
+        lines.append(f"{plan.level.upper()}:")
+        lines += [f"  {message}" for message in plan.messages]
+    return "\n".join(lines)
+
+
+def preflight(presets, camera_configs, fps, duration, local_path, frames=None, mode=PREFLIGHT):
+    """Print the plan for a recording; returns False if it must not start."""
+    if mode == "off":
+        return True
+    plan = plan_recording(presets, camera_configs, fps, duration, local_path, frames)
+    print(format_plan(plan))
+    return not (plan.level == "block" and mode == "block")
@@ -0,0 +1,299 @@
+"""Frame sinks used by the recorders to turn captured frames into files.
+
+A sink receives every captured frame while it is still borrowed from the
+camera ring buffer, copies out what it needs and hands it to an
+``ImageWriter`` (or an encoder).  ``write`` returns False when the writer's
+drop policy discarded the frame, which is then left out of the frame log.
+When the recording ends, the recording folder is renamed with the
+sink's ``finished_suffix`` so that the processing scripts pick it up at the
+right stage.
+"""
+
+import os
+import queue
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from multimaze_recorder.processing.crop_plan import CROP_PLAN_FILE, CropPlan
+from multimaze_recorder.recording.chunks import ChunkWriter
+from multimaze_recorder.recording.encoders import FFmpegEncoder
+from multimaze_recorder.recording.native import NATIVE_FORMATS, record_branch, record_location
+
+
+class JpegSink:
+    """Full frames (cropped to the preset ``cropping`` box) as ``image{N}.jpg``."""
+
+    finished_suffix = "_Recorded"
+
+    # PIL's default quality, used by the recorders unless the preset sets one
+    quality = 75
+
+    def __init__(self, folder, cropping, writer):
+        self.folder = Path(folder)
+        self.left, self.top, self.right, self.bottom = cropping.values()
+        self.writer = writer
+
+    def write(self, index, frame):
+        # Only the cropped region is copied out of the ring slot, by the
+        # process writer itself if it copies into shared memory
+        crop = np.squeeze(frame)[self.top:self.bottom, self.left:self.right]
+        if not self.writer.copies_images:
+            crop = crop.copy()
+        return self.writer.write(self.folder / f"image{index}.jpg", crop, quality=self.quality)
+
+    def close(self):
+        pass
+
+
+class CropPlanSink:
+    """Per-ROI ``{roi}/image{N}_cropped.jpg`` files, straight from the captured frame.
+
+    The recording folder then has the layout of a ``_Cropped`` folder, so the
+    ``_Recorded`` to ``_Cropped`` stage is skipped entirely.
+    """
+
+    finished_suffix = "_Cropped"
+
+    def __init__(self, folder, plan, writer):
+        self.folder = Path(folder)
+        self.plan = plan
+        self.writer = writer
+        self.plan.make_folders(self.folder)
+        self.plan.save(self.folder / CROP_PLAN_FILE)
+
+    def write(self, index, frame):
+        filename = f"image{index}_cropped.jpg"
+        copy = not self.writer.copies_images
+        return self.writer.write_many(
+            (self.folder / name / filename, image.copy() if copy else image)
+            for name, image in self.plan.crops(frame)
+        )
+
+    def close(self):
+        pass
+
+
+class VideoSink:
+    """Frames piped into long-lived ffmpeg encoders instead of per-frame JPEGs.
+
+    Without a crop plan a single ``{folder}.mp4`` of the preset ``cropping``
+    box is written.  With a crop plan every ROI gets its own encoder writing
+    ``{roi}/{leaf}.mp4``, the layout that images_to_videos produces, and the
+    folder is finished as ``_Videos``.  Encoders are started on the first
+    frame, once the frame size is known.
+    """
+
+    def __init__(self, folder, fps, cropping=None, plan=None):
+        self.folder = Path(folder)
+        self.fps = fps
+        self.cropping = cropping
+        self.plan = plan
+        self.encoders = None
+        self.finished_suffix = "_Videos" if plan is not None else "_Recorded"
+        if plan is not None:
+            self.plan.make_folders(self.folder)
+            self.plan.save(self.folder / CROP_PLAN_FILE)
+
+    def _crops(self, frame):
+        if self.plan is not None:
+            yield from self.plan.crops(frame)
+        else:
+            left, top, right, bottom = self.cropping.values()
+            # x265 with yuv420p needs even dimensions
+            right -= (right - left) % 2
+            bottom -= (bottom - top) % 2
+            yield self.folder.name, np.squeeze(frame)[top:bottom, left:right]
+
+    def _start(self, frame):
+        self.encoders = {}
+        for name, image in self._crops(frame):
+            if self.plan is not None:
+                path = self.folder / name / f"{Path(name).name}.mp4"
+            else:
+                path = self.folder / f"{name}.mp4"
+            height, width = image.shape
+            self.encoders[name] = FFmpegEncoder(path, width, height, self.fps)
+
+    def write(self, index, frame):
+        if self.encoders is None:
+            self._start(frame)
+        for name, image in self._crops(frame):
+            self.encoders[name].write(image)
+
+    def close(self):
+        errors = []
+        for encoder in (self.encoders or {}).values():
+            try:
+                encoder.close()
+            except RuntimeError as error:
+                errors.append(str(error))
+        if errors:
+            raise RuntimeError("\n".join(errors))
+
+
+class RawSink:
+    """Frames (cropped to the preset ``cropping`` box) appended to raw chunk files.
+
+    Appending happens on a background thread behind a bounded queue, like
+    the encoders, so a slow disk applies backpressure to the recorder.  The
+    cropping scripts read the resulting ``_Recorded`` folder directly.
+    """
+
+    finished_suffix = "_Recorded"
+    _stop = object()
+
+    def __init__(self, folder, cropping, queue_size=64):
+        self.folder = Path(folder)
+        self.left, self.top, self.right, self.bottom = cropping.values()
+        self.container = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._append, daemon=True)
+        self._thread.start()
+
+    def _append(self):
+        while True:
+            item = self._queue.get()
+            if item is self._stop:
+                break
+            if self._error is not None:
+                # Keep draining so that write() and close() never block
+                continue
+            index, crop = item
+            try:
+                if self.container is None:
+                    self.container = ChunkWriter(self.folder, *crop.shape)
+                self.container.write(index, crop)
+            except Exception as error:
+                # e.g. a frame whose shape or dtype differs from the chunks
+                self._error = error
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(f"Writing raw frames to {self.folder} failed: {self._error}")
+        if not self._thread.is_alive():
+            raise RuntimeError(f"The raw frame writer of {self.folder} has stopped")
+
+    def write(self, index, frame):
+        self._check()
+        crop = np.squeeze(frame)[self.top:self.bottom, self.left:self.right].copy()
+        self._queue.put((index, crop))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(self._stop)
+            self._thread.join()
+        if self.container is not None:
+            self.container.close()
+        if self._error is not None:
+            raise RuntimeError(f"Writing raw frames to {self.folder} failed: {self._error}")
+
+
+class NativeSink:
+    """Frames written by the camera pipeline's own record branch.
+
+    Frames never pass through Python, so ``write`` does nothing; the camera
+    must have been opened with the branch from ``native_branch``.  ``start``
+    lets frames into the branch and ``close`` finalizes its files.
+    """
+
+    finished_suffix = "_Recorded"
+
+    def __init__(self, folder, camera, record_format):
+        self.folder = Path(folder)
+        self.camera = camera
+        self.record_format = record_format
+
+    def start(self):
+        self.camera.start_native_recording(record_location(self.record_format, self.folder))
+
+    def write(self, index, frame):
+        pass
+
+    def format_stats(self):
+        return ", ".join(f"{k}={v}" for k, v in self.camera.native_stats().items())
+
+    def close(self):
+        if not self.camera.stop_native_recording():
+            raise RuntimeError(f"Native recording into {self.folder} did not finish cleanly")
+
+
+def get_record_format(camera_configs):
+    """``MMRECORDER_RECORD_FORMAT``, else the preset ``record_format`` (default jpeg)."""
+    return os.environ.get("MMRECORDER_RECORD_FORMAT") or camera_configs.get(
+        "record_format", "jpeg"
+    )
+
+
+def native_branch(camera_configs, max_rate=None):
+    """GStreamer record branch for native record formats, or None.
+
+    ``max_rate`` caps the frames recorded per second (see ``record_branch``).
+    """
+    record_format = get_record_format(camera_configs)
+    if record_format not in NATIVE_FORMATS:
+        return None
+    fmt = camera_configs["format"]
+    return record_branch(
+        record_format,
+        cropping=camera_configs.get("cropping"),
+        frame_size=(fmt["width"], fmt["height"]),
+        quality=camera_configs.get("jpeg_quality", JpegSink.quality),
+        max_rate=max_rate,
+    )
+
+
+def load_crop_plan(presets, camera_configs):
+    """Return the crop plan requested for a recording, or None.
+
+    ``MMRECORDER_CROP_PLAN`` takes precedence over a ``crop_plan`` entry in the
+    camera preset; relative preset entries are resolved next to the preset.
+    """
+    plan_path = os.environ.get("MMRECORDER_CROP_PLAN") or camera_configs.get("crop_plan")
+    if not plan_path:
+        return None
+    plan_path = Path(plan_path)
+    if not plan_path.is_absolute() and not plan_path.exists():
+        plan_path = Path(presets).parent / plan_path
+    return CropPlan.load(plan_path)
+
+
+def make_sink(folder, presets, camera_configs, writer, fps, camera=None, record_format=None):
+    """Pick the frame sink for a recording from the preset and environment.
+
+    ``MMRECORDER_RECORD_FORMAT`` (or the preset ``record_format``) selects
+    ``"jpeg"`` (default), ``"video"`` or ``"raw"`` output, or
+    ``"native-jpeg"``/``"native-video"`` written by ``camera``'s pipeline.
+    ``record_format`` overrides both.
+    """
+    plan = load_crop_plan(presets, camera_configs)
+    record_format = record_format or get_record_format(camera_configs)
+    if record_format in NATIVE_FORMATS:
+        if plan is not None:
+            print("Crop plans are not applied by native record formats; keeping the preset cropping")
+        print(f"Recording with the GStreamer {record_format} branch")
+        return NativeSink(folder, camera, record_format)
+    elif record_format == "video":
+        print(f"Streaming frames into ffmpeg at {fps} fps")
+        return VideoSink(folder, fps, cropping=camera_configs["cropping"], plan=plan)
+    elif record_format == "raw":
+        print("Appending raw frames to chunk files")
+        return RawSink(folder, camera_configs["cropping"])
+    elif record_format != "jpeg":
+        raise ValueError(f"Unknown record format: {record_format}")
+
+    if plan is not None:
+        print(f"Cropping at capture time into {len(plan)} ROIs")
+        return CropPlanSink(folder, plan, writer)
+    return JpegSink(folder, camera_configs["cropping"], writer)
+
+
+def finish_recording(folder, sink):
+    """Close the sink and rename the folder for the next processing stage."""
+    sink.close()
+    folder = Path(folder)
+    finished = folder.parent / (folder.name + sink.finished_suffix)
+    folder.rename(finished)
+    return finished
@@ -0,0 +1,151 @@
+"""Serial link to the Arduino that pulses the camera trigger input.
+
+A reader thread blocks on the port and turns incoming bytes into
+newline-framed messages stamped with ``time.monotonic()`` on arrival, so
+waiting for the Arduino costs no CPU.  If the port fails (e.g. the Arduino
+is unplugged), the reader stops and the waiting methods raise its error once
+the messages received before it are consumed.  The protocol of
+``arduino/ImageCapture_Trigger.ino``::
+
+    Arduino  -> "Arduino Ready"                  after every reset
+    recorder -> "start\\n", "{fps}*", "{duration}*"
+    Arduino  -> "Received updated fps value from Python: {fps}"
+    Arduino  -> "Received updated duration value from Python: {duration}"
+    Arduino  -> "pulses {count}"                  about once per second
+    Arduino  -> "done"                            after the last pulse
+"""
+
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import serial
+
+READY = "Arduino Ready"
+DONE = "done"
+FPS_ACK = "Received updated fps value from Python: "
+DURATION_ACK = "Received updated duration value from Python: "
+PULSES = "pulses "
+
+Message = namedtuple("Message", "time text")
+
+
+class TriggerLink:
+    """Line-framed, timestamped connection to the trigger Arduino."""
+
+    def __init__(self, port, baudrate=9600, read_timeout=0.5):
+        self.serial = serial.Serial(port, baudrate, timeout=read_timeout)
+        self.messages = []
+        self.pulses = []
+        self.done_time = None
+        self.error = None
+        self._inbox = queue.Queue()
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read, name="trigger-link", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        buffer = b""
+        while not self._stop.is_set():
+            try:
+                chunk = self.serial.read(max(1, self.serial.in_waiting))
+            except (serial.SerialException, OSError, TypeError) as error:
+                if self._stop.is_set():
+                    break
+                self.error = error
+                # Wakes up wait_for, which raises the error
+                self._inbox.put(None)
+                return
+            if not chunk:
+                continue
+            arrival = time.monotonic()
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                self._dispatch(Message(arrival, line.decode("utf-8", "replace").strip()))
+
+    def _dispatch(self, message):
+        self.messages.append(message)
+        if message.text.startswith(PULSES):
+            try:
+                self.pulses.append((message.time, int(message.text[len(PULSES):])))
+            except ValueError:
+                pass
+        elif message.text == DONE:
+            self.done_time = message.time
+        self._inbox.put(message)
+
+    def send(self, text):
+        self.serial.write(text.encode("utf-8"))
+        self.serial.flush()
+
+    def wait_for(self, matches, timeout):
+        """Return the first message for which ``matches(text)`` is true.
+
+        Messages received before it are skipped.  Raises ``TimeoutError``
+        when nothing matches within ``timeout`` seconds (None waits forever),
+        and the reader's error once the serial port has failed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError("No matching message from the Arduino")
+            try:
+                message = self._inbox.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError("No matching message from the Arduino") from None
+            if message is None:
+                # Left in place for the next wait
+                self._inbox.put(None)
+                raise self.error
+            if matches(message.text):
+                return message
+
+    def wait_ready(self, timeout=10):
+        """Wait for the greeting the Arduino prints after (re)booting."""
+        return self.wait_for(lambda text: text == READY, timeout)
+
+    def start(self, fps, duration, timeout=10):
+        """Start a pulse train and wait until the Arduino acknowledges it.
+
+        Returns the acknowledgement messages; raises ``RuntimeError`` if the
+        Arduino echoes different values.
+        """
+        self.send("start\n")
+        self.send(f"{fps}*")
+        self.send(f"{duration}*")
+        acks = []
+        for prefix, expected in ((FPS_ACK, fps), (DURATION_ACK, duration)):
+            try:
+                message = self.wait_for(lambda text: text.startswith(prefix), timeout)
+            except TimeoutError:
+                raise RuntimeError("No acknowledgment received from Arduino") from None
+            echoed = message.text[len(prefix):]
+            if echoed != str(expected):
+                raise RuntimeError(f"Arduino acknowledged {echoed!r} instead of {expected!r}")
+            acks.append(message)
+        return acks
+
+    def wait_done(self, timeout=None):
+        """Wait for "done"; returns its arrival time or None on timeout.
+
+        Raises the serial error if the link failed before "done" arrived.
+        """
+        if self.done_time is not None:
+            return self.done_time
+        try:
+            return self.wait_for(lambda text: text == DONE, timeout).time
+        except TimeoutError:
+            return None
+
+    @property
+    def pulse_count(self):
+        """Last pulse count reported by the Arduino, or None."""
+        return self.pulses[-1][1] if self.pulses else None
+
+    def close(self):
+        self._stop.set()
+        self.serial.close()
+        self._reader.join(timeout=2)
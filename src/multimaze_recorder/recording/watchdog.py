@@ -0,0 +1,275 @@
+"""Recording health watchdog.
+
+The recorders call ``HealthWatchdog.frame()`` for every saved frame, which
+only appends a timestamp.  Once per ``interval`` a background thread turns
+these into instantaneous and rolling fps and inter-frame gap statistics,
+reads the writer's queue depth and write latency (``ImageWriter.stats``),
+times an fsync of a small probe file on the recording disk, and appends the
+result as one JSON line to ``health.jsonl`` in the recording folder::
+
+    {"time": ..., "elapsed": 12.0, "frames": 348, "fps": 29.0,
+     "rolling_fps": 28.9, "max_gap_ms": 41.2, "gap_outliers": 0,
+     "queued": 3, "write_p99_ms": 18.0, "dropped": 0, "fsync_ms": 2.1,
+     "alarms": []}
+
+Alarms are raised when thresholds are crossed, printed when they start and
+when they clear, and listed in every line while active, so the GUI can
+follow a recording by reading the file (see ``read_health``).  A failing
+fsync probe (e.g. on a full disk) raises a ``disk`` alarm, and any other
+error while sampling a ``watchdog`` alarm; sampling goes on either way.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+HEALTH_FILE = "health.jsonl"
+PROBE_FILE = ".health_probe"
+
+HEALTH_INTERVAL = float(os.environ.get("MMRECORDER_HEALTH_INTERVAL", "1"))
+ALARM_FPS_RATIO = float(os.environ.get("MMRECORDER_ALARM_FPS_RATIO", "0.9"))
+ALARM_GAP_FRAMES = float(os.environ.get("MMRECORDER_ALARM_GAP_FRAMES", "5"))
+ALARM_QUEUE = int(os.environ.get("MMRECORDER_ALARM_QUEUE", "128"))
+ALARM_FSYNC_MS = float(os.environ.get("MMRECORDER_ALARM_FSYNC_MS", "500"))
+
+ROLLING_SECONDS = 10
+# Gaps longer than this many frame periods count as outliers
+GAP_OUTLIER_FRAMES = 1.5
+
+
+class HealthWatchdog:
+    """Track the health of a recording into ``folder`` at ``fps``.
+
+    ``stats`` is an optional callable returning a dict with some of
+    ``queued``, ``p99_ms``, ``dropped``, ``spilled`` and ``written`` (e.g.
+    ``ImageWriter.stats``).  ``on_alarm`` is called from the watchdog thread
+    with the list of alarms raised in an interval.
+
+    With ``count_frames=False`` (native recording, where frames never reach
+    Python) the rates follow the ``written`` count of ``stats`` instead of
+    ``frame()`` calls, and are left out if there is no such count.
+    """
+
+    def __init__(
+        self, folder, fps, stats=None, interval=HEALTH_INTERVAL, on_alarm=None,
+        count_frames=True,
+    ):
+        self.folder = Path(folder)
+        self.fps = fps
+        self.count_frames = count_frames
+        self.stats = stats
+        self.interval = interval
+        self.on_alarm = on_alarm
+        self.frames = 0
+        self.active = set()
+        self.alarm_count = 0
+        self.last = None
+        self._times = deque(maxlen=max(int(fps * ROLLING_SECONDS * 2), 64))
+        self._last_time = None
+        self._written = deque(maxlen=ROLLING_SECONDS * 4)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+
+    def frame(self, t=None):
+        """Count one saved frame (at ``time.monotonic()`` ``t``)."""
+        self._times.append(time.monotonic() if t is None else t)
+
+    def start(self):
+        self._start = time.monotonic()
+        self._log = open(self.folder / HEALTH_FILE, "w")
+        self._thread.start()
+        return self
+
+    def _fsync_ms(self):
+        start = time.perf_counter()
+        with open(self.folder / PROBE_FILE, "wb") as f:
+            f.write(b"\0" * 4096)
+            f.flush()
+            os.fsync(f.fileno())
+        return (time.perf_counter() - start) * 1000
+
+    def sample(self, now=None):
+        """Health of the last interval as a dict, with its ``alarms``."""
+        now = time.monotonic() if now is None else now
+        stats = self.stats() if self.stats is not None else {}
+        window = min(ROLLING_SECONDS, now - self._start)
+        health = {"time": round(time.time(), 3), "elapsed": round(now - self._start, 3)}
+        if self.count_frames:
+            health.update(self._frame_rates(now, window))
+        elif "written" in stats:
+            health.update(self._written_rates(now, window, stats["written"]))
+        else:
+            health.update(
+                dict.fromkeys(("frames", "fps", "rolling_fps", "max_gap_ms", "gap_outliers"))
+            )
+
+        for key, name in (
+            ("queued", "queued"), ("p99_ms", "write_p99_ms"), ("dropped", "dropped"),
+            ("spilled", "spilled"), ("written", "written"),
+        ):
+            if key in stats:
+                value = stats[key]
+                health[name] = round(value, 2) if isinstance(value, float) else value
+        try:
+            health["fsync_ms"] = round(self._fsync_ms(), 2)
+        except OSError as error:
+            health["fsync_ms"] = None
+            health["fsync_error"] = str(error)
+        health["alarms"] = self.check(health, warmed_up=now - self._start >= ROLLING_SECONDS)
+        return health
+
+    def _frame_rates(self, now, window):
+        times = np.array(self._times)
+        recent = times[times > now - self.interval]
+        rolling = times[times > now - window]
+
+        # Gaps of this interval, including the one since the previous interval
+        edges = recent if self._last_time is None else np.r_[self._last_time, recent]
+        gaps = np.diff(edges)
+        if len(times):
+            self._last_time = times[-1]
+            # A stall that has not ended yet is a gap as well
+            gaps = np.r_[gaps, now - times[-1]]
+        self.frames += len(recent)
+        return {
+            "frames": self.frames,
+            "fps": round(len(recent) / self.interval, 2),
+            "rolling_fps": round(len(rolling) / window, 2) if window > 0 else 0.0,
+            "max_gap_ms": round(float(gaps.max()) * 1000, 1) if len(gaps) else None,
+            "gap_outliers": int((gaps > GAP_OUTLIER_FRAMES / self.fps).sum()),
+        }
+
+    def _written_rates(self, now, window, written):
+        self._written.append((now, written))
+        previous_time, previous = (
+            self._written[-2] if len(self._written) > 1 else (self._start, 0)
+        )
+        oldest_time, oldest = next(
+            ((t, n) for t, n in self._written if t >= now - window), (now, written)
+        )
+        if oldest_time == now:
+            oldest_time, oldest = previous_time, previous
+        self.frames = written
+        return {
+            "frames": written,
+            "fps": round((written - previous) / (now - previous_time), 2),
+            "rolling_fps": round((written - oldest) / (now - oldest_time), 2),
+            "max_gap_ms": None,
+            "gap_outliers": None,
+        }
+
+    def check(self, health, warmed_up=True):
+        """Names and descriptions of the thresholds ``health`` crosses."""
+        alarms = []
+        if (
+            warmed_up
+            and health["rolling_fps"] is not None
+            and health["rolling_fps"] < ALARM_FPS_RATIO * self.fps
+        ):
+            alarms.append(
+                f"fps: {health['rolling_fps']:.1f} over {ROLLING_SECONDS} s, "
+                f"expected {self.fps}"
+            )
+        if health["max_gap_ms"] is not None and (
+            health["max_gap_ms"] > ALARM_GAP_FRAMES * 1000 / self.fps
+        ):
+            alarms.append(f"gap: no frame for {health['max_gap_ms']:.0f} ms")
+        if health.get("queued", 0) > ALARM_QUEUE:
+            alarms.append(f"queue: {health['queued']} images waiting for the writer")
+        if self.last is not None and health.get("dropped", 0) > self.last.get("dropped", 0):
+            alarms.append(f"dropped: {health['dropped']} images dropped by the writer")
+        if health["fsync_ms"] is None:
+            alarms.append(f"disk: fsync probe failed: {health['fsync_error']}")
+        elif health["fsync_ms"] > ALARM_FSYNC_MS:
+            alarms.append(f"disk: fsync took {health['fsync_ms']:.0f} ms")
+        return alarms
+
+    def _report(self, health):
+        names = {alarm.split(":")[0] for alarm in health["alarms"]}
+        raised = [a for a in health["alarms"] if a.split(":")[0] not in self.active]
+        cleared = self.active - names
+        for alarm in raised:
+            print(f"ALARM {alarm}", file=sys.stderr)
+        for name in sorted(cleared):
+            print(f"Cleared alarm: {name}", file=sys.stderr)
+        self.active = names
+        if raised:
+            self.alarm_count += len(raised)
+            if self.on_alarm is not None:
+                self.on_alarm(raised)
+
+    def _run(self):
+        next_time = self._start
+        while True:
+            next_time += self.interval
+            if self._stop.wait(max(0.0, next_time - time.monotonic())):
+                break
+            try:
+                health = self.sample()
+            except Exception as error:
+                now = time.monotonic()
+                health = {
+                    "time": round(time.time(), 3),
+                    "elapsed": round(now - self._start, 3),
+                    "alarms": [f"watchdog: error while sampling: {error}"],
+                }
+            try:
+                self._write(health)
+            except OSError as error:
+                print(f"Could not write {HEALTH_FILE}: {error}", file=sys.stderr)
+
+    def _write(self, health):
+        self._report(health)
+        self.last = health
+        self._log.write(json.dumps(health) + "\n")
+        self._log.flush()
+
+    def stop(self):
+        """Stop the thread and remove the probe file; returns the last sample."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._log.close()
+        probe = self.folder / PROBE_FILE
+        if probe.exists():
+            probe.unlink()
+        if self.alarm_count:
+            print(f"The watchdog raised {self.alarm_count} alarms, see {HEALTH_FILE}")
+        return self.last
+
+
+def read_health(folder):
+    """The last line of ``health.jsonl`` in ``folder``, or None."""
+    path = Path(folder) / HEALTH_FILE
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+    return None
+
+
+def format_health(health):
+    parts = []
+    if health.get("fps") is not None:
+        parts.append(f"{health['fps']:.1f} fps (rolling {health['rolling_fps']:.1f})")
+    if health.get("max_gap_ms") is not None:
+        parts.append(f"max gap {health['max_gap_ms']:.0f} ms")
+    if "queued" in health:
+        parts.append(f"queue {health['queued']}")
+    if health.get("fsync_ms") is not None:
+        parts.append(f"fsync {health['fsync_ms']:.0f} ms")
+    return " | ".join(parts)
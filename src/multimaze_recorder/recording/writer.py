@@ -0,0 +1,470 @@
+"""Bounded JPEG writers shared by the snap and trigger recorders.
+
+Images are encoded and written by a fixed pool of workers fed from a bounded
+queue, so a stalled disk can no longer fill RAM with pending frames.  What
+happens when the queue is full is an explicit policy:
+
+``block``
+    The recorder waits until a worker frees a slot (default).
+``drop``
+    The image is discarded; dropped filenames are listed in
+    ``dropped_images.txt`` next to the recording when the writer shuts down.
+``spill``
+    The raw image is appended to a ``spill.raw`` sidecar, which is a single
+    sequential write.  Spilled images are encoded to their final filenames
+    during ``shutdown`` and the sidecar is removed.
+
+``ImageWriter`` encodes in threads.  ``ProcessImageWriter`` encodes in worker
+processes that read the pixels from ``multiprocessing.shared_memory`` slots,
+so JPEG encoding is spread over all cores without pickling frames.
+
+Queue depth, write latency percentiles and throughput are available from
+``stats`` and are appended once per second to ``writer_stats.csv``.
+"""
+
+import csv
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+WRITER_WORKERS = int(os.environ.get("MMRECORDER_WRITER_WORKERS", "5"))
+WRITER_QUEUE_SIZE = int(os.environ.get("MMRECORDER_WRITER_QUEUE", "256"))
+WRITER_POLICY = os.environ.get("MMRECORDER_WRITER_POLICY", "block")
+WRITER_PROCESSES = os.environ.get("MMRECORDER_WRITER_PROCESSES")
+
+POLICIES = ("block", "drop", "spill")
+ENCODERS = ("cv2", "pil")
+SPILL_FILE = "spill.raw"
+SPILL_INDEX = "spill.csv"
+DROPPED_FILE = "dropped_images.txt"
+STATS_FILE = "writer_stats.csv"
+
+# Seconds between checks that the encoder processes are alive while waiting for a slot
+SLOT_WAIT = 1.0
+
+_STOP = object()
+
+
+def _encode_and_save(path, image, quality, encoder="cv2"):
+    """Write ``image`` as a JPEG with libjpeg-turbo (cv2) or PIL; return the file size."""
+    if encoder == "pil":
+        kwargs = {"quality": quality} if quality is not None else {}
+        Image.fromarray(image, mode="L").save(path, **kwargs)
+        return os.path.getsize(path)
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if quality is not None else []
+    ok, encoded = cv2.imencode(Path(path).suffix or ".jpg", image, params)
+    if not ok:
+        raise RuntimeError(f"Could not encode {path}")
+    with open(path, "wb") as f:
+        f.write(encoded)
+    return encoded.nbytes
+
+
+class ImageWriter:
+    """Pool of writer threads behind a bounded queue.
+
+    ``folder`` receives the spill sidecar, the dropped-image list and the
+    statistics log.  Images passed to ``write`` must not be modified
+    afterwards; sinks hand over private copies.  A ``quality`` given here
+    (e.g. from the preset) takes precedence over the one passed to ``write``.
+    """
+
+    # Whether ``write`` is done with the image when it returns
+    copies_images = False
+
+    def __init__(self, folder, workers=WRITER_WORKERS, max_pending=WRITER_QUEUE_SIZE,
+                 policy=WRITER_POLICY, report_interval=1.0, encoder="cv2", quality=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown writer policy: {policy} (expected one of {POLICIES})")
+        if encoder not in ENCODERS:
+            raise ValueError(f"Unknown JPEG encoder: {encoder} (expected one of {ENCODERS})")
+        self.folder = Path(folder)
+        self.policy = policy
+        self.encoder = encoder
+        self.quality = quality
+        self.report_interval = report_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._bytes = 0
+        self._written = 0
+        self._errors = 0
+        self._dropped = []
+        self._spilled = 0
+        self._spill = None
+        self._spill_index = None
+        self._closed = threading.Event()
+        self._last_report = (time.perf_counter(), 0)
+        self.last_stats = self._snapshot()
+
+        self._start_workers(workers)
+        self._reporter = threading.Thread(target=self._report, daemon=True)
+        self._reporter.start()
+
+    def _start_workers(self, workers):
+        self._workers = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _quality(self, quality):
+        return self.quality if self.quality is not None else quality
+
+    def write(self, path, image, quality=None):
+        """Queue ``image`` to be saved as ``path`` according to the full-queue policy.
+
+        Returns False if the image was dropped.
+        """
+        item = (str(path), image, self._quality(quality))
+        if self.policy == "block":
+            self._queue.put(item)
+            return True
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            return self._overflow([item])
+        return True
+
+    def write_many(self, items, quality=None):
+        """Queue several ``(path, image)`` pairs, e.g. all ROIs of one frame.
+
+        Under the drop policy the items are dropped together unless all of
+        them fit, so the ROI folders of a recording hold the same frames.
+        """
+        items = list(items)
+        if self.policy == "drop" and self._queue.maxsize:
+            free = self._queue.maxsize - self._queue.qsize()
+            if free < min(len(items), self._queue.maxsize):
+                quality = self._quality(quality)
+                return self._overflow([(str(path), image, quality) for path, image in items])
+        written = True
+        for path, image in items:
+            written = self.write(path, image, quality) and written
+        return written
+
+    def _overflow(self, items):
+        """Apply the drop or spill policy to items that found the writer full."""
+        with self._lock:
+            if self.policy == "drop":
+                self._dropped.extend(path for path, _, _ in items)
+                return False
+            for item in items:
+                self._spill_image(*item)
+        return True
+
+    def _spill_image(self, path, image, quality):
+        if self._spill is None:
+            self._spill = open(self.folder / SPILL_FILE, "ab")
+            self._spill_index = open(self.folder / SPILL_INDEX, "a", newline="")
+        image = np.ascontiguousarray(image)
+        offset = self._spill.tell()
+        self._spill.write(image.tobytes())
+        csv.writer(self._spill_index).writerow(
+            [path, image.shape[0], image.shape[1], offset, quality or ""]
+        )
+        self._spilled += 1
+
+    def _record(self, written, nbytes, latency, errors=0):
+        with self._lock:
+            self._latencies.append(latency)
+            self._bytes += nbytes
+            self._written += written
+            self._errors += errors
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            path, image, quality = item
+            start = time.perf_counter()
+            try:
+                nbytes = _encode_and_save(path, image, quality, self.encoder)
+            except Exception as error:
+                print(f"Error writing {path}: {error}")
+                with self._lock:
+                    self._errors += 1
+                continue
+            self._record(1, nbytes, time.perf_counter() - start)
+
+    def _pending(self):
+        return self._queue.qsize()
+
+    def _snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+            written_bytes = self._bytes
+            stats = {
+                "queued": self._pending(),
+                "written": self._written,
+                "dropped": len(self._dropped),
+                "spilled": self._spilled,
+                "errors": self._errors,
+                "p50_ms": float(np.percentile(latencies, 50) * 1000),
+                "p95_ms": float(np.percentile(latencies, 95) * 1000),
+                "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            }
+        last_time, last_bytes = self._last_report
+        now = time.perf_counter()
+        stats["mb_per_s"] = (written_bytes - last_bytes) / max(now - last_time, 1e-9) / 1e6
+        self._last_report = (now, written_bytes)
+        return stats
+
+    def _report(self):
+        with open(self.folder / STATS_FILE, "w", newline="") as f:
+            log = None
+            while not self._closed.wait(self.report_interval):
+                self.last_stats = self._snapshot()
+                if log is None:
+                    log = csv.DictWriter(f, fieldnames=["time", *self.last_stats])
+                    log.writeheader()
+                log.writerow({"time": f"{time.time():.3f}", **self.last_stats})
+                f.flush()
+
+    def stats(self):
+        """Statistics of the last reporting interval."""
+        return self.last_stats
+
+    def format_stats(self):
+        s = self.last_stats
+        text = (
+            f"queue {s['queued']} | write p50 {s['p50_ms']:.0f} ms "
+            f"p99 {s['p99_ms']:.0f} ms | {s['mb_per_s']:.1f} MB/s"
+        )
+        if s["dropped"]:
+            text += f" | dropped {s['dropped']}"
+        if s["spilled"]:
+            text += f" | spilled {s['spilled']}"
+        return text
+
+    def _stop_workers(self, wait):
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def shutdown(self, wait=True):
+        """Drain the queue, stop the workers and settle dropped or spilled images."""
+        self._stop_workers(wait)
+        self._closed.set()
+        self._reporter.join()
+
+        if self._dropped:
+            (self.folder / DROPPED_FILE).write_text("\n".join(self._dropped) + "\n")
+            print(f"Writer dropped {len(self._dropped)} images, see {DROPPED_FILE}")
+        if self._spill is not None:
+            self._spill.close()
+            self._spill_index.close()
+            print(f"Writing {self._spilled} spilled images...")
+            recover_spill(self.folder, self.encoder)
+
+
+def _encode_worker(shm_name, encoder, tasks, results):
+    """Worker process: encode images found in shared memory slots."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buffer = np.ndarray((shm.size,), dtype=np.uint8, buffer=shm.buf)
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, items, quality = task
+            start = time.perf_counter()
+            written = nbytes = errors = 0
+            image = None
+            for path, offset, height, width in items:
+                image = buffer[offset:offset + height * width].reshape(height, width)
+                try:
+                    nbytes += _encode_and_save(path, image, quality, encoder)
+                    written += 1
+                except Exception as error:
+                    print(f"Error writing {path}: {error}")
+                    errors += 1
+            # Views on the shared buffer must be gone before shm.close()
+            image = None
+            results.put((slot, written, nbytes, time.perf_counter() - start, errors))
+        del buffer
+    finally:
+        shm.close()
+
+
+class ProcessImageWriter(ImageWriter):
+    """JPEG encoding in worker processes fed through shared-memory slots.
+
+    ``slot_bytes`` should be the size of a full camera frame: ``write_many``
+    packs all images of one frame (e.g. its ROIs) into a single slot, and one
+    small task tuple with offsets is all that crosses the process boundary.
+    ``slots`` bounds the number of frames in flight; the full-queue policy
+    applies when none is free.  Images are copied into their slot before
+    ``write`` returns, so they may be views on a borrowed frame.  A worker
+    that dies takes the slots it was encoding with it, so waiting for a slot
+    raises once one has died instead of blocking the recorder for good.
+    """
+
+    copies_images = True
+
+    def __init__(self, folder, slot_bytes, processes=4, slots=None,
+                 policy=WRITER_POLICY, report_interval=1.0, encoder="cv2", quality=None):
+        self.slot_bytes = slot_bytes
+        self.slots = slots or 4 * processes
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.slots)
+        self._buffer = np.ndarray((self._shm.size,), dtype=np.uint8, buffer=self._shm.buf)
+        self._free = queue.Queue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+        super().__init__(
+            folder, workers=processes, max_pending=self.slots, policy=policy,
+            report_interval=report_interval, encoder=encoder, quality=quality,
+        )
+
+    def _start_workers(self, processes):
+        ctx = mp.get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._workers = [
+            ctx.Process(
+                target=_encode_worker,
+                args=(self._shm.name, self.encoder, self._tasks, self._results),
+                daemon=True,
+            )
+            for _ in range(processes)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        while True:
+            result = self._results.get()
+            if result is None:
+                break
+            slot, written, nbytes, latency, errors = result
+            self._free.put(slot)
+            self._record(written, nbytes, latency, errors)
+
+    def _pending(self):
+        return self.slots - self._free.qsize()
+
+    def write(self, path, image, quality=None):
+        return self.write_many([(path, image)], quality)
+
+    def write_many(self, items, quality=None):
+        quality = self._quality(quality)
+        items = [(str(path), image) for path, image in items]
+        # Frames larger than a slot (overlapping ROIs) are split over several
+        batch, size, written = [], 0, True
+        for path, image in items:
+            if image.nbytes > self.slot_bytes:
+                raise ValueError(f"{path} does not fit in a {self.slot_bytes} byte slot")
+            if size + image.nbytes > self.slot_bytes:
+                written = self._submit(batch, quality) and written
+                batch, size = [], 0
+            batch.append((path, image))
+            size += image.nbytes
+        if batch:
+            written = self._submit(batch, quality) and written
+        return written
+
+    def _check_workers(self):
+        dead = [worker for worker in self._workers if not worker.is_alive()]
+        if dead:
+            codes = ", ".join(str(worker.exitcode) for worker in dead)
+            raise RuntimeError(
+                f"{len(dead)} JPEG encoder process(es) died (exit code {codes}); "
+                f"their frames are lost"
+            )
+
+    def _next_slot(self):
+        if self.policy != "block":
+            try:
+                return self._free.get_nowait()
+            except queue.Empty:
+                self._check_workers()
+                return None
+        while True:
+            try:
+                return self._free.get(timeout=SLOT_WAIT)
+            except queue.Empty:
+                self._check_workers()
+
+    def _submit(self, batch, quality):
+        slot = self._next_slot()
+        if slot is None:
+            return self._overflow([(path, image, quality) for path, image in batch])
+
+        offset = slot * self.slot_bytes
+        task_items = []
+        for path, image in batch:
+            height, width = image.shape
+            # Copied straight from a view on the frame, without an intermediate copy
+            self._buffer[offset:offset + image.nbytes].reshape(height, width)[...] = image
+            task_items.append((path, offset, height, width))
+            offset += image.nbytes
+        self._tasks.put((slot, task_items, quality))
+        return True
+
+    def _stop_workers(self, wait):
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._results.put(None)
+        self._collector.join()
+        del self._buffer
+        self._shm.close()
+        self._shm.unlink()
+
+
+def make_writer(folder, camera_configs):
+    """Build the image writer for a recording from the preset and environment.
+
+    Preset keys: ``jpeg_encoder`` (``"cv2"`` or ``"pil"``), ``jpeg_quality``
+    and ``writer_processes``; ``MMRECORDER_WRITER_PROCESSES`` overrides the
+    latter.  With 0 processes (default) JPEGs are encoded in threads.
+    """
+    encoder = camera_configs.get("jpeg_encoder", "cv2")
+    quality = camera_configs.get("jpeg_quality")
+    processes = int(WRITER_PROCESSES or camera_configs.get("writer_processes", 0))
+    if processes > 0:
+        fmt = camera_configs["format"]
+        print(f"Encoding JPEGs in {processes} worker processes ({encoder})")
+        return ProcessImageWriter(
+            folder, fmt["width"] * fmt["height"], processes=processes,
+            encoder=encoder, quality=quality,
+        )
+    return ImageWriter(folder, encoder=encoder, quality=quality)
+
+
+def recover_spill(folder, encoder="cv2"):
+    """Encode the images of a spill sidecar to their final paths, then remove it."""
+    folder = Path(folder)
+    spill_path = folder / SPILL_FILE
+    index_path = folder / SPILL_INDEX
+    if not index_path.exists():
+        return 0
+
+    count = 0
+    data = np.memmap(spill_path, dtype=np.uint8, mode="r")
+    with open(index_path, newline="") as f:
+        for path, height, width, offset, quality in csv.reader(f):
+            height, width, offset = int(height), int(width), int(offset)
+            image = data[offset:offset + height * width].reshape(height, width)
+            _encode_and_save(path, image, int(quality) if quality else None, encoder)
+            count += 1
+    del data
+    spill_path.unlink()
+    index_path.unlink()
+    return count
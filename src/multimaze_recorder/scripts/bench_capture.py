@@ -0,0 +1,322 @@
+"""Benchmark the capture path of the recorders on the simulated camera.
+
+Every combination of the swept settings is recorded by the unmodified
+``snap`` or ``trigger`` recorder, in its own process with
+``MMRECORDER_CAMERA=sim``, so that environment-driven settings apply and the
+peak memory of one case does not carry over to the next.  Each case reports:
+
+    sustained_fps       saved frames per second of camera time
+    drop_rate           share of the camera's frames that were not saved
+    latency_ms          exposure to image file on disk (per-frame formats),
+                        or exposure to the recorder otherwise; p50/p95/p99/max
+    peak_rss_mb         recorder process, and its encoder children
+    disk_mb_per_s       bytes written from the first exposure until the recorder
+                        returned, so draining the writer is included
+
+The synthetic source is deterministic and the results are written as JSON
+together with a description of the machine, so runs can be compared.
+
+    mmrecorder-bench-capture --fps 30 60 --resolution 1920x1200 \\
+        --format jpeg video --workers 2 5 --output bench.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import numpy as np
+
+_PACKAGE_CONFIG_DIR = Path(__file__).parent.parent / "gui" / "config"
+DEFAULT_PRESETS = str(_PACKAGE_CONFIG_DIR / "Presets" / "standard_set.json")
+
+CASE_TIMEOUT = 600
+
+
+def _percentiles(values):
+    if len(values) == 0:
+        return None
+    values = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def _folder_bytes(folder):
+    return sum(p.stat().st_size for p in Path(folder).rglob("*") if p.is_file())
+
+
+def measure(folder, mode, fps, duration, elapsed, end_time, clock_offset):
+    """Metrics of a finished recording ``folder`` made by this process.
+
+    ``end_time`` is the ``time.monotonic()`` at which the recorder returned.
+    """
+    from multimaze_recorder.recording.frame_log import load_frame_log
+
+    log = load_frame_log(folder)
+    saved = len(log)
+    exposures = log["pts"].astype(np.float64) / 1e9
+    if mode == "trigger":
+        expected = fps * duration
+    else:
+        # The simulated camera free-runs on a fixed grid of exposures
+        expected = int(round((exposures[-1] - exposures[0]) * fps)) + 1 if saved else 0
+    span = (exposures[-1] - exposures[0]) + 1 / fps if saved else 0
+
+    latencies = []
+    for frame, exposure in zip(log["frame"], exposures):
+        path = Path(folder) / f"image{frame}.jpg"
+        if not path.exists():
+            latencies = []
+            break
+        latencies.append(path.stat().st_mtime - clock_offset - exposure)
+    latency_kind = "exposure_to_disk"
+    if not latencies:
+        latencies = log["host_time"] - exposures
+        latency_kind = "exposure_to_recorder"
+
+    written = _folder_bytes(folder)
+    window = end_time - exposures[0] if saved else elapsed
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "frames_saved": saved,
+        "frames_expected": expected,
+        "sustained_fps": round(saved / span, 2) if span else 0.0,
+        "drop_rate": round(1 - saved / expected, 4) if expected else None,
+        "latency_kind": latency_kind,
+        "latency_ms": _percentiles(latencies),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(self_usage.ru_maxrss / 1024, 1),
+        "children_peak_rss_mb": round(children_usage.ru_maxrss / 1024, 1),
+        "bytes_written": written,
+        "elapsed_s": round(elapsed, 3),
+        "disk_mb_per_s": round(written / window / 1e6, 2) if window > 0 else 0.0,
+    }
+
+
+def run_case(case_file):
+    """Child process: record one case with the real recorder and save its metrics."""
+    case = json.loads(Path(case_file).read_text())
+    recorder = case["mode"]
+    if recorder == "trigger":
+        from multimaze_recorder.scripts import trigger as module
+    else:
+        from multimaze_recorder.scripts import snap as module
+
+    sys.argv = [recorder, case["name"], str(case["fps"]), str(case["duration"]), case["presets"]]
+    clock_offset = time.time() - time.monotonic()
+    start = time.perf_counter()
+    module.main()
+    end_time = time.monotonic()
+    elapsed = time.perf_counter() - start
+
+    (folder,) = Path(case["local_path"]).glob(f"{case['name']}_*")
+    result = measure(
+        folder, recorder, case["fps"], case["duration"], elapsed, end_time, clock_offset
+    )
+    Path(case["result"]).write_text(json.dumps(result))
+
+
+def write_presets(presets, path, width, height, fps, jpeg_encoder, quality):
+    """Copy of ``presets`` recording full ``width`` x ``height`` frames at ``fps``."""
+    with open(presets) as f:
+        configs = json.load(f)
+    configs["format"].update(width=width, height=height, framerate=f"{fps}/1")
+    configs["cropping"] = {"Left": 0, "Top": 0, "Right": width, "Bottom": height}
+    configs["jpeg_encoder"] = jpeg_encoder
+    if quality is not None:
+        configs["jpeg_quality"] = quality
+    configs.pop("crop_plan", None)
+    configs.pop("record_format", None)
+    Path(path).write_text(json.dumps(configs, indent=4))
+
+
+def environment():
+    try:
+        package_version = version("multimaze_recorder")
+    except PackageNotFoundError:
+        package_version = None
+    return {
+        "package_version": package_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def _resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the recorders' capture path on the simulated camera."
+    )
+    parser.add_argument("--mode", choices=("snap", "trigger"), default="snap",
+                        help="Recorder to drive: snap (free-running) or trigger (software pulses)")
+    parser.add_argument("--fps", type=int, nargs="+", default=[30])
+    parser.add_argument("--resolution", type=_resolution, nargs="+", default=[(1920, 1200)],
+                        help="Frame sizes as WIDTHxHEIGHT")
+    parser.add_argument("--format", nargs="+", default=["jpeg"],
+                        choices=("jpeg", "video", "raw"), help="Record formats")
+    parser.add_argument("--jpeg-encoder", nargs="+", default=["cv2"], choices=("cv2", "pil"))
+    parser.add_argument("--quality", type=int, nargs="+", default=[None],
+                        help="JPEG qualities (default: the recorder's)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[5],
+                        help="Writer threads")
+    parser.add_argument("--processes", type=int, nargs="+", default=[0],
+                        help="Writer processes (0 encodes in threads)")
+    parser.add_argument("--duration", type=int, default=10, help="Seconds per case")
+    parser.add_argument("--source", default="pattern",
+                        help="Simulated camera source (see MMRECORDER_SIM_SOURCE)")
+    parser.add_argument("--presets", default=DEFAULT_PRESETS)
+    parser.add_argument("--scratch", help="Folder for the recordings (default: a temporary one)")
+    parser.add_argument("--keep", action="store_true", help="Keep the recordings")
+    parser.add_argument("--output", help="JSON file for the results (default: stdout)")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def cases(args):
+    for fps, (width, height), record_format, encoder, quality, workers, processes in (
+        itertools.product(
+            args.fps, args.resolution, args.format, args.jpeg_encoder,
+            args.quality, args.workers, args.processes,
+        )
+    ):
+        if record_format != "jpeg" and (
+            encoder != args.jpeg_encoder[0]
+            or quality != args.quality[0]
+            or processes != args.processes[0]
+        ):
+            # JPEG settings do not apply; run the format once per workers value
+            continue
+        yield {
+            "mode": args.mode,
+            "fps": fps,
+            "width": width,
+            "height": height,
+            "format": record_format,
+            "jpeg_encoder": encoder,
+            "quality": quality,
+            "workers": workers,
+            "processes": processes,
+            "duration": args.duration,
+            "source": args.source,
+        }
+
+
+def case_name(case):
+    """Folder name of the recording of ``case``."""
+    return "bench_{mode}_{fps}fps_{width}x{height}_{format}_{jpeg_encoder}_q{quality}_w{workers}_p{processes}".format(**case)
+
+
+def bench(case, scratch, presets):
+    """Run ``case`` in a child process; returns its metrics or an error."""
+    local_path = Path(scratch) / case_name(case)
+    local_path.mkdir(parents=True, exist_ok=True)
+    case_presets = local_path / "presets.json"
+    write_presets(
+        presets, case_presets, case["width"], case["height"], case["fps"],
+        case["jpeg_encoder"], case["quality"],
+    )
+    case_file = local_path / "case.json"
+    result_file = local_path / "result.json"
+    case_file.write_text(json.dumps({
+        **case,
+        "name": "recording",
+        "presets": str(case_presets),
+        "local_path": str(local_path),
+        "result": str(result_file),
+    }))
+
+    env = os.environ.copy()
+    env.update(
+        MMRECORDER_CAMERA="sim",
+        MMRECORDER_SIM_SOURCE=case["source"],
+        MMRECORDER_LOCAL_PATH=str(local_path),
+        MMRECORDER_RECORD_FORMAT=case["format"],
+        MMRECORDER_WRITER_WORKERS=str(case["workers"]),
+        MMRECORDER_WRITER_PROCESSES=str(case["processes"]),
+        MMRECORDER_PREFLIGHT="off",
+    )
+    env.pop("MMRECORDER_CROP_PLAN", None)
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-m", "multimaze_recorder.scripts.bench_capture",
+             "--run-case", str(case_file)],
+            env=env, capture_output=True, text=True,
+            timeout=case["duration"] + CASE_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        return {"error": "timed out"}
+    if completed.returncode != 0 or not result_file.exists():
+        lines = completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"]
+        return {"error": lines[-1]}
+    return json.loads(result_file.read_text())
+
+
+def summary_line(case, result):
+    label = (
+        f"{case['fps']:>4} fps {case['width']}x{case['height']} {case['format']:<5} "
+        f"w{case['workers']} p{case['processes']}"
+    )
+    if "error" in result:
+        return f"{label}  error: {result['error']}"
+    # Neither is known when no frame was saved
+    drop = "n/a" if result["drop_rate"] is None else f"{result['drop_rate']:.2%}"
+    latency = result["latency_ms"] or {}
+    p99 = f"{latency['p99']:.1f} ms" if "p99" in latency else "n/a"
+    return (
+        f"{label}  {result['sustained_fps']:>7.2f} fps  drop {drop}  "
+        f"p99 {p99}  {result['disk_mb_per_s']:.1f} MB/s  "
+        f"rss {result['peak_rss_mb']:.0f} MB"
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_case:
+        run_case(args.run_case)
+        return
+
+    scratch = args.scratch or tempfile.mkdtemp(prefix="mmrecorder-bench-")
+    results, case_folders = [], []
+    try:
+        for case in cases(args):
+            case_folders.append(Path(scratch) / case_name(case))
+            result = bench(case, scratch, args.presets)
+            print(summary_line(case, result), file=sys.stderr)
+            results.append({**case, "result": result})
+    finally:
+        if not args.keep:
+            # A given --scratch is usually the rig's recording disk: remove
+            # only the case folders the sweep wrote there
+            for folder in case_folders if args.scratch else [scratch]:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    report = json.dumps({"environment": environment(), "cases": results}, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
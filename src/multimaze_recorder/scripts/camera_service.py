@@ -0,0 +1,49 @@
+"""Keep the TIS camera open and share its frames with other processes.
+
+Recorders, the live stream and vision loops started while this service runs
+attach to it (see ``utilities.connect_camera``) instead of opening the
+camera themselves.
+"""
+
+import json
+import os
+import signal
+import sys
+from pathlib import Path
+from multimaze_recorder.utilities import configure_camera
+from multimaze_recorder.recording.broker import SOCKET_PATH, FrameBroker
+
+_PACKAGE_CONFIG_DIR = Path(__file__).parent.parent / "gui" / "config"
+DEFAULT_PRESETS = str(_PACKAGE_CONFIG_DIR / "Presets" / "standard_set.json")
+
+RING_SLOTS = int(os.environ.get("MMRECORDER_RING_SLOTS", "8"))
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    presets = sys.argv[1] if len(sys.argv) > 1 else os.environ.get(
+        "MMRECORDER_PRESETS", DEFAULT_PRESETS
+    )
+
+    with open(presets) as f:
+        camera_format = json.load(f)["format"]
+    camera = configure_camera(presets, ring_slots=RING_SLOTS)
+    broker = FrameBroker(camera, camera_format=camera_format)
+    # The GUI terminates the service; shut down as cleanly as on Ctrl+C
+    signal.signal(signal.SIGTERM, _interrupt)
+    print(f"Camera service listening on {SOCKET_PATH}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+        camera.stop_pipeline()
+    print("Camera service stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ from pathlib import Path
 from PyQt6.QtWidgets import QApplication, QLabel, QWidget, QVBoxLayout
 from PyQt6.QtGui import QImage, QPixmap
 from PyQt6.QtCore import QTimer, Qt
-from multimaze_recorder.utilities import configure_camera
+from multimaze_recorder.utilities import connect_camera
 
 _PACKAGE_CONFIG_DIR = Path(__file__).parent.parent / "gui" / "config"
 DEFAULT_PRESETS = str(_PACKAGE_CONFIG_DIR / "Presets" / "standard_set.json")
@@ -33,7 +33,7 @@ class LiveStreamWindow(QWidget):
         self.timer.start(33)  # ~30 fps
 
     def update_frame(self):
-        if self.camera.snap_image(1):
+        if self.camera.snap_image(1) is not None:
             frame = self.camera.get_image()
             thumbnail = cv2.resize(frame, (640, 480))
             if thumbnail.ndim == 2:
@@ -57,7 +57,7 @@ def main():
         "MMRECORDER_PRESETS", DEFAULT_PRESETS
     )
 
-    camera = configure_camera(presets)
+    camera = connect_camera(presets)
 
     app = QApplication(sys.argv)
     window = LiveStreamWindow(camera)
@@ -1,73 +1,116 @@
 """Snap-based (software-triggered) image recorder."""
 
-import cv2
-import numpy as np
 import time
 import os
 import sys
 from pathlib import Path
-from PIL import Image
 import json
-from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from multimaze_recorder.utilities import configure_camera, create_thumbnail, update_progress_bar
+from multimaze_recorder.utilities import PreviewThread, connect_camera, update_progress_bar
+from multimaze_recorder.processing.plan_store import write_rig
+from multimaze_recorder.recording.broker import BrokerClient
+from multimaze_recorder.recording.frame_log import FrameLog, load_frame_log, summarize
+from multimaze_recorder.recording.planner import grab_frames, preflight
+from multimaze_recorder.recording.sinks import NativeSink, finish_recording, make_sink, native_branch
+from multimaze_recorder.recording.watchdog import HealthWatchdog
+from multimaze_recorder.recording.writer import make_writer
 
 LOCAL_PATH = Path(os.environ.get("MMRECORDER_LOCAL_PATH", Path.home() / "Videos"))
+RING_SLOTS = int(os.environ.get("MMRECORDER_RING_SLOTS", "8"))
 
 
 class Recorder:
-    def __init__(self, presets):
+    def __init__(self, presets, fps=None):
         self.presets = presets
         self.camera_configs = self._load_camera_configs()
-        self.cropping = self.camera_configs["cropping"]
-        self.left, self.top, self.right, self.bottom = self.cropping.values()
-        self.tis = configure_camera(self.presets)
-        self.dot_state = False
-        self.last_toggle_time = time.perf_counter()
-        self.executor = ThreadPoolExecutor(max_workers=5)
+        # The camera runs free at its preset rate; a native branch records at ``fps``
+        self.tis = connect_camera(
+            self.presets,
+            ring_slots=RING_SLOTS,
+            record_branch=native_branch(self.camera_configs, max_rate=fps),
+        )
 
     def _load_camera_configs(self):
         with open(self.presets) as f:
             return json.load(f)
 
-    def _save_image(self, image, filename):
-        image.save(filename)
+    def _warm_up(self):
+        """Let a freshly opened camera settle; a shared session is already streaming."""
+        if not isinstance(self.tis, BrokerClient):
+            time.sleep(2)
 
     def record(self, folder_name, fps, duration):
         folder = LOCAL_PATH / folder_name
         folder.mkdir(parents=True, exist_ok=True)
+        write_rig(folder, self.camera_configs)
+        writer = make_writer(folder, self.camera_configs)
+        sink = make_sink(folder, self.presets, self.camera_configs, writer, fps, self.tis)
+        if isinstance(sink, NativeSink):
+            # Frames never reach Python, so the image writer is not needed
+            writer.shutdown(wait=True)
+            self.record_native(folder, sink, fps, duration)
+            return
+        frame_log = FrameLog(folder, fps)
         count = 0
         timeout = 1 / fps
 
-        time.sleep(2)
+        self._warm_up()
+        preview = PreviewThread(self.tis).start()
+        watchdog = HealthWatchdog(folder, fps, writer.stats).start()
 
         with tqdm(total=duration, desc="Progress", bar_format="{l_bar}{bar}") as pbar:
             start = time.perf_counter()
             last_update = start
             while count < duration * fps:
-                if self.tis.snap_image(timeout):
+                seq = self.tis.snap_image(timeout)
+                if seq is not None:
                     if time.perf_counter() - last_update >= 1:
                         update_progress_bar(pbar, start, duration)
+                        pbar.set_postfix_str(writer.format_stats())
                         last_update = time.perf_counter()
 
-                    frame = self.tis.get_image()
-                    filename = folder / f"image{count}.jpg"
-                    image = Image.fromarray(np.squeeze(frame), mode="L")
-                    image = image.crop((self.left, self.top, self.right, self.bottom))
-                    self.executor.submit(self._save_image, image, str(filename))
-
-                    thumbnail, self.dot_state, self.last_toggle_time = create_thumbnail(
-                        frame, self.dot_state, self.last_toggle_time
-                    )
-                    cv2.imshow("Maze Recorder", thumbnail)
-                    cv2.waitKey(1)
+                    borrowed = self.tis.get_frame(seq)
+                    if borrowed is None:
+                        continue
+                    try:
+                        # Frames dropped by the writer are not logged
+                        if sink.write(count, borrowed.image) is not False:
+                            frame_log.append(count, borrowed)
+                        watchdog.frame()
+                    finally:
+                        self.tis.release_frame(borrowed)
 
                     count += 1
 
-        cv2.destroyAllWindows()
-        self.executor.shutdown(wait=True)
+        preview.stop()
+        watchdog.stop()
+        writer.shutdown(wait=True)
+        frame_log.close()
         print(f"Captured {count} frames in {time.perf_counter() - start:0.4f} seconds")
-        folder.rename(folder.parent / (folder.name + "_Recorded"))
+        print(f"Frames lost after capture: {summarize(load_frame_log(folder))['dropped']}")
+        finish_recording(folder, sink)
+        print("Program ends")
+
+    def record_native(self, folder, sink, fps, duration):
+        """Let the pipeline's record branch write frames for ``duration`` seconds."""
+        self._warm_up()
+        preview = PreviewThread(self.tis).start()
+
+        with tqdm(total=duration, desc="Progress", bar_format="{l_bar}{bar}") as pbar:
+            sink.start()
+            watchdog = HealthWatchdog(
+                folder, fps, self.tis.native_stats, count_frames=False
+            ).start()
+            start = time.perf_counter()
+            while (remaining := duration - (time.perf_counter() - start)) > 0:
+                time.sleep(min(1, remaining))
+                update_progress_bar(pbar, start, duration)
+                pbar.set_postfix_str(sink.format_stats())
+
+        preview.stop()
+        watchdog.stop()
+        finish_recording(folder, sink)
+        print(f"Recorded for {time.perf_counter() - start:0.4f} seconds")
         print("Program ends")
 
 
@@ -81,8 +124,14 @@ def main():
     duration = int(sys.argv[3])
     presets = sys.argv[4]
 
-    recorder = Recorder(presets)
-    recorder.record(folder_name, fps, duration)
+    recorder = Recorder(presets, fps)
+    try:
+        frames = grab_frames(recorder.tis, 5)
+        if not preflight(presets, recorder.camera_configs, fps, duration, LOCAL_PATH, frames):
+            sys.exit(1)
+        recorder.record(folder_name, fps, duration)
+    finally:
+        recorder.tis.stop_pipeline()
 
 
 if __name__ == "__main__":
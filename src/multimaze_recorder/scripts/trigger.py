@@ -1,65 +1,53 @@
 """Hardware-triggered (Arduino) image recorder."""
 
 import sys
-import cv2
-import numpy as np
 from tqdm import tqdm
 import time
 import os
 from pathlib import Path
-from PIL import Image
 import json
-from concurrent.futures import ThreadPoolExecutor
-import gi
-import serial
-from multimaze_recorder.utilities import configure_camera, create_thumbnail, update_progress_bar
-
-gi.require_version("Gst", "1.0")
-gi.require_version("Tcam", "1.0")
+from multimaze_recorder.utilities import PreviewThread, connect_camera, update_progress_bar
+from multimaze_recorder.processing.plan_store import write_rig
+from multimaze_recorder.recording.frame_log import FrameLog, load_frame_log, summarize
+from multimaze_recorder.recording.planner import preflight
+from multimaze_recorder.recording.sinks import NativeSink, finish_recording, make_sink, native_branch
+from multimaze_recorder.recording.trigger_link import TriggerLink
+from multimaze_recorder.recording.watchdog import HealthWatchdog
+from multimaze_recorder.camera.sim import SimulatedTIS, SoftwareTrigger
+from multimaze_recorder.recording.writer import make_writer
 
 LOCAL_PATH = Path(os.environ.get("MMRECORDER_LOCAL_PATH", Path.home() / "Videos"))
 SERIAL_PORT = os.environ.get("MMRECORDER_SERIAL_PORT", "/dev/ttyACM0")
 BAUD_RATE = int(os.environ.get("MMRECORDER_BAUD_RATE", "9600"))
-
-executor = ThreadPoolExecutor(max_workers=5)
-
+RING_SLOTS = int(os.environ.get("MMRECORDER_RING_SLOTS", "8"))
 
 class CustomData:
     def __init__(self, image):
         self.imagecounter = 0
         self.image = image
         self.busy = False
-        self.dot_state = False
-        self.last_toggle_time = time.perf_counter()
-
-
-def _save_image(image, filename):
-    image.save(filename)
 
 
-def on_new_image(tis, userdata, folder, cropping):
+def on_new_image(tis, userdata, sink, frame_log, watchdog):
     if userdata.busy:
         return
 
     userdata.busy = True
+    borrowed = tis.get_frame(tis.frame_seq)
+    if borrowed is None:
+        userdata.busy = False
+        return
     try:
-        frame = tis.get_image()
+        frame = borrowed.image
         userdata.image = frame
 
-        filename = folder / f"image{userdata.imagecounter}.jpg"
-        image = Image.fromarray(np.squeeze(frame), mode="L")
-        Left, Top, Right, Bottom = cropping.values()
-        image = image.crop((Left, Top, Right, Bottom))
-        executor.submit(_save_image, image, str(filename))
-
-        thumbnail, userdata.dot_state, userdata.last_toggle_time = create_thumbnail(
-            frame, userdata.dot_state, userdata.last_toggle_time
-        )
-        cv2.imshow("Maze Recorder", thumbnail)
-        cv2.waitKey(1)
-
+        # Frames dropped by the writer are not logged
+        if sink.write(userdata.imagecounter, frame) is not False:
+            frame_log.append(userdata.imagecounter, borrowed)
+        watchdog.frame()
         userdata.imagecounter += 1
     finally:
+        tis.release_frame(borrowed)
         userdata.busy = False
 
 
@@ -73,73 +61,86 @@ def main():
     duration = int(sys.argv[3])
     camera_settings = sys.argv[4]
 
-    folder = LOCAL_PATH / folder_name
-    folder.mkdir(parents=True, exist_ok=True)
-
     with open(camera_settings) as f:
         cameraconfigs = json.load(f)
-    cropping = cameraconfigs["cropping"]
+    # The camera only produces frames on trigger pulses; calibrate on synthetic ones
+    if not preflight(camera_settings, cameraconfigs, fps, duration, LOCAL_PATH):
+        sys.exit(1)
 
+    folder = LOCAL_PATH / folder_name
+    folder.mkdir(parents=True, exist_ok=True)
+    write_rig(folder, cameraconfigs)
     CD = CustomData(None)
-    camera = configure_camera(camera_settings, hardware_trigger=True)
-    camera.set_image_callback(on_new_image, CD, folder, cropping)
-
-    ser = serial.Serial(SERIAL_PORT, BAUD_RATE)
-    ser.close()
-    time.sleep(2)
-    ser.open()
-
-    while True:
-        if ser.in_waiting > 0:
-            line = ser.readline().decode("utf-8").rstrip()
-            if line == "Arduino Ready":
-                print("Arduino connection established")
-                break
-
-    ser.write("start\n".encode("utf-8"))
-    time.sleep(0.2)
-    ser.write(f"{fps}*".encode("utf-8"))
-    time.sleep(0.2)
-    ser.write(f"{duration}*".encode("utf-8"))
-    print("Commands sent to Arduino, waiting for acknowledgment...")
-    time.sleep(0.2)
-
-    ack_received = False
-    start_time = time.time()
-    arduino_output = []
-
-    while not ack_received:
-        while ser.in_waiting > 0:
-            line = ser.readline().decode("utf-8")
-            arduino_output.append(line)
-            ack_received = True
-        if time.time() - start_time > 10:
-            raise RuntimeError("No acknowledgment received from Arduino")
-        time.sleep(0.1)
-
-    print(f"Acknowledgment received: {''.join(arduino_output)}\nStarting recording.")
+    branch = native_branch(cameraconfigs)
+    camera = connect_camera(
+        camera_settings,
+        hardware_trigger=True,
+        ring_slots=RING_SLOTS,
+        record_branch=branch,
+    )
+    # Frames never reach Python with a native branch, so no image writer is needed
+    writer = None if branch else make_writer(folder, cameraconfigs)
+    sink = make_sink(folder, camera_settings, cameraconfigs, writer, fps, camera)
+    native = isinstance(sink, NativeSink)
+    if native:
+        # The pipeline writes every frame; Python only sees preview samples
+        frame_log = None
+        stats = sink
+        watchdog = HealthWatchdog(folder, fps, camera.native_stats, count_frames=False)
+        sink.start()
+    else:
+        frame_log = FrameLog(folder, fps, triggered=True)
+        stats = writer
+        watchdog = HealthWatchdog(folder, fps, writer.stats)
+        camera.set_image_callback(on_new_image, CD, sink, frame_log, watchdog)
+    preview = PreviewThread(camera).start()
+
+    if isinstance(camera, SimulatedTIS):
+        link = SoftwareTrigger(camera)
+    else:
+        # Opening the port resets the Arduino, which greets us once it has booted
+        link = TriggerLink(SERIAL_PORT, BAUD_RATE)
+    try:
+        link.wait_ready(timeout=10)
+    except TimeoutError:
+        link.close()
+        raise RuntimeError("Arduino did not report ready") from None
+    print("Arduino connection established")
+
+    watchdog.start()
+    acks = link.start(fps, duration)
+    print(
+        "Acknowledgment received: "
+        + ", ".join(ack.text for ack in acks)
+        + "\nStarting recording."
+    )
 
     with tqdm(total=duration, desc="Progress", bar_format="{l_bar}{bar}") as pbar:
         start = time.perf_counter()
-        last_update = start
-        while True:
-            if ser.in_waiting > 0:
-                line = ser.readline().decode("utf-8").rstrip()
-                if line == "done":
-                    break
-            current_time = time.perf_counter()
-            if current_time - last_update >= 1:
-                update_progress_bar(pbar, start, duration)
-                last_update = current_time
+        while link.wait_done(timeout=1) is None:
+            update_progress_bar(pbar, start, duration)
+            pbar.set_postfix_str(stats.format_stats())
+    watchdog.stop()
 
     print(f"Program duration: {time.perf_counter() - start:0.4f} seconds")
-    print(f"Saved {CD.imagecounter} images")
+    if not native:
+        print(f"Saved {CD.imagecounter} images")
+    if link.pulse_count is not None:
+        print(f"Trigger pulses sent: {link.pulse_count}")
 
-    cv2.destroyAllWindows()
+    preview.stop()
     camera.stop_pipeline()
-    executor.shutdown(wait=True)
-    folder.rename(folder.parent / (folder.name + "_Recorded"))
-    ser.close()
+    if writer is not None:
+        writer.shutdown(wait=True)
+    if frame_log is not None:
+        frame_log.close()
+        timing = summarize(load_frame_log(folder))
+        print(
+            f"Frames lost after capture: {timing['dropped']}, "
+            f"trigger pulses without a frame: {timing['missed_pulses']}"
+        )
+    finish_recording(folder, sink)
+    link.close()
     print("Program end")
 
 
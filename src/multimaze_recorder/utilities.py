@@ -1,12 +1,25 @@
+import os
 import sys
+import threading
 import cv2
+import numpy as np
 import time
 try:
     from tqdm import tqdm
 except Exception:
     tqdm = None
 import json
-from multimaze_recorder.camera import tis as TIS_module
+try:
+    from multimaze_recorder.camera import tis as TIS_module
+except (ImportError, ValueError):
+    # Without PyGObject/tiscamera only the simulated camera is available
+    TIS_module = None
+from multimaze_recorder.camera.sim import SimulatedTIS
+from multimaze_recorder.recording.broker import BrokerClient, broker_available
+
+THUMBNAIL_SIZE = (640, 480)
+PREVIEW_HZ = float(os.environ.get("MMRECORDER_PREVIEW_HZ", "5"))
+CAMERA_BACKEND = os.environ.get("MMRECORDER_CAMERA", "tis")
 
 
 def progress(count, total, status=""):
@@ -18,9 +31,19 @@ def progress(count, total, status=""):
     sys.stdout.flush()
 
 
-def create_thumbnail(frame, dot_state, last_toggle_time):
-    thumbnail = cv2.resize(frame, (640, 480))
-    thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_GRAY2RGB)
+def create_thumbnail(frame, dot_state, last_toggle_time, buffers=None):
+    """Return a 640x480 RGB preview of ``frame`` with a blinking recording dot.
+
+    ``buffers`` is an optional ``(gray, rgb)`` pair of preallocated arrays of
+    shape (480, 640) and (480, 640, 3) that the thumbnail is rendered into.
+    """
+    if buffers is None:
+        thumbnail = cv2.resize(frame, THUMBNAIL_SIZE)
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_GRAY2RGB)
+    else:
+        gray, thumbnail = buffers
+        cv2.resize(frame, THUMBNAIL_SIZE, dst=gray)
+        cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB, dst=thumbnail)
 
     if dot_state:
         cv2.circle(thumbnail, (20, 20), 15, (0, 0, 255), -1)
@@ -33,6 +56,84 @@ def create_thumbnail(frame, dot_state, last_toggle_time):
     return thumbnail, dot_state, last_toggle_time
 
 
+class PreviewThread:
+    """Show the latest camera frame at a few Hz, away from the capture path.
+
+    The thread borrows the newest ring frame of ``tis`` (see
+    ``TIS.get_frame``) ``rate`` times per second, renders it into
+    preallocated buffers and hands it back before drawing the window, so
+    acquisition never waits on resizing or on the GUI.  ``rate`` is clamped
+    to 2-10 Hz.
+    """
+
+    def __init__(self, tis, rate=PREVIEW_HZ, window="Maze Recorder"):
+        self.tis = tis
+        self.interval = 1 / min(max(rate, 2), 10)
+        self.window = window
+        self.shown = 0
+        width, height = THUMBNAIL_SIZE
+        self._buffers = (
+            np.empty((height, width), dtype=np.uint8),
+            np.empty((height, width, 3), dtype=np.uint8),
+        )
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="preview", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def render(self, dot_state, last_toggle_time, last_seq=None):
+        """Render the latest frame if it is newer than ``last_seq``.
+
+        Returns ``(thumbnail, dot_state, last_toggle_time, seq)``, with a
+        None thumbnail when there is nothing new to show.
+        """
+        frame = self.tis.get_frame()
+        if frame is None or frame.seq == last_seq:
+            if frame is not None:
+                self.tis.release_frame(frame)
+            return None, dot_state, last_toggle_time, last_seq
+        try:
+            thumbnail, dot_state, last_toggle_time = create_thumbnail(
+                frame.image, dot_state, last_toggle_time, self._buffers
+            )
+        finally:
+            self.tis.release_frame(frame)
+        return thumbnail, dot_state, last_toggle_time, frame.seq
+
+    def _run(self):
+        dot_state, last_toggle_time, seq = False, time.perf_counter(), None
+        while not self._stop.wait(self.interval):
+            thumbnail, dot_state, last_toggle_time, seq = self.render(
+                dot_state, last_toggle_time, seq
+            )
+            try:
+                if thumbnail is not None:
+                    cv2.imshow(self.window, thumbnail)
+                    self.shown += 1
+                cv2.waitKey(1)
+            except cv2.error:
+                # Headless OpenCV (e.g. CI runs on the simulated camera)
+                print("No display available, live preview disabled")
+                self.window = None
+                return
+        # HighGUI windows belong to the thread that drew them; destroying
+        # this one from another thread can hang on Qt builds of OpenCV
+        if self.shown:
+            try:
+                cv2.destroyWindow(self.window)
+                cv2.waitKey(1)
+            except cv2.error:
+                pass
+
+    def stop(self):
+        """Stop the preview; its thread closes the window before exiting."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
 def update_progress_bar(pbar, start_time, total_time):
     elapsed_time = int(time.perf_counter() - start_time)
     if elapsed_time > pbar.n:
@@ -48,25 +149,46 @@ def update_progress_bar(pbar, start_time, total_time):
     )
 
 
-def configure_camera(presets, hardware_trigger=False):
-    """Configure and return a TIS camera from a presets JSON file."""
+def configure_camera(presets, hardware_trigger=False, ring_slots=0, record_branch=None):
+    """Configure and return a TIS camera from a presets JSON file.
+
+    With ``ring_slots`` > 0 the camera copies frames into a preallocated ring
+    buffer (see ``TIS.enable_ring_buffer``) instead of duplicating every
+    buffer into a new bytes object.  A ``record_branch`` (see
+    ``recording.sinks.native_branch``) records every frame inside the
+    GStreamer pipeline, and only preview frames reach Python.
+
+    ``MMRECORDER_CAMERA=sim`` swaps in ``camera.sim.SimulatedTIS``, which
+    needs neither tiscamera nor a camera.
+    """
     with open(presets) as jsonFile:
         cameraconfigs = json.load(jsonFile)
 
     fmt = cameraconfigs["format"]
 
-    Tis = TIS_module.TIS(cameraconfigs["properties"])
+    simulated = CAMERA_BACKEND == "sim"
+    if simulated:
+        Tis = SimulatedTIS(cameraconfigs["properties"])
+        sinkformat = "GRAY8"
+    else:
+        Tis = TIS_module.TIS(cameraconfigs["properties"])
+        sinkformat = TIS_module.SinkFormats.GRAY8
+    if record_branch:
+        Tis.enable_native_recording(record_branch, preview_rate=min(max(PREVIEW_HZ, 2), 10))
     Tis.open_device(
         fmt["serial"],
         fmt["width"],
         fmt["height"],
         fmt["framerate"],
-        TIS_module.SinkFormats.GRAY8,
+        sinkformat,
         False,
     )
+    if ring_slots:
+        Tis.enable_ring_buffer(ring_slots)
 
     Tis.start_pipeline()
-    time.sleep(2)
+    if not simulated:
+        time.sleep(2)
     Tis.applyProperties()
 
     camera = Tis.get_source()
@@ -79,3 +201,71 @@ def configure_camera(presets, hardware_trigger=False):
     print(f"State of device is:\n{state}")
 
     return Tis
+
+
+def preset_mismatches(camera, cameraconfigs):
+    """Differences between a camera service's settings and a preset.
+
+    Compares the format the service opened the camera with (or, from older
+    services, the frame size) and the current value of every preset
+    property but the trigger ones, which recorders set themselves.  Returns
+    a list of ``"name: service value, preset value"`` strings.
+    """
+    mismatches = []
+    fmt = cameraconfigs["format"]
+    if camera.format is not None:
+        for key in ("serial", "width", "height", "framerate"):
+            if str(camera.format.get(key)) != str(fmt.get(key)):
+                mismatches.append(f"{key}: service {camera.format.get(key)}, preset {fmt.get(key)}")
+    else:
+        height, width = camera.shared.shape[:2]
+        if (width, height) != (fmt["width"], fmt["height"]):
+            mismatches.append(
+                f"frame size: service {width}x{height}, preset {fmt['width']}x{fmt['height']}"
+            )
+    for prop in cameraconfigs.get("properties", []):
+        name, value = prop["property"], prop["value"]
+        if name.startswith("Trigger"):
+            continue
+        try:
+            current = camera.get_property(name)
+        except RuntimeError:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            same = isinstance(current, (int, float)) and abs(current - value) <= 1e-3 * max(
+                abs(value), 1
+            )
+        else:
+            same = current == value
+        if not same:
+            mismatches.append(f"{name}: service {current}, preset {value}")
+    return mismatches
+
+
+def connect_camera(presets, hardware_trigger=False, ring_slots=0, record_branch=None):
+    """Attach to the running camera service, or open the camera directly.
+
+    When ``mmrecorder-camera-service`` is running (see
+    ``recording.broker``) the returned ``BrokerClient`` shares its camera
+    session and the presets it was started with, which must match
+    ``presets``: recording with another preset's exposure or frame size
+    than asked for raises ``RuntimeError``.  A ``record_branch`` needs its
+    own pipeline, so native recordings always open the camera.
+    """
+    if record_branch is None and broker_available():
+        camera = BrokerClient(ring_slots=max(ring_slots, 8))
+        with open(presets) as f:
+            mismatches = preset_mismatches(camera, json.load(f))
+        if mismatches:
+            camera.stop_pipeline()
+            raise RuntimeError(
+                f"The running camera service was started with other settings than {presets}:\n  "
+                + "\n  ".join(mismatches)
+                + "\nStop the live stream (camera service) or record with its preset."
+            )
+        if hardware_trigger:
+            camera.set_property("TriggerMode", "On")
+            camera.set_property("TriggerActivation", "Rising Edge")
+        print("Attached to the running camera service")
+        return camera
+    return configure_camera(presets, hardware_trigger, ring_slots, record_branch)
@@ -0,0 +1,73 @@
+"""Tests for the capture-path benchmark."""
+
+import json
+
+from multimaze_recorder.scripts import bench_capture
+
+
+def test_sweep_skips_jpeg_settings_for_other_formats():
+    args = bench_capture.parse_args([
+        "--fps", "30", "60", "--format", "jpeg", "raw",
+        "--jpeg-encoder", "cv2", "pil", "--workers", "2",
+    ])
+    cases = list(bench_capture.cases(args))
+    assert len(cases) == 2 * (2 + 1)
+    assert {c["jpeg_encoder"] for c in cases if c["format"] == "raw"} == {"cv2"}
+    assert (cases[0]["width"], cases[0]["height"]) == (1920, 1200)
+
+
+def test_presets_record_full_frames(tmp_path):
+    path = tmp_path / "presets.json"
+    bench_capture.write_presets(
+        bench_capture.DEFAULT_PRESETS, path, 320, 240, 60, "pil", 90
+    )
+    configs = json.loads(path.read_text())
+    assert configs["format"]["framerate"] == "60/1"
+    assert configs["cropping"] == {"Left": 0, "Top": 0, "Right": 320, "Bottom": 240}
+    assert (configs["jpeg_encoder"], configs["jpeg_quality"]) == ("pil", 90)
+
+
+def test_triggered_case_reports_metrics(tmp_path):
+    output = tmp_path / "bench.json"
+    bench_capture.main([
+        "--mode", "trigger", "--fps", "20", "--resolution", "160x120",
+        "--workers", "2", "--duration", "1", "--output", str(output),
+    ])
+    report = json.loads(output.read_text())
+    assert report["environment"]["cpu_count"]
+    (case,) = report["cases"]
+    result = case["result"]
+    assert "error" not in result, result
+    assert result["frames_expected"] == 20
+    assert result["frames_saved"] >= 18
+    assert result["latency_kind"] == "exposure_to_disk"
+    assert result["latency_ms"]["p50"] >= 0
+    assert result["peak_rss_mb"] > 0 and result["bytes_written"] > 0
+
+
+def test_summary_of_a_case_that_saved_no_frames():
+    case = {"fps": 30, "width": 1920, "height": 1200, "format": "jpeg", "workers": 2, "processes": 0}
+    result = {
+        "sustained_fps": 0.0,
+        "drop_rate": None,
+        "latency_ms": None,
+        "disk_mb_per_s": 0.0,
+        "peak_rss_mb": 80.0,
+    }
+    line = bench_capture.summary_line(case, result)
+    assert "drop n/a" in line and "p99 n/a" in line
+
+
+def test_given_scratch_folder_keeps_everything_but_the_cases(tmp_path, monkeypatch):
+    recording = tmp_path / "Exp_Recorded"
+    recording.mkdir()
+
+    def fake_bench(case, scratch, presets):
+        (tmp_path / bench_capture.case_name(case)).mkdir()
+        return {"error": "not run"}
+
+    monkeypatch.setattr(bench_capture, "bench", fake_bench)
+    bench_capture.main([
+        "--fps", "20", "30", "--scratch", str(tmp_path), "--output", str(tmp_path / "bench.json"),
+    ])
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["Exp_Recorded", "bench.json"]
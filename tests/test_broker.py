@@ -0,0 +1,157 @@
+"""Tests for the camera service frame broker and its clients."""
+
+import threading
+
+import numpy as np
+import pytest
+
+from multimaze_recorder.camera.ring import FrameRing
+from multimaze_recorder.recording.broker import BrokerClient, FrameBroker, broker_available
+
+SHAPE = (4, 6, 1)
+
+
+class FakeCamera:
+    """The ring-mode ``TIS`` surface the broker uses."""
+
+    def __init__(self):
+        self.ring = FrameRing(4, SHAPE)
+        self.frame_seq = None
+        self.callback = None
+        self.properties = {"Exposure": 100}
+
+    def set_image_callback(self, function, *data):
+        self.callback = function
+
+    def push(self, value):
+        self.frame_seq = self.ring.write(
+            np.full(SHAPE, value, dtype=np.uint8).tobytes(), pts=value * 1000, host_time=value
+        )
+        if self.callback:
+            self.callback(self)
+
+    def get_frame(self, seq=None):
+        return self.ring.acquire(seq)
+
+    def release_frame(self, frame):
+        self.ring.release(frame)
+
+    def get_property(self, name):
+        return self.properties[name]
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+
+@pytest.fixture
+def broker(tmp_path):
+    camera = FakeCamera()
+    broker = FrameBroker(camera, socket_path=str(tmp_path / "camera.sock"), slots=4).start()
+    camera.push(0)
+    yield broker
+    broker.stop()
+
+
+def test_service_is_detected(broker, tmp_path):
+    assert broker_available(broker.socket_path)
+    assert not broker_available(str(tmp_path / "missing.sock"))
+
+
+def test_snap_copies_the_next_frame(broker):
+    client = BrokerClient(broker.socket_path)
+    try:
+        broker.camera.push(7)
+        seq = client.snap_image(2)
+        assert seq == 1
+        frame = client.get_frame(seq)
+        assert (frame.seq, frame.pts, frame.time) == (1, 7000, 7.0)
+        assert frame.image.shape == SHAPE and np.all(frame.image == 7)
+        client.release_frame(frame)
+        assert np.all(client.get_image() == 7)
+        assert client.snap_image(0.1) is None
+    finally:
+        client.stop_pipeline()
+
+
+def test_callbacks_see_every_frame_of_every_client(broker):
+    clients = [BrokerClient(broker.socket_path) for _ in range(2)]
+    seen = [[] for _ in clients]
+    done = threading.Event()
+
+    def on_frame(camera, received):
+        frame = camera.get_frame(camera.frame_seq)
+        received.append((frame.seq, int(frame.image[0, 0, 0])))
+        camera.release_frame(frame)
+        if all(len(r) == 3 for r in seen):
+            done.set()
+
+    try:
+        for client, received in zip(clients, seen):
+            client.set_image_callback(on_frame, received)
+        for value in (1, 2, 3):
+            broker.camera.push(value)
+        assert done.wait(5)
+    finally:
+        for client in clients:
+            client.stop_pipeline()
+    assert seen == [[(1, 1), (2, 2), (3, 3)]] * 2
+    assert broker.published == 4
+
+
+def test_properties_are_restored_when_a_client_detaches(broker):
+    client = BrokerClient(broker.socket_path)
+    client.set_property("Exposure", 500)
+    assert client.get_property("Exposure") == 500
+    with pytest.raises(RuntimeError):
+        client.get_property("Missing")
+    client.stop_pipeline()
+    assert broker.camera.properties["Exposure"] == 100
+
+
+def test_recorders_refuse_a_service_started_with_another_preset(tmp_path, monkeypatch):
+    import json
+
+    from multimaze_recorder import utilities
+
+    fmt = {"serial": "1", "width": SHAPE[1], "height": SHAPE[0], "framerate": "30/1"}
+    camera = FakeCamera()
+    service = FrameBroker(
+        camera, socket_path=str(tmp_path / "camera.sock"), slots=4, camera_format=fmt
+    ).start()
+    camera.push(0)
+    monkeypatch.setattr(utilities, "broker_available", lambda: True)
+    monkeypatch.setattr(
+        utilities,
+        "BrokerClient",
+        lambda ring_slots: BrokerClient(service.socket_path, ring_slots=ring_slots),
+    )
+    presets = tmp_path / "preset.json"
+    try:
+        properties = [{"property": "Exposure", "value": 100.0}]
+        presets.write_text(json.dumps({"format": fmt, "properties": properties}))
+        utilities.connect_camera(presets).stop_pipeline()
+
+        properties[0]["value"] = 800.0
+        presets.write_text(json.dumps({"format": fmt, "properties": properties}))
+        with pytest.raises(RuntimeError, match="Exposure: service 100, preset 800"):
+            utilities.connect_camera(presets)
+
+        presets.write_text(json.dumps({"format": {**fmt, "width": 4096}, "properties": []}))
+        with pytest.raises(RuntimeError, match="width"):
+            utilities.connect_camera(presets)
+    finally:
+        service.stop()
+
+
+def test_recorders_skip_the_camera_warm_up_of_a_shared_session(monkeypatch):
+    from multimaze_recorder.scripts import snap
+
+    sleeps = []
+    monkeypatch.setattr(snap.time, "sleep", sleeps.append)
+    recorder = object.__new__(snap.Recorder)
+    recorder.tis = object.__new__(BrokerClient)
+    recorder._warm_up()
+    assert sleeps == []
+    recorder.tis = object()
+    recorder._warm_up()
+    assert sleeps == [2]
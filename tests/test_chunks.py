@@ -0,0 +1,71 @@
+"""Unit tests for the chunked raw frame container and frame access helpers."""
+
+import cv2
+import numpy as np
+import pytest
+
+from multimaze_recorder.processing.frames import list_frames, load_frame
+from multimaze_recorder.recording.chunks import (
+    CHUNK_PATTERN,
+    ChunkReader,
+    ChunkWriter,
+    is_chunked,
+)
+
+
+def _frame(value):
+    return np.full((6, 8), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def container(tmp_path):
+    # chunk_mb=0 stores one frame per chunk, exercising chunk boundaries
+    writer = ChunkWriter(tmp_path, 6, 8, chunk_mb=0)
+    for n in (0, 1, 2, 4):  # frame 3 was lost during the recording
+        writer.write(n, _frame(n * 10))
+    writer.close()
+    return tmp_path
+
+
+def test_writer_splits_into_chunks(container):
+    assert is_chunked(container)
+    assert len(list(container.glob("frames_*.mmraw"))) == 4
+    assert (container / CHUNK_PATTERN.format(3)).exists()
+
+
+def test_writer_rejects_other_shapes(tmp_path):
+    writer = ChunkWriter(tmp_path, 6, 8)
+    with pytest.raises(ValueError):
+        writer.write(0, np.zeros((8, 6), dtype=np.uint8))
+    writer.close()
+
+
+def test_reader_random_access(container):
+    reader = ChunkReader(container)
+    assert len(reader) == 4
+    assert reader.shape == (6, 8)
+    assert list(reader.frame_numbers) == [0, 1, 2, 4]
+    frame = reader.frame(4)
+    assert isinstance(frame, np.memmap)
+    assert np.all(frame == 40)
+    with pytest.raises(KeyError):
+        reader.frame(3)
+
+
+def test_reader_sequential_scan(container):
+    assert [(n, int(f[0, 0])) for n, f in ChunkReader(container)] == [
+        (0, 0), (1, 10), (2, 20), (4, 40)
+    ]
+
+
+def test_frame_helpers_on_raw_container(container):
+    assert list_frames(container) == ["image0.jpg", "image1.jpg", "image2.jpg", "image4.jpg"]
+    assert np.all(load_frame(container, "image2.jpg") == 20)
+    assert load_frame(container, "image3.jpg") is None
+
+
+def test_frame_helpers_on_jpeg_folder(tmp_path):
+    for n in (10, 2, 1):
+        cv2.imwrite(str(tmp_path / f"image{n}.jpg"), _frame(n))
+    assert list_frames(tmp_path) == ["image1.jpg", "image2.jpg", "image10.jpg"]
+    assert load_frame(tmp_path, "image2.jpg").shape == (6, 8)
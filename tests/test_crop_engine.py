@@ -0,0 +1,284 @@
+"""Unit tests for the shared crop engine (processing/crop_engine.py)."""
+
+import os
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+from multimaze_recorder.processing import crop_engine
+from multimaze_recorder.processing.crop_engine import (
+    CropEngine,
+    CropOutput,
+    Manifest,
+    crop_folder,
+    frame_ranges,
+    load_regions,
+)
+from multimaze_recorder.processing.crop_plan import (
+    arena_plan,
+    corridor_plan,
+    f1_plan,
+    h_corridor_plan,
+)
+
+
+@pytest.fixture
+def frame():
+    return np.random.default_rng(0).integers(0, 255, (60, 80), dtype=np.uint8)
+
+
+def test_region_grids_are_listed_row_by_row():
+    regions = load_regions("arenas")
+    assert len(regions) == 9
+    assert regions[:4] == [
+        (90, 30, 620, 600), (1590, 30, 2110, 600), (3080, 30, 3600, 600), (90, 1170, 620, 1750),
+    ]
+    with pytest.raises(KeyError):
+        load_regions("missing")
+
+
+@pytest.mark.parametrize("rotation", [None, "flip", "rotatel", "rotater"])
+def test_h_corridor_plan_matches_array_to_h_corridors(frame, rotation):
+    region = (5, 3, 70, 55)
+    rectangles = [(4, 2, 13, 21), (30, 25, 17, 9)]
+    crops = dict(h_corridor_plan([region], [rectangles], rotation, padding=3).crops(frame))
+
+    # Reference: the crop/rotate/pad/trim sequence of the former process_image
+    region_img = frame[3:55, 5:70]
+    codes = {
+        "flip": cv2.ROTATE_180,
+        "rotatel": cv2.ROTATE_90_COUNTERCLOCKWISE,
+        "rotater": cv2.ROTATE_90_CLOCKWISE,
+    }
+    if rotation:
+        region_img = cv2.rotate(region_img, codes[rotation])
+    for k, (x, y, w, h) in enumerate(rectangles):
+        subcrop = region_img[
+            max(0, y - 3) : min(region_img.shape[0], y + h + 3),
+            max(0, x - 3) : min(region_img.shape[1], x + w + 3),
+        ]
+        subcrop = subcrop[: subcrop.shape[0] // 2 * 2, : subcrop.shape[1] // 2 * 2]
+        np.testing.assert_array_equal(crops[f"arena1/corridor{k+1}"], subcrop)
+
+
+def test_engine_decodes_each_frame_once_for_several_layouts(tmp_path, frame, monkeypatch):
+    source = tmp_path / "Exp_rotater_Recorded"
+    source.mkdir()
+    for n in (1, 2, 10):
+        cv2.imwrite(str(source / f"image{n}.png"), frame)
+    images = ["image1.png", "image2.png", "image10.png", "image3.png"]
+
+    loads = []
+
+    def load_frame(folder, image, *args):
+        loads.append(image)
+        return frame if image != "image3.png" else None
+
+    monkeypatch.setattr(crop_engine, "load_frame", load_frame)
+    arenas = CropOutput(arena_plan([(0, 0, 20, 30)], "rotater"), tmp_path / "out" / "arenas")
+    corridors = CropOutput(
+        corridor_plan([[(0, 0, 10, 20), (10, 0, 20, 20)]], "rotater"),
+        tmp_path / "out" / "corridors",
+    )
+    failed = crop_folder(source, [arenas, corridors], images, workers=1, progress=False)
+
+    assert failed == ["image3.png"]
+    assert sorted(loads) == sorted(images)
+    expected = dict(arenas.plan.crops(frame))
+    written = cv2.imread(
+        str(arenas.folder / "arena1" / "image10_cropped.jpg"), cv2.IMREAD_GRAYSCALE
+    )
+    assert written.shape == expected["arena1"].shape
+    for corridor in ("corridor1", "corridor2"):
+        assert (corridors.folder / "arena1" / corridor / "image2_cropped.jpg").exists()
+
+
+def test_rois_are_turned_once_without_rotating_the_frame(tmp_path, frame, monkeypatch):
+    plans = [
+        f1_plan([(0, 0, 40, 30)], ["hz"], "rotatel"),
+        arena_plan([(5, 5, 25, 35)], "flip"),
+        arena_plan([(0, 0, 20, 20)]),
+    ]
+    outputs = [CropOutput(plan, tmp_path / str(n)) for n, plan in enumerate(plans)]
+    expected = [image.copy() for plan in plans for _, image in plan.crops(frame)]
+
+    rotations = []
+    rotate = cv2.rotate
+    monkeypatch.setattr(
+        cv2, "rotate", lambda *a, **k: rotations.append((a[0].shape, a[1])) or rotate(*a, **k)
+    )
+    crops = list(CropEngine(outputs).crops(frame))
+
+    assert len(crops) == len(expected) == 4
+    for (_, image), reference in zip(crops, expected):
+        np.testing.assert_array_equal(image, reference)
+    # "rotatel" then "cw" cancel out; "rotatel" then "ccw" and "flip" are half turns
+    assert [code for _, code in rotations] == [cv2.ROTATE_180, cv2.ROTATE_180]
+    assert all(shape != frame.shape for shape, _ in rotations)
+
+
+def test_engine_decodes_only_the_rows_and_columns_of_its_rois(tmp_path, frame):
+    plan = arena_plan([(10, 5, 30, 20), (40, 30, 50, 46)], "rotater")
+    engine = CropEngine([CropOutput(plan, tmp_path)])
+    # 80 x 60 frame turned right: the ROIs are in columns 5..46 and rows 10..50 of the recording
+    assert engine.region(80, 60) == (5, 10, 46, 50)
+
+
+def test_rotation_buffers_are_reused_across_frames(tmp_path, frame):
+    plan = arena_plan([(0, 0, 40, 30), (40, 0, 60, 30)], "rotatel")
+    engine = CropEngine([CropOutput(plan, tmp_path)])
+    first = [image for _, image in engine.crops(frame)]
+    first = [(image, image.copy()) for image in first]
+    second = [image for _, image in engine.crops(255 - frame)]
+    for (image, values), (name, expected), reused in zip(first, plan.crops(255 - frame), second):
+        assert reused is image
+        np.testing.assert_array_equal(reused, expected)
+        assert not np.array_equal(reused, values)
+
+
+def test_frame_ranges_are_contiguous_and_balanced():
+    images = [f"image{n}.jpg" for n in range(10)]
+    ranges = frame_ranges(images, 4)
+    assert [len(r) for r in ranges] == [3, 3, 2, 2]
+    assert sum(ranges, []) == images
+    assert frame_ranges(images[:2], 8) == [["image0.jpg"], ["image1.jpg"]]
+
+
+def test_worker_processes_write_every_frame(tmp_path, frame):
+    source = tmp_path / "Exp_flip_Recorded"
+    source.mkdir()
+    for n in range(7):
+        cv2.imwrite(str(source / f"image{n}.png"), frame)
+    (source / "image7.png").write_bytes(b"not an image")
+    images = [f"image{n}.png" for n in range(8)]
+    plan = corridor_plan([[(0, 0, 10, 20), (10, 0, 30, 20)]], "flip")
+    output = tmp_path / "out"
+
+    failed = crop_folder(source, [CropOutput(plan, output)], images, workers=3, progress=False)
+
+    assert failed == ["image7.png"]
+    assert sorted(Manifest(output).read()) == list(range(7))
+    for n in range(7):
+        for corridor in ("corridor1", "corridor2"):
+            assert (output / "arena1" / corridor / f"image{n}_cropped.jpg").exists()
+
+
+def test_roi_files_are_synced_before_their_frames_are_reported(tmp_path, frame, monkeypatch):
+    source = tmp_path / "Exp_Recorded"
+    source.mkdir()
+    images = [f"image{n}.png" for n in range(crop_engine.REPORT_FRAMES + 3)]
+    for image in images:
+        cv2.imwrite(str(source / image), frame)
+    output = tmp_path / "out"
+    engine = CropEngine([CropOutput(arena_plan([(0, 0, 20, 30)]), output)])
+    engine.make_folders()
+
+    crop_engine.sync_filesystem(output)
+    syncs, reports = [], []
+    monkeypatch.setattr(crop_engine, "sync_filesystem", syncs.append)
+
+    def report(written, n):
+        # One sync of the output disk per batch, before the batch is reported
+        assert syncs == [output] * (len(reports) + 1)
+        reports.append(len(written))
+
+    assert engine.process_range(source, images, report) == []
+    assert reports == [crop_engine.REPORT_FRAMES, 3]
+
+
+def test_manifest_drops_a_line_cut_short_by_a_crash(tmp_path):
+    manifest = Manifest(tmp_path)
+    manifest.append([12, 13])
+    with open(manifest.path, "a") as f:
+        f.write("1")
+    plan = arena_plan([(0, 0, 10, 10)])
+    for n in (12, 13):
+        (tmp_path / "arena1").mkdir(exist_ok=True)
+        cv2.imwrite(str(tmp_path / "arena1" / f"image{n}_cropped.jpg"), np.zeros((10, 10), np.uint8))
+    names = {n: f"image{n}.jpg" for n in (1, 12, 13, 14)}
+
+    assert manifest.completed(plan, names) == {12, 13}
+    manifest.append([14])
+    assert manifest.read() == [12, 13, 14]
+
+
+def test_resumed_crop_skips_written_frames_and_redoes_truncated_ones(tmp_path, frame, monkeypatch):
+    source = tmp_path / "Exp_Recorded"
+    source.mkdir()
+    images = [f"image{n}.jpg" for n in range(6)]
+    for image in images:
+        cv2.imwrite(str(source / image), frame)
+    output = CropOutput(arena_plan([(0, 0, 20, 30)]), tmp_path / "out")
+    crop_folder(source, [output], images[:4], workers=1, progress=False)
+    # A crash left the last listed frame half written
+    cropped = output.folder / "arena1" / "image3_cropped.jpg"
+    cropped.write_bytes(cropped.read_bytes()[:100])
+
+    loads = []
+    load_frame = crop_engine.load_frame
+    monkeypatch.setattr(
+        crop_engine, "load_frame", lambda f, image, *args: loads.append(image) or load_frame(f, image, *args)
+    )
+    crop_folder(source, [output], images, workers=1, progress=False)
+
+    assert loads == ["image3.jpg", "image4.jpg", "image5.jpg"]
+    assert sorted(Manifest(output.folder).read()) == [0, 1, 2, 3, 3, 4, 5]
+    assert cropped.read_bytes()[-2:] == b"\xff\xd9"
+
+
+def test_interrupted_folder_resumes_with_its_saved_plan(tmp_path, frame, monkeypatch):
+    plans = []
+
+    def plan_folder(folder, output):
+        plans.append(folder.name)
+        return arena_plan([(0, 0, 20, 30)])
+
+    monkeypatch.setitem(sys.modules, "fake_layout", types.SimpleNamespace(plan_folder=plan_folder))
+    monkeypatch.setitem(crop_engine.LAYOUTS, "fake", "fake_layout")
+    monkeypatch.setattr(crop_engine, "CROP_WORKERS", 1)
+    monkeypatch.setattr(sys, "stdin", open(os.devnull))
+    source = tmp_path / "Exp_Recorded"
+    source.mkdir()
+    for n in range(5):
+        cv2.imwrite(str(source / f"image{n}.jpg"), frame)
+
+    crop = crop_engine.crop_folder
+
+    def interrupted(folder, outputs, images, **kwargs):
+        crop(folder, outputs, images[:2], progress=False)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(crop_engine, "crop_folder", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        crop_engine.process_folder(source, ["fake"])
+    processing = tmp_path / "Exp_Processing"
+    assert Manifest(processing).read() == [0, 1]
+
+    # Another run still holding the folder is left alone
+    with crop_engine._locked(processing):
+        crop_engine.process_folder(source, ["fake"])
+    assert processing.exists()
+
+    monkeypatch.setattr(crop_engine, "crop_folder", crop)
+    crop_engine.process_folder(source, ["fake"])
+    cropped = tmp_path / "Exp_Cropped"
+    assert plans == ["Exp_Recorded"]
+    assert sorted(Manifest(cropped).read()) == [0, 1, 2, 3, 4]
+    assert not (cropped / crop_engine.LOCK_FILE).exists()
+
+
+def test_h_corridor_script_crops_through_the_engine(tmp_path, monkeypatch):
+    from multimaze_recorder.processing import array_to_h_corridors
+
+    calls = []
+    monkeypatch.setattr(crop_engine, "process_folder", lambda *args, **kwargs: calls.append((args, kwargs)))
+    for name in ("A_Recorded", "B_Recorded", "B_Cropped", "C_Processing"):
+        (tmp_path / name).mkdir()
+    monkeypatch.setattr(sys, "argv", ["mmrecorder-crop-h-corridors", "--data-folder", str(tmp_path)])
+    array_to_h_corridors.main()
+
+    # B is already cropped; interrupted runs are resumed by the engine itself
+    assert calls == [((tmp_path / "A_Recorded", ["h-corridors"]), {"regions": {"h-corridors": "h_corridors"}})]
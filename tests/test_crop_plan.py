@@ -0,0 +1,102 @@
+"""Unit tests for crop plans (processing/crop_plan.py)."""
+
+import cv2
+import numpy as np
+import pytest
+
+from multimaze_recorder.processing.crop_plan import (
+    CropPlan,
+    arena_plan,
+    corridor_plan,
+    f1_plan,
+    rotate_box,
+    rotation_from_folder_name,
+)
+
+
+@pytest.fixture
+def frame():
+    return np.arange(60 * 80, dtype=np.uint32).reshape(60, 80).astype(np.uint8)
+
+
+def test_rotation_from_folder_name():
+    assert rotation_from_folder_name("/data/240101_Exp_flip_Recorded") == "flip"
+    assert rotation_from_folder_name("/data/240101_Exp_RotateL") == "rotatel"
+    assert rotation_from_folder_name("/data/240101_Exp_rotater") == "rotater"
+    assert rotation_from_folder_name("/data/240101_Exp") is None
+
+
+@pytest.mark.parametrize("turns", range(4))
+def test_rotate_box_follows_numpy_rotations(frame, turns):
+    box = (3, 5, 41, 57)
+    x1, y1, x2, y2 = rotate_box(box, 80, 60, turns)
+    turned = np.rot90(frame, -turns)
+    assert np.array_equal(turned[y1:y2, x1:x2], np.rot90(frame[5:57, 3:41], -turns))
+    assert rotate_box((x1, y1, x2, y2), *turned.shape[::-1], -turns) == box
+
+
+@pytest.mark.parametrize("rotation", [None, "flip", "rotatel", "rotater"])
+@pytest.mark.parametrize("rotate", [None, "cw", "ccw", "180"])
+def test_source_boxes_crop_without_rotating_the_frame(frame, rotation, rotate):
+    plan = CropPlan(
+        [
+            {"name": "a", "box": (3, 5, 41, 57), "rotate": rotate},
+            {"name": "clipped", "box": (30, 20, 90, 90), "rotate": rotate},
+        ],
+        rotation=rotation,
+    )
+    for (name, expected), roi in zip(plan.crops(frame), plan.rois):
+        (x1, y1, x2, y2), turns = plan.source(roi, 80, 60)
+        assert np.array_equal(np.rot90(frame[y1:y2, x1:x2], -turns), expected), name
+
+
+def test_plan_rejects_bad_geometry():
+    with pytest.raises(ValueError):
+        CropPlan([{"name": "a", "box": (10, 10, 5, 20)}])
+    with pytest.raises(ValueError):
+        CropPlan([{"name": "a", "box": (0, 0, 5, 5), "rotate": "sideways"}])
+    with pytest.raises(ValueError):
+        CropPlan([], rotation="upside")
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    plan = corridor_plan([[(0, 0, 10, 20), (10, 0, 20, 20)]], rotation="flip")
+    plan.save(tmp_path / "plan.json")
+    loaded = CropPlan.load(tmp_path / "plan.json")
+    assert loaded.names == ["arena1/corridor1", "arena1/corridor2"]
+    assert loaded.rotation == "flip"
+    assert loaded.to_dict() == plan.to_dict()
+
+
+def test_arena_plan_matches_array_to_arenas(frame):
+    plan = arena_plan([(3, 5, 30, 40)])
+    (name, crop), = plan.crops(frame)
+    assert name == "arena1"
+    # array_to_arenas trims odd widths and heights down to even values
+    np.testing.assert_array_equal(crop, frame[5:39, 3:29])
+
+
+def test_global_rotation_is_applied_first(frame):
+    plan = CropPlan([{"name": "a", "box": (0, 0, 10, 10)}], rotation="rotater")
+    (_, crop), = plan.crops(frame[:, :, None])
+    rotated = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+    np.testing.assert_array_equal(crop, rotated[0:10, 0:10])
+
+
+@pytest.mark.parametrize("orientation", ["std", "hz"])
+def test_f1_plan_matches_array_to_f1_tracks(frame, orientation):
+    region = (4, 2, 50, 58)
+    crops = dict(f1_plan([region], [orientation]).crops(frame))
+
+    # Reference: the crop/rotate/split sequence of the former array_to_f1_tracks.process_image
+    arena = frame[2:58, 4:50]
+    if orientation == "hz":
+        arena = cv2.rotate(arena, cv2.ROTATE_90_CLOCKWISE)
+    width = arena.shape[1]
+    half = width // 2
+    if half % 2 != 0:
+        half -= 1
+    np.testing.assert_array_equal(crops["arena1/Left"], arena[:, :half])
+    np.testing.assert_array_equal(
+        crops["arena1/Right"], cv2.rotate(arena[:, width - half:], cv2.ROTATE_180)
+    )
@@ -0,0 +1,71 @@
+"""Unit tests for the per-frame timing sidecar."""
+
+import numpy as np
+
+from multimaze_recorder.camera.ring import Frame
+from multimaze_recorder.recording.frame_log import (
+    FRAME_LOG_FILE,
+    PARTIAL_FILE,
+    PTS_NONE,
+    FrameLog,
+    copy_frame_log,
+    load_frame_log,
+    summarize,
+)
+
+
+def _frame(seq, pts=None, time=None):
+    return Frame(seq, pts, time, 0, None)
+
+
+def test_close_converts_partial_log(tmp_path):
+    log = FrameLog(tmp_path, fps=10)
+    log.append(0, _frame(0, pts=1_000, time=5.0))
+    log.append(1, _frame(1, pts=None, time=5.1))
+    assert (tmp_path / PARTIAL_FILE).exists()
+    log.close()
+
+    assert not (tmp_path / PARTIAL_FILE).exists()
+    records = load_frame_log(tmp_path)
+    assert list(records["frame"]) == [0, 1]
+    assert list(records["pts"]) == [1_000, PTS_NONE]
+    assert list(records["pulse"]) == [-1, -1]
+
+
+def test_unfinished_recording_is_still_readable(tmp_path):
+    log = FrameLog(tmp_path)
+    log.append(0, _frame(0))
+    log._file.flush()
+    assert len(load_frame_log(tmp_path)) == 1
+    log.close()
+
+
+def test_summary_counts_lost_frames_and_pulses(tmp_path):
+    # 10 fps trigger: pulse 2 produced no buffer, buffer seq 3 was lost after capture
+    log = FrameLog(tmp_path, fps=10, triggered=True)
+    for frame_number, (seq, pulse) in enumerate([(0, 0), (1, 1), (2, 3), (4, 5)]):
+        log.append(frame_number, _frame(seq, pts=pulse * 100_000_000, time=float(pulse)))
+    log.close()
+
+    records = load_frame_log(tmp_path)
+    assert list(records["pulse"]) == [0, 1, 3, 5]
+    summary = summarize(records)
+    assert summary["frames"] == 4
+    assert summary["dropped"] == 1
+    assert summary["missed_pulses"] == 2
+    assert summary["duration"] == 0.5
+    assert np.isclose(summary["fps"], 6.0)
+
+
+def test_copy_frame_log(tmp_path):
+    source, target = tmp_path / "a_Recorded", tmp_path / "a_Cropped"
+    source.mkdir()
+    target.mkdir()
+    copy_frame_log(source, target)
+    assert not (target / FRAME_LOG_FILE).exists()
+
+    log = FrameLog(source)
+    log.append(0, _frame(0))
+    log.close()
+    copy_frame_log(source, target)
+    assert len(load_frame_log(target)) == 1
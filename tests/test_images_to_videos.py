@@ -0,0 +1,107 @@
+"""Unit tests for video encoding (processing/images_to_videos.py)."""
+
+import threading
+import time
+
+from multimaze_recorder.processing import images_to_videos
+from multimaze_recorder.processing.images_to_videos import (
+    JOB_MEMORY,
+    create_video_from_images,
+    encode_slots,
+    frame_images,
+    measure_read_rate,
+    search_folder_for_images,
+)
+
+
+def test_encode_slots_are_limited_by_cores_memory_and_disk(monkeypatch):
+    monkeypatch.setattr(images_to_videos, "ENCODE_JOBS", 0)
+    monkeypatch.setattr(images_to_videos, "ENCODE_THREADS", 0)
+    assert encode_slots(54, cores=32) == (8, 4)
+    assert encode_slots(3, cores=32) == (3, 10)
+    assert encode_slots(54, cores=32, memory=3 * JOB_MEMORY) == (3, 10)
+    # 4 encodes of 10 kB frames at 150 fps read 6 MB/s
+    assert encode_slots(54, cores=32, read_rate=6e6, frame_bytes=1e4) == (4, 8)
+    assert encode_slots(54, cores=2, memory=1) == (1, 2)
+
+    monkeypatch.setattr(images_to_videos, "ENCODE_JOBS", 6)
+    monkeypatch.setattr(images_to_videos, "ENCODE_THREADS", 2)
+    assert encode_slots(54, cores=32, memory=1) == (6, 2)
+
+
+def test_read_rate_sample_gives_the_mean_frame_size(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        for n in range(5):
+            (tmp_path / name / f"image{n}_cropped.jpg").write_bytes(b"x" * 1000)
+    rate, frame_bytes = measure_read_rate([tmp_path / "a", tmp_path / "b"])
+    assert rate > 0 and frame_bytes == 1000
+    assert measure_read_rate([]) == (None, None)
+
+
+def test_videos_are_encoded_concurrently_and_failures_retried_on_cpu(tmp_path, monkeypatch):
+    monkeypatch.setattr(images_to_videos, "ENCODE_JOBS", 3)
+    source = tmp_path / "Exp_Cropped_Checked"
+    names = [f"corridor{n}" for n in range(6)]
+    for name in names:
+        (source / "arena1" / name).mkdir(parents=True)
+        (source / "arena1" / name / "image0_cropped.jpg").write_bytes(b"x")
+
+    lock = threading.Lock()
+    running, peak, calls = [0], [0], []
+
+    def fake_encode(images, output, name, fps, cpu_only=False, threads=None, **kwargs):
+        with lock:
+            calls.append((name, cpu_only))
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        # corridor1 only fails next to other encodes, corridor4 always does
+        ok = name != "corridor4" and (name != "corridor1" or cpu_only)
+        return {"success": ok, "method_used": "cpu", "message": "done" if ok else "failed"}
+
+    monkeypatch.setattr(images_to_videos, "create_video_from_images", fake_encode)
+    output = tmp_path / "out"
+    stats = search_folder_for_images(source, output, 29)
+
+    assert peak[0] == 3
+    assert stats["total"] == 6
+    assert stats["created_successfully"] == 5
+    assert stats["failed"] == 1
+    assert sorted(name for name, cpu_only in calls if cpu_only) == ["corridor1", "corridor4"]
+    log = (output / "failed_videos.log").read_text()
+    assert "Video: corridor4" in log and "corridor1" not in log
+
+
+def test_rotation_is_applied_by_the_encode_itself(tmp_path, monkeypatch):
+    (tmp_path / "image0_cropped.jpg").write_bytes(b"x")
+    commands = []
+
+    def fake_ffmpeg(command, log, frames=None, timeout=None):
+        commands.append(command)
+        temp = tmp_path / "corridor1_temp.mp4"
+        temp.write_bytes(b"\0" * 2048)
+        return 0
+
+    monkeypatch.setattr(images_to_videos, "run_ffmpeg", fake_ffmpeg)
+    monkeypatch.setattr(images_to_videos, "check_video_integrity", lambda path: True)
+    # No second ffmpeg pass to rotate the encoded video
+    monkeypatch.setattr(images_to_videos.subprocess, "run", None)
+    result = create_video_from_images(
+        tmp_path, tmp_path, "corridor1", 29, rotation="rotater", threads=4
+    )
+
+    assert result["success"] and result["method_used"] == "cuda"
+    assert len(commands) == 1
+    assert "-vf transpose=1 -pix_fmt yuv420p" in commands[0]
+    assert "-x265-params pools=4" in commands[0]
+    assert (tmp_path / "corridor1.mp4").exists()
+    assert not (tmp_path / "corridor1_temp.mp4").exists()
+
+
+def test_frames_reach_ffmpeg_in_order_across_dropped_frames(tmp_path):
+    for n in (0, 1, 2, 10, 11):
+        (tmp_path / f"image{n}_cropped.jpg").write_bytes(str(n).encode())
+    assert list(frame_images(tmp_path)) == [b"0", b"1", b"2", b"10", b"11"]
@@ -0,0 +1,142 @@
+"""Unit tests for lossless JPEG crops (processing/jpeg_transform.py)."""
+
+import cv2
+import numpy as np
+import pytest
+
+from multimaze_recorder.processing import jpeg_transform
+from multimaze_recorder.processing.crop_engine import CropEngine, CropOutput, LosslessCropEngine
+from multimaze_recorder.processing.crop_plan import CropPlan
+from multimaze_recorder.processing.jpeg_transform import lossless_box, snap_plan
+
+# Recorded frames are not a whole number of MCUs wide or high
+HEIGHT, WIDTH = 100, 130
+
+
+class PixelTransformer:
+    """Stand-in for libturbojpeg doing the same crops on decoded pixels."""
+
+    def header(self, data):
+        height, width = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE).shape
+        return width, height, 3
+
+    def transform(self, data, regions):
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        crops = []
+        for turns, (x, y, w, h) in regions:
+            assert x % 8 == 0 and y % 8 == 0
+            height, width = frame.shape
+            trimmed = frame[
+                : height - height % 8 if turns in (1, 2) else height,
+                : width - width % 8 if turns in (2, 3) else width,
+            ]
+            turned = np.rot90(trimmed, -turns)
+            assert y + h <= turned.shape[0] and x + w <= turned.shape[1]
+            crops.append(cv2.imencode(".png", turned[y : y + h, x : x + w])[1].tobytes())
+        return crops
+
+
+@pytest.fixture
+def frame():
+    return np.random.default_rng(0).integers(0, 255, (HEIGHT, WIDTH), dtype=np.uint8)
+
+
+def plan(rotation):
+    return CropPlan(
+        [
+            {"name": "a", "box": (3, 5, 41, 57), "rotate": None},
+            {"name": "b", "box": (50, 21, 71, 90), "rotate": "cw"},
+            {"name": "c", "box": (11, 60, 35, 93), "rotate": "180"},
+        ],
+        rotation=rotation,
+    )
+
+
+@pytest.mark.parametrize("rotation", [None, "rotater", "flip", "rotatel"])
+def test_snapped_plans_can_be_cut_losslessly(rotation):
+    original = plan(rotation)
+    snapped = snap_plan(original, WIDTH, HEIGHT)
+    for before, roi in zip(original.rois, snapped.rois):
+        x1, y1, x2, y2 = roi["box"]
+        assert (x2 - x1) % 2 == 0 and (y2 - y1) % 2 == 0
+        # ROIs grow by less than an MCU and shrink by at most a pixel
+        bx1, by1, bx2, by2 = before["box"]
+        assert bx1 - 8 < x1 <= bx1 + 1 and by1 - 8 < y1 <= by1 + 1
+        assert bx2 - 1 <= x2 < bx2 + 8 and by2 - 1 <= y2 < by2 + 8
+        if lossless_box(original, before, WIDTH, HEIGHT) is not None:
+            assert roi == before
+    # ROI "a" of the right-rotated frame reaches into the trimmed partial MCU row
+    cut = [lossless_box(snapped, roi, WIDTH, HEIGHT) is not None for roi in snapped.rois]
+    assert cut == ([False, True, True] if rotation == "rotater" else [True, True, True])
+
+
+@pytest.mark.parametrize("rotation", [None, "rotater", "flip", "rotatel"])
+def test_lossless_engine_matches_pixel_crops(tmp_path, frame, rotation):
+    cv2.imwrite(str(tmp_path / "image0.png"), frame)
+    output = CropOutput(snap_plan(plan(rotation), WIDTH, HEIGHT), tmp_path / "out")
+    engine = LosslessCropEngine([output], transformer=PixelTransformer())
+    engine.make_folders()
+    assert engine.process(tmp_path, "image0.png")
+
+    cut = {
+        output.folder / roi["name"]
+        for roi in output.plan.rois
+        if lossless_box(output.plan, roi, WIDTH, HEIGHT) is not None
+    }
+    for subfolder, expected in CropEngine([output]).crops(frame):
+        cropped = cv2.imread(str(subfolder / "image0_cropped.jpg"), cv2.IMREAD_GRAYSCALE)
+        assert cropped.shape == expected.shape
+        if subfolder in cut:
+            assert np.array_equal(cropped, expected)
+        else:
+            # Re-encoded from pixels
+            assert np.abs(cropped.astype(int) - expected).mean() < 10
+
+
+def test_lossless_engine_falls_back_on_unreadable_frames(tmp_path, frame):
+    (tmp_path / "image0.jpg").write_bytes(b"not a jpeg")
+    output = CropOutput(snap_plan(plan(None), WIDTH, HEIGHT), tmp_path / "out")
+    engine = LosslessCropEngine([output], transformer=jpeg_transform_or_pixels())
+    engine.make_folders()
+    assert not engine.process(tmp_path, "image0.jpg")
+    assert not engine.process(tmp_path, "image1.jpg")
+
+
+def jpeg_transform_or_pixels():
+    if jpeg_transform.available():
+        return jpeg_transform.TurboTransformer()
+
+    class Failing(PixelTransformer):
+        def header(self, data):
+            raise jpeg_transform.JPEGTransformError("Not a JPEG file")
+
+    return Failing()
+
+
+@pytest.mark.skipif(not jpeg_transform.available(), reason="libturbojpeg not installed")
+@pytest.mark.parametrize("rotation", [None, "rotater", "flip", "rotatel"])
+def test_libturbojpeg_crops_decode_like_the_recorded_frame(tmp_path, frame, rotation):
+    cv2.imwrite(str(tmp_path / "image0.jpg"), frame)
+    recorded = cv2.imread(str(tmp_path / "image0.jpg"), cv2.IMREAD_GRAYSCALE)
+    output = CropOutput(snap_plan(plan(rotation), WIDTH, HEIGHT), tmp_path / "out")
+    engine = LosslessCropEngine([output])
+    engine.make_folders()
+    assert engine.process(tmp_path, "image0.jpg")
+
+    for subfolder, expected in CropEngine([output]).crops(recorded):
+        cropped = cv2.imread(str(subfolder / "image0_cropped.jpg"), cv2.IMREAD_GRAYSCALE)
+        assert cropped.shape == expected.shape
+        assert np.abs(cropped.astype(int) - expected).mean() < 10
+
+
+@pytest.mark.skipif(not jpeg_transform.available(), reason="libturbojpeg not installed")
+def test_decoder_fills_the_requested_region_of_a_reused_buffer(frame):
+    data = cv2.imencode(".jpg", frame)[1].tobytes()
+    reference = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    decoder = jpeg_transform.TurboDecoder()
+
+    full = decoder.decode(data)
+    np.testing.assert_array_equal(full, reference)
+    band = decoder.decode(data, (21, 30, 70, 61))
+    assert band is full
+    np.testing.assert_array_equal(band[30:61, 21:70], reference[30:61, 21:70])
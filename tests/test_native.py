@@ -0,0 +1,97 @@
+"""Tests for the native GStreamer record branch (videotestsrc stands in for tcambin)."""
+
+import pytest
+
+from multimaze_recorder.recording import native
+from multimaze_recorder.recording.sinks import NativeSink, make_sink, native_branch
+
+
+CROPPING = {"Left": 2, "Top": 4, "Right": 41, "Bottom": 35}
+CONFIGS = {"format": {"width": 64, "height": 48}, "cropping": CROPPING}
+
+
+def test_plain_pipeline_is_unchanged():
+    assert native.pipeline_description() == (
+        "tcambin name=source ! capsfilter name=caps ! queue !  appsink name=sink"
+    )
+
+
+def test_videocrop_keeps_the_cropping_box():
+    assert native.videocrop(CROPPING, (64, 48)) == (
+        "videocrop left=2 top=4 right=23 bottom=13"
+    )
+    # 39x31 is trimmed to 38x30 for 4:2:0 encoders
+    assert native.videocrop(CROPPING, (64, 48), even=True) == (
+        "videocrop left=2 top=4 right=24 bottom=14"
+    )
+
+
+def test_branch_pipeline_samples_preview_frames():
+    branch = native.record_branch("native-jpeg", CROPPING, (64, 48), quality=90)
+    p = native.pipeline_description(branch=branch, preview_rate=4)
+    assert "tee name=t t. ! valve name=record_valve drop=true" in p
+    assert "jpegenc quality=90 ! multifilesink name=record_sink" in p
+    assert "videorate drop-only=true max-rate=4" in p
+    assert p.endswith("appsink name=sink")
+
+    with pytest.raises(ValueError):
+        native.record_branch("jpeg")
+
+
+def test_record_location(tmp_path):
+    folder = tmp_path / "Exp1"
+    assert native.record_location("native-jpeg", folder) == str(folder / "image%d.jpg")
+    assert native.record_location("native-video", folder) == str(folder / "Exp1.mp4")
+
+
+def test_native_formats_select_native_sink(tmp_path, monkeypatch):
+    monkeypatch.delenv("MMRECORDER_CROP_PLAN", raising=False)
+    monkeypatch.delenv("MMRECORDER_RECORD_FORMAT", raising=False)
+    assert native_branch(CONFIGS) is None
+
+    monkeypatch.setenv("MMRECORDER_RECORD_FORMAT", "native-video")
+    assert "splitmuxsink" in native_branch(CONFIGS)
+    assert "videorate" not in native_branch(CONFIGS)
+    assert "! videorate drop-only=true max-rate=29 !" in native_branch(CONFIGS, max_rate=29)
+    sink = make_sink(tmp_path, tmp_path / "preset.json", CONFIGS, None, 29, camera=object())
+    assert isinstance(sink, NativeSink)
+    assert sink.finished_suffix == "_Recorded"
+
+
+def _gst():
+    gi = pytest.importorskip("gi")
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+
+    Gst.init(None)
+    for factory in ("videotestsrc", "videocrop", "jpegenc", "multifilesink", "videorate", "valve"):
+        if Gst.ElementFactory.find(factory) is None:
+            pytest.skip(f"GStreamer element {factory} is not installed")
+    return Gst
+
+
+def test_videotestsrc_records_every_frame_natively(tmp_path):
+    Gst = _gst()
+    branch = native.record_branch("native-jpeg", CROPPING, (64, 48))
+    pipeline = Gst.parse_launch(
+        native.pipeline_description(
+            branch=branch, source="videotestsrc num-buffers=30 name=source"
+        )
+    )
+    pipeline.get_by_name("caps").set_property(
+        "caps",
+        Gst.Caps.from_string("video/x-raw,format=GRAY8,width=64,height=48,framerate=30/1"),
+    )
+    pipeline.get_by_name("record_sink").set_property(
+        "location", native.record_location("native-jpeg", tmp_path)
+    )
+    pipeline.get_by_name("record_valve").set_property("drop", False)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(
+        10 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR
+    )
+    pipeline.set_state(Gst.State.NULL)
+
+    assert message is not None and message.type == Gst.MessageType.EOS
+    assert len(list(tmp_path.glob("image*.jpg"))) == 30
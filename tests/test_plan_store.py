@@ -0,0 +1,117 @@
+"""Unit tests for the crop plan store (processing/plan_store.py)."""
+
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+from multimaze_recorder.processing import crop_engine, plan_store
+from multimaze_recorder.processing.crop_plan import CropPlan, corridor_plan
+from multimaze_recorder.processing.plan_store import PlanStore, read_rig, write_rig
+
+
+def rig_frame(dx=0, dy=0, seed=0):
+    """Synthetic rig seen by a camera moved by (dx, dy), with fresh sensor noise."""
+    scene = np.random.default_rng(100).integers(0, 30, (560, 720), dtype=np.uint8)
+    for x in range(80, 680, 90):
+        for y in (80, 300):
+            cv2.rectangle(scene, (x, y), (x + 40, y + 160), 220, -1)
+    frame = scene[40 + dy : 520 + dy, 40 + dx : 680 + dx]
+    noise = np.random.default_rng(seed).integers(0, 12, frame.shape, dtype=np.uint8)
+    return cv2.add(frame, noise)
+
+
+@pytest.fixture
+def plan():
+    return corridor_plan([[(40, 40, 80, 200), (130, 40, 170, 200)]])
+
+
+def test_rig_file_round_trip(tmp_path):
+    write_rig(tmp_path, {"format": {"serial": 4810}})
+    assert read_rig(tmp_path) == (plan_store.RIG, "4810")
+    assert read_rig(tmp_path / "missing") == (plan_store.RIG, "unknown")
+
+
+def test_saved_plans_are_versioned_crop_plan_files(tmp_path, plan):
+    store = PlanStore("rig A", "4810", root=tmp_path)
+    key = store.key("corridors", rotation="rotater")
+    assert store.latest(key) is None
+    assert store.save(key, plan, rig_frame(), "Exp1_Recorded") == 1
+    assert store.save(key, plan, rig_frame(), "Exp2_Recorded") == 2
+
+    stored = store.latest(key)
+    assert stored.version == 2
+    assert stored.path == tmp_path / "rig-A_4810" / "corridors_corridors_rotater" / "v2.json"
+    assert CropPlan.load(stored.path).to_dict() == plan.to_dict()
+
+
+@pytest.mark.parametrize(
+    "frame, reused",
+    [
+        (rig_frame(seed=1), True),
+        (rig_frame(dx=1, dy=1, seed=1), True),
+        (rig_frame(dx=24, seed=1), False),
+        (np.random.default_rng(2).integers(0, 255, (480, 640), dtype=np.uint8), False),
+        (rig_frame()[:400], False),
+    ],
+)
+def test_plan_is_reused_only_while_the_rig_has_not_moved(tmp_path, plan, frame, reused):
+    store = PlanStore("rig", "1", root=tmp_path)
+    key = store.key("corridors")
+    store.save(key, plan, rig_frame())
+    assert (store.match(key, frame) is not None) == reused
+
+
+def test_plan_layout_detects_once_then_reuses(tmp_path, plan, monkeypatch):
+    detections = []
+
+    def plan_folder(folder, output, plan=None):
+        if plan is None:
+            detections.append(folder.name)
+            return corridor_plan([[(40, 40, 80, 200)]])
+        return plan
+
+    module = types.SimpleNamespace(STORE_PLANS=True, plan_folder=plan_folder)
+    monkeypatch.setitem(sys.modules, "fake_layout", module)
+    monkeypatch.setitem(crop_engine.LAYOUTS, "fake", "fake_layout")
+    monkeypatch.setattr(plan_store, "PLAN_STORE", tmp_path / "store")
+
+    def recording(name, frame):
+        folder = tmp_path / name
+        folder.mkdir()
+        cv2.imwrite(str(folder / "image0.jpg"), frame)
+        write_rig(folder, {"format": {"serial": 7}})
+        return folder
+
+    crop_engine.plan_layout("fake", recording("A_Recorded", rig_frame()), tmp_path)
+    crop_engine.plan_layout("fake", recording("B_Recorded", rig_frame(seed=3)), tmp_path)
+    crop_engine.plan_layout("fake", recording("C_Recorded", rig_frame(dy=30)), tmp_path)
+
+    assert detections == ["A_Recorded", "C_Recorded"]
+    store = PlanStore.for_recording(tmp_path / "C_Recorded")
+    assert store.latest(store.key("fake")).version == 2
+
+
+def test_recordings_without_rig_file_bypass_the_store(tmp_path, monkeypatch):
+    detections = []
+
+    def plan_folder(folder, output, plan=None):
+        assert plan is None
+        detections.append(folder.name)
+        return corridor_plan([[(40, 40, 80, 200)]])
+
+    module = types.SimpleNamespace(STORE_PLANS=True, plan_folder=plan_folder)
+    monkeypatch.setitem(sys.modules, "fake_layout", module)
+    monkeypatch.setitem(crop_engine.LAYOUTS, "fake", "fake_layout")
+    monkeypatch.setattr(plan_store, "PLAN_STORE", tmp_path / "store")
+
+    for name in ("A_Recorded", "B_Recorded"):
+        folder = tmp_path / name
+        folder.mkdir()
+        cv2.imwrite(str(folder / "image0.jpg"), rig_frame())
+        crop_engine.plan_layout("fake", folder, tmp_path)
+
+    assert detections == ["A_Recorded", "B_Recorded"]
+    assert not (tmp_path / "store").exists()
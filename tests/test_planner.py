@@ -0,0 +1,72 @@
+"""Tests for the pre-flight storage and bandwidth planner."""
+
+import json
+
+import numpy as np
+
+from multimaze_recorder.recording import planner
+
+CONFIGS = {
+    "format": {"width": 64, "height": 48, "framerate": "30/1"},
+    "cropping": {"Left": 0, "Top": 0, "Right": 64, "Bottom": 48},
+    "properties": [],
+}
+
+
+def _presets(tmp_path, **extra):
+    path = tmp_path / "presets.json"
+    path.write_text(json.dumps({**CONFIGS, **extra}))
+    return str(path), {**CONFIGS, **extra}
+
+
+def test_levels():
+    # 1 MB frames at 10 fps for 100 s: 1 GB at 10 MB/s
+    assert planner.evaluate(1e6, 10, 100, 100e9, 500)[2:] == ("ok", [])
+    assert planner.evaluate(1e6, 10, 100, 1.05e9, 500)[2] == "warn"
+    assert planner.evaluate(1e6, 10, 100, 0.5e9, 500)[2] == "block"
+    assert planner.evaluate(1e6, 10, 100, 100e9, 15)[2] == "warn"
+    total, required, level, messages = planner.evaluate(1e6, 10, 100, 100e9, 5)
+    assert (total, required, level) == (1e9, 10, "block")
+    assert "needs 10 MB/s" in messages[0]
+
+
+def test_raw_frames_are_their_crop_size(tmp_path, monkeypatch):
+    monkeypatch.delenv("MMRECORDER_RECORD_FORMAT", raising=False)
+    monkeypatch.delenv("MMRECORDER_CROP_PLAN", raising=False)
+    presets, configs = _presets(tmp_path)
+    frames = planner.calibration_frames(configs, count=10)
+    size = planner.estimate_frame_bytes(tmp_path / "raw", presets, configs, 30, frames, "raw")
+    assert 64 * 48 <= size < 64 * 48 * 1.1
+
+
+def test_plan_uses_given_frames_and_the_target_disk(tmp_path, monkeypatch):
+    monkeypatch.delenv("MMRECORDER_RECORD_FORMAT", raising=False)
+    monkeypatch.delenv("MMRECORDER_CROP_PLAN", raising=False)
+    presets, configs = _presets(tmp_path, jpeg_quality=90)
+    flat = [np.full((48, 64, 1), 128, np.uint8)]
+    noisy = [np.random.default_rng(0).integers(0, 256, (48, 64, 1), dtype=np.uint8)]
+
+    local_path = tmp_path / "Videos"
+    small = planner.plan_recording(presets, configs, 30, 60, local_path, flat)
+    large = planner.plan_recording(presets, configs, 30, 60, local_path, noisy)
+    assert small.record_format == "jpeg" and small.level == "ok"
+    assert small.frame_bytes < large.frame_bytes
+    assert large.total_bytes == large.frame_bytes * 30 * 60
+    assert small.write_mb_per_s > 0 and small.free_bytes > 0
+    # The calibration folder is removed again
+    assert list(local_path.iterdir()) == []
+    assert "kB/frame" in planner.format_plan(small)
+
+
+def test_write_test_syncs_only_its_own_files(tmp_path, monkeypatch):
+    synced = []
+    real_fsync = planner.os.fsync
+    monkeypatch.setattr(planner.os, "fsync", lambda fd: (synced.append(fd), real_fsync(fd)))
+
+    def no_global_sync():
+        raise AssertionError("os.sync() flushes every mounted filesystem")
+
+    monkeypatch.setattr(planner.os, "sync", no_global_sync)
+    assert planner.measure_write_speed(tmp_path, 2**20, total_mb=3) > 0
+    assert len(synced) == 3
+    assert not list(tmp_path.iterdir())
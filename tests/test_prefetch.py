@@ -0,0 +1,66 @@
+"""Unit tests for frame read-ahead (processing/prefetch.py)."""
+
+import threading
+import time
+
+import numpy as np
+
+from multimaze_recorder.processing.prefetch import ordered_map, read_ahead
+from multimaze_recorder.processing.verify_cropping import verify_single_folder
+from multimaze_recorder.recording.chunks import ChunkWriter
+
+
+def test_results_come_in_order_with_a_bounded_number_in_flight():
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def slow(n):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.001 * (n % 3))
+        with lock:
+            running[0] -= 1
+        return n * n
+
+    results = list(ordered_map(slow, range(40), depth=4, threads=8))
+    assert results == [(n, n * n) for n in range(40)]
+    assert peak[0] <= 4
+
+
+def test_reads_overlap_instead_of_queueing():
+    start = time.perf_counter()
+    list(ordered_map(lambda n: time.sleep(0.02), range(20), depth=10, threads=10))
+    assert time.perf_counter() - start < 0.3
+
+
+def test_read_ahead_returns_file_contents(tmp_path):
+    (tmp_path / "image0.jpg").write_bytes(b"first")
+    (tmp_path / "image2.jpg").write_bytes(b"third")
+    images = ["image0.jpg", "image1.jpg", "image2.jpg"]
+    for depth in (0, 2):
+        assert list(read_ahead(tmp_path, images, depth=depth)) == [
+            ("image0.jpg", b"first"),
+            ("image1.jpg", None),
+            ("image2.jpg", b"third"),
+        ]
+
+
+def test_raw_recordings_are_not_read_ahead(tmp_path):
+    writer = ChunkWriter(tmp_path, 6, 8)
+    writer.write(0, np.zeros((6, 8), dtype=np.uint8))
+    writer.close()
+    assert list(read_ahead(tmp_path, ["image0.jpg"])) == [("image0.jpg", None)]
+
+
+def test_verification_counts_every_arena_subfolder(tmp_path):
+    recorded, cropped = tmp_path / "Exp_Recorded", tmp_path / "Exp_Cropped"
+    recorded.mkdir()
+    (recorded / "image0.jpg").write_bytes(b"x")
+    for n in range(1, 10):
+        for side in ("Left", "Right"):
+            (cropped / f"arena{n}" / side).mkdir(parents=True)
+            (cropped / f"arena{n}" / side / "image0_cropped.jpg").write_bytes(b"x")
+    assert verify_single_folder(recorded, cropped)
+    (cropped / "arena9" / "Right" / "image0_cropped.jpg").unlink()
+    assert not verify_single_folder(recorded, cropped)
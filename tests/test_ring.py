@@ -0,0 +1,59 @@
+"""Unit tests for the preallocated camera frame ring."""
+
+import numpy as np
+import pytest
+
+from multimaze_recorder.camera.ring import FrameRing
+
+
+def _frame(value, shape=(4, 6, 1)):
+    return np.full(shape, value, dtype=np.uint8).tobytes()
+
+
+def test_ring_requires_two_slots():
+    with pytest.raises(ValueError):
+        FrameRing(1, (4, 6, 1))
+
+
+def test_write_assigns_sequence_numbers():
+    ring = FrameRing(3, (4, 6, 1))
+    assert ring.write(_frame(1)) == 0
+    assert ring.write(_frame(2)) == 1
+    assert ring.latest_seq() == 1
+
+    frame = ring.acquire()
+    assert frame.seq == 1
+    assert frame.image.shape == (4, 6, 1)
+    assert np.all(frame.image == 2)
+    ring.release(frame)
+
+
+def test_acquire_by_sequence_number():
+    ring = FrameRing(3, (4, 6, 1))
+    ring.write(_frame(10), pts=100, host_time=1.5)
+    ring.write(_frame(20), pts=200, host_time=1.6)
+
+    frame = ring.acquire(0)
+    assert (frame.pts, frame.time) == (100, 1.5)
+    assert np.all(frame.image == 10)
+    ring.release(frame)
+
+    assert ring.acquire(42) is None
+
+
+def test_borrowed_slots_are_not_overwritten():
+    ring = FrameRing(2, (4, 6, 1))
+    ring.write(_frame(1))
+    held = ring.acquire(0)
+
+    # Slot 0 is borrowed and slot 1 holds the latest frame: nothing is free
+    ring.write(_frame(2))
+    assert ring.write(_frame(3)) is None
+    assert ring.dropped == 1
+    assert ring.next_seq == 3
+    assert np.all(held.image == 1)
+    assert ring.in_use() == 1
+
+    ring.release(held)
+    assert ring.in_use() == 0
+    assert ring.write(_frame(4)) == 3
@@ -0,0 +1,111 @@
+"""Unit tests for sharded ROI storage (processing/shards.py)."""
+
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from multimaze_recorder.processing import crop_engine
+from multimaze_recorder.processing.crop_engine import CropOutput, Manifest, crop_folder
+from multimaze_recorder.processing.crop_plan import arena_plan
+from multimaze_recorder.processing.images_to_videos import count_images_in_folder
+from multimaze_recorder.processing.shards import ShardReader, ShardWriter, is_sharded
+from multimaze_recorder.processing.verify_cropping import count_images
+
+
+def jpeg(value, shape=(16, 24)):
+    return cv2.imencode(".jpg", np.full(shape, value, dtype=np.uint8))[1].tobytes()
+
+
+def test_images_are_read_back_in_frame_order(tmp_path):
+    second = ShardWriter(tmp_path, 3)
+    for n in (3, 4):
+        second.write(n, jpeg(n))
+    second.close()
+    first = ShardWriter(tmp_path, 0)
+    for n in (0, 1, 2):
+        first.write(n, jpeg(n))
+    first.close()
+
+    assert is_sharded(tmp_path)
+    reader = ShardReader(tmp_path)
+    assert len(reader) == 5
+    assert [(n, data) for n, data in reader] == [(n, jpeg(n)) for n in range(5)]
+
+
+def test_unsynced_and_repeated_images_are_ignored(tmp_path):
+    writer = ShardWriter(tmp_path, 0)
+    writer.write(0, jpeg(0))
+    writer.write(1, jpeg(1))
+    writer.flush()
+    # Interrupted here: frame 2 is in the shard but was never indexed
+    writer.write(2, jpeg(2))
+    writer._file.flush()
+    assert ShardReader(tmp_path).frame_numbers.tolist() == [0, 1]
+
+    # The next run crops frames 1 and 2 again into the same shard
+    resumed = ShardWriter(tmp_path, 0)
+    resumed.write(1, jpeg(1))
+    resumed.write(2, jpeg(2))
+    resumed.close()
+    assert [(n, data) for n, data in ShardReader(tmp_path)] == [(n, jpeg(n)) for n in range(3)]
+
+
+def test_flush_syncs_the_images_then_their_index(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(
+        os, "fsync", lambda fd: synced.append(Path(os.readlink(f"/proc/self/fd/{fd}")).suffix) or fsync(fd)
+    )
+    writer = ShardWriter(tmp_path, 0)
+    writer.write(0, jpeg(0))
+    writer.flush()
+    assert synced == [".mjpeg", ".idx"]
+    writer.close()
+
+
+def test_shards_are_mjpeg_streams(tmp_path):
+    writer = ShardWriter(tmp_path, 0)
+    for n in range(4):
+        writer.write(n, jpeg(40 * n))
+    writer.close()
+    capture = cv2.VideoCapture(str(tmp_path / "frames_000000000.mjpeg"))
+    if not capture.isOpened():
+        pytest.skip("OpenCV was built without an MJPEG demuxer")
+    means = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        means.append(round(frame.mean()))
+    assert means == [0, 40, 80, 120]
+
+
+def test_crop_folder_writes_shards_that_resume_and_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(crop_engine, "REPORT_FRAMES", 2)
+    source = tmp_path / "Exp_Recorded"
+    source.mkdir()
+    frame = np.random.default_rng(0).integers(0, 255, (60, 80), dtype=np.uint8)
+    images = [f"image{n}.jpg" for n in range(7)]
+    for image in images:
+        cv2.imwrite(str(source / image), frame)
+    output = CropOutput(arena_plan([(0, 0, 20, 30), (40, 10, 80, 50)]), tmp_path / "out")
+
+    crop_folder(source, [output], images[:3], workers=1, progress=False, storage="shards")
+    # Cropping continues in shards whatever storage is asked for
+    crop_folder(source, [output], images, workers=1, progress=False, storage="files")
+
+    assert sorted(Manifest(output.folder).read()) == list(range(7))
+    for name in output.plan.names:
+        folder = output.folder / name
+        assert not list(folder.glob("*.jpg"))
+        assert len(list(folder.glob("*.mjpeg"))) == 2
+        assert count_images_in_folder(folder) == count_images(folder) == 7
+        reader = ShardReader(folder)
+        assert reader.frame_numbers.tolist() == list(range(7))
+    expected = dict(output.plan.crops(cv2.imread(str(source / "image0.jpg"), 0)))
+    _, data = next(iter(ShardReader(output.folder / "arena2")))
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    assert np.abs(image.astype(int) - expected["arena2"]).mean() < 10
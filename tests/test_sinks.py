@@ -0,0 +1,157 @@
+"""Unit tests for the recorder frame sinks (no camera or ffmpeg required)."""
+
+import time
+
+import numpy as np
+import pytest
+
+from multimaze_recorder.processing.crop_plan import CROP_PLAN_FILE, corridor_plan
+from multimaze_recorder.recording import sinks
+from multimaze_recorder.recording.writer import DROPPED_FILE, ImageWriter
+
+
+CROPPING = {"Left": 2, "Top": 4, "Right": 41, "Bottom": 35}
+
+
+@pytest.fixture
+def frame():
+    return np.random.default_rng(0).integers(0, 255, (60, 80, 1), dtype=np.uint8)
+
+
+@pytest.fixture
+def plan():
+    return corridor_plan([[(0, 0, 10, 20), (10, 0, 20, 20)]])
+
+
+class FakeEncoder:
+    instances = []
+
+    def __init__(self, path, width, height, fps):
+        self.path, self.width, self.height, self.fps = path, width, height, fps
+        self.frames = []
+        self.closed = False
+        FakeEncoder.instances.append(self)
+
+    def write(self, frame):
+        assert frame.shape == (self.height, self.width)
+        self.frames.append(frame.copy())
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_encoder(monkeypatch):
+    FakeEncoder.instances = []
+    monkeypatch.setattr(sinks, "FFmpegEncoder", FakeEncoder)
+    return FakeEncoder
+
+
+def test_jpeg_sink_writes_cropped_frames(tmp_path, frame):
+    writer = ImageWriter(tmp_path, workers=1)
+    sink = sinks.JpegSink(tmp_path, CROPPING, writer)
+    sink.write(0, frame)
+    sink.write(1, frame)
+    writer.shutdown()
+    assert (tmp_path / "image0.jpg").exists()
+    assert (tmp_path / "image1.jpg").exists()
+
+
+def test_crop_plan_sink_writes_cropped_layout(tmp_path, frame, plan):
+    writer = ImageWriter(tmp_path, workers=1)
+    sink = sinks.CropPlanSink(tmp_path, plan, writer)
+    sink.write(7, frame)
+    writer.shutdown()
+    assert (tmp_path / CROP_PLAN_FILE).exists()
+    assert (tmp_path / "arena1" / "corridor1" / "image7_cropped.jpg").exists()
+    assert (tmp_path / "arena1" / "corridor2" / "image7_cropped.jpg").exists()
+    assert sink.finished_suffix == "_Cropped"
+
+
+def test_crop_plan_sink_drops_frames_whole(tmp_path, frame, plan):
+    # Without workers the queue never drains; after frame 0 it has room for one ROI
+    writer = ImageWriter(tmp_path, workers=0, max_pending=3, policy="drop")
+    sink = sinks.CropPlanSink(tmp_path, plan, writer)
+    assert sink.write(0, frame) is True
+    assert sink.write(1, frame) is False
+    writer.shutdown()
+    dropped = (tmp_path / DROPPED_FILE).read_text().split()
+    assert len(dropped) == len(plan) and all("image1_" in path for path in dropped)
+
+
+def test_video_sink_full_frame(tmp_path, frame, fake_encoder):
+    folder = tmp_path / "Exp1"
+    folder.mkdir()
+    sink = sinks.VideoSink(folder, 29, cropping=CROPPING)
+    sink.write(0, frame)
+    sink.write(1, frame)
+    sink.close()
+
+    encoder, = fake_encoder.instances
+    assert encoder.path == folder / "Exp1.mp4"
+    # Odd cropping sizes are trimmed to even ones for the encoder
+    assert (encoder.width, encoder.height) == (38, 30)
+    assert len(encoder.frames) == 2
+    assert encoder.closed
+    assert sink.finished_suffix == "_Recorded"
+
+
+def test_video_sink_per_roi(tmp_path, frame, plan, fake_encoder):
+    sink = sinks.VideoSink(tmp_path, 29, cropping=CROPPING, plan=plan)
+    sink.write(0, frame)
+    sink.close()
+
+    paths = sorted(e.path for e in fake_encoder.instances)
+    assert paths == [
+        tmp_path / "arena1" / "corridor1" / "corridor1.mp4",
+        tmp_path / "arena1" / "corridor2" / "corridor2.mp4",
+    ]
+    assert sink.finished_suffix == "_Videos"
+
+
+def test_raw_sink_appends_to_container(tmp_path, frame):
+    from multimaze_recorder.recording.chunks import ChunkReader
+
+    sink = sinks.RawSink(tmp_path, CROPPING)
+    sink.write(0, frame)
+    sink.write(1, frame)
+    sink.close()
+
+    reader = ChunkReader(tmp_path)
+    assert list(reader.frame_numbers) == [0, 1]
+    np.testing.assert_array_equal(reader.frame(1), frame[4:35, 2:41, 0])
+
+
+def test_raw_sink_reports_a_frame_that_does_not_fit_the_chunks(tmp_path, frame):
+    sink = sinks.RawSink(tmp_path, CROPPING, queue_size=1)
+    sink.write(0, frame)
+    # A smaller frame gives a crop of another shape, which the chunks refuse
+    sink.write(1, frame[:20])
+    deadline = time.monotonic() + 5
+    while sink._error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(RuntimeError, match="failed"):
+        sink.write(2, frame)
+    with pytest.raises(RuntimeError, match="failed"):
+        sink.close()
+
+
+def test_make_sink_selects_format(tmp_path, monkeypatch, fake_encoder):
+    configs = {"cropping": CROPPING}
+    presets = tmp_path / "preset.json"
+    monkeypatch.delenv("MMRECORDER_CROP_PLAN", raising=False)
+
+    monkeypatch.delenv("MMRECORDER_RECORD_FORMAT", raising=False)
+    assert isinstance(sinks.make_sink(tmp_path, presets, configs, None, 29), sinks.JpegSink)
+
+    monkeypatch.setenv("MMRECORDER_RECORD_FORMAT", "video")
+    assert isinstance(sinks.make_sink(tmp_path, presets, configs, None, 29), sinks.VideoSink)
+
+    monkeypatch.setenv("MMRECORDER_RECORD_FORMAT", "raw")
+    sink = sinks.make_sink(tmp_path, presets, configs, None, 29)
+    assert isinstance(sink, sinks.RawSink)
+    sink.close()
+
+    monkeypatch.setenv("MMRECORDER_RECORD_FORMAT", "avi")
+    with pytest.raises(ValueError):
+        sinks.make_sink(tmp_path, presets, configs, None, 29)
@@ -0,0 +1,143 @@
+"""Tests for the Arduino trigger serial link against a pty-based fake Arduino."""
+
+import os
+import threading
+
+import pytest
+
+serial = pytest.importorskip("serial")
+pty = pytest.importorskip("pty")
+tty = pytest.importorskip("tty")
+
+from multimaze_recorder.recording.trigger_link import TriggerLink  # noqa: E402
+
+
+class FakeArduino:
+    """Speaks the ImageCapture_Trigger.ino protocol on the master side of a pty."""
+
+    def __init__(self, pulses_per_report=3, reports=2, echo_fps=None):
+        self.master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self.pulses_per_report = pulses_per_report
+        self.reports = reports
+        self.echo_fps = echo_fps
+        self.received = b""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _readline(self, terminator):
+        line = b""
+        while not line.endswith(terminator):
+            line += os.read(self.master, 1)
+        self.received += line
+        return line[: -len(terminator)].decode()
+
+    def _println(self, text):
+        os.write(self.master, f"{text}\r\n".encode())
+
+    def _run(self):
+        self._println("Arduino Ready")
+        if self._readline(b"\n") != "start":
+            return
+        fps = self._readline(b"*")
+        duration = self._readline(b"*")
+        self._println(f"Received updated fps value from Python: {self.echo_fps or fps}")
+        self._println(f"Received updated duration value from Python: {duration}")
+        for report in range(1, self.reports + 1):
+            self._println(f"pulses {report * self.pulses_per_report}")
+        self._println("done")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.thread.join(timeout=2)
+        os.close(self.master)
+        os.close(self._slave)
+
+
+def test_handshake_pulses_and_done():
+    arduino = FakeArduino()
+    # Opening the port flushes its input, so greet afterwards like a reset Arduino
+    link = TriggerLink(arduino.port, read_timeout=0.1)
+    arduino.start()
+    try:
+        ready = link.wait_ready(timeout=5)
+        acks = link.start(29, 60, timeout=5)
+        done = link.wait_done(timeout=5)
+    finally:
+        link.close()
+        arduino.close()
+
+    assert arduino.received == b"start\n29*60*"
+    assert [a.text.rsplit(" ", 1)[-1] for a in acks] == ["29", "60"]
+    assert ready.time <= acks[0].time <= done
+    assert link.pulse_count == 6
+    assert [count for _, count in link.pulses] == [3, 6]
+
+
+def test_wrong_acknowledgment_is_an_error():
+    arduino = FakeArduino(echo_fps=30)
+    link = TriggerLink(arduino.port, read_timeout=0.1)
+    arduino.start()
+    try:
+        link.wait_ready(timeout=5)
+        with pytest.raises(RuntimeError):
+            link.start(29, 60, timeout=5)
+    finally:
+        link.close()
+        arduino.close()
+
+
+def test_wait_times_out_without_messages():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    link = TriggerLink(os.ttyname(slave), read_timeout=0.1)
+    try:
+        with pytest.raises(TimeoutError):
+            link.wait_ready(timeout=0.3)
+        assert link.wait_done(timeout=0.2) is None
+    finally:
+        link.close()
+        os.close(master)
+        os.close(slave)
+
+
+class UnpluggedSerial:
+    """Serial port stub that greets, then fails like an unplugged Arduino."""
+
+    in_waiting = 0
+
+    def __init__(self, *args, **kwargs):
+        self.lines = [b"Arduino Ready\r\n"]
+
+    def read(self, size):
+        if self.lines:
+            return self.lines.pop(0)
+        raise serial.SerialException("device reports readiness to read but returned no data")
+
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_serial_errors_reach_the_waiting_recorder(monkeypatch):
+    monkeypatch.setattr(serial, "Serial", UnpluggedSerial)
+    link = TriggerLink("/dev/ttyACM0")
+    try:
+        assert link.wait_ready(timeout=5).text == "Arduino Ready"
+        # The loop of mmrecorder-trigger ends instead of polling forever
+        with pytest.raises(serial.SerialException):
+            while link.wait_done(timeout=1) is None:
+                pass
+        with pytest.raises(serial.SerialException):
+            link.wait_for(lambda text: True, timeout=1)
+    finally:
+        link.close()
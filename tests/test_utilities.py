@@ -28,12 +28,12 @@ def patch_gi_and_camera(monkeypatch):
         "gi.repository.Gst": gst,
         "gi.repository.Tcam": MagicMock(),
     }
-    # Only delete multimaze_recorder modules so gi mocks take effect on re-import
-    for k in list(sys.modules.keys()):
-        if "multimaze_recorder" in k:
-            del sys.modules[k]
-
     with patch.dict("sys.modules", modules):
+        # Only delete multimaze_recorder modules so gi mocks take effect on
+        # re-import; patch.dict puts the originals back afterwards
+        for k in list(sys.modules.keys()):
+            if "multimaze_recorder" in k:
+                del sys.modules[k]
         yield
 
 
@@ -105,3 +105,59 @@ def test_configure_camera_calls_tis(tmp_path):
         mock_tis.open_device.assert_called_once()
         mock_tis.start_pipeline.assert_called_once()
         assert result is mock_tis
+
+
+def test_preview_renders_latest_frame_into_buffers():
+    from multimaze_recorder.camera.ring import FrameRing
+    from multimaze_recorder.utilities import PreviewThread
+
+    ring = FrameRing(3, (120, 160, 1))
+    tis = MagicMock()
+    tis.get_frame.side_effect = lambda seq=None: ring.acquire(seq)
+    tis.release_frame.side_effect = ring.release
+
+    preview = PreviewThread(tis, rate=50)
+    assert preview.interval == 0.1  # clamped to 10 Hz
+    assert preview.render(False, 0.0)[0] is None
+
+    ring.write(np.full((120, 160, 1), 200, dtype=np.uint8).tobytes())
+    thumbnail, _, _, seq = preview.render(False, 0.0)
+    assert seq == 0
+    assert thumbnail is preview._buffers[1]
+    assert thumbnail.shape == (480, 640, 3)
+    assert ring.in_use() == 0
+
+    # Nothing new since the last rendered frame
+    assert preview.render(False, 0.0, seq)[0] is None
+    assert ring.in_use() == 0
+
+
+def test_preview_window_is_destroyed_by_the_preview_thread(monkeypatch):
+    import threading
+    import time
+
+    from multimaze_recorder import utilities
+    from multimaze_recorder.camera.ring import FrameRing
+
+    ring = FrameRing(3, (120, 160, 1))
+    ring.write(np.zeros((120, 160, 1), dtype=np.uint8).tobytes())
+    tis = MagicMock()
+    tis.get_frame.side_effect = lambda seq=None: ring.acquire(seq)
+    tis.release_frame.side_effect = ring.release
+    calls = []
+    cv2 = MagicMock()
+    cv2.error = utilities.cv2.error
+    for name in ("imshow", "waitKey", "destroyWindow", "destroyAllWindows"):
+        getattr(cv2, name).side_effect = (
+            lambda *args, name=name: calls.append((name, threading.current_thread().name))
+        )
+    monkeypatch.setattr(utilities, "cv2", cv2)
+
+    preview = utilities.PreviewThread(tis, rate=10).start()
+    deadline = time.monotonic() + 5
+    while not preview.shown and time.monotonic() < deadline:
+        time.sleep(0.01)
+    preview.stop()
+
+    assert ("destroyWindow", "preview") in calls
+    assert all(thread == "preview" for _, thread in calls)
@@ -0,0 +1,127 @@
+"""Tests for the recording health watchdog."""
+
+import json
+import time
+
+from multimaze_recorder.recording import watchdog as watchdog_module
+from multimaze_recorder.recording.watchdog import (
+    HEALTH_FILE,
+    HealthWatchdog,
+    format_health,
+    read_health,
+)
+
+
+def _started(tmp_path, fps=100, stats=None, **kwargs):
+    watchdog = HealthWatchdog(tmp_path, fps, stats, interval=1, **kwargs)
+    # Sampled by hand instead of by the thread, so time is under test control
+    watchdog._start = 1000.0
+    watchdog._log = open(tmp_path / HEALTH_FILE, "w")
+    return watchdog
+
+
+def test_rates_and_gaps_of_an_interval(tmp_path):
+    watchdog = _started(tmp_path)
+    times = [1000 + (i + 0.5) / 100 for i in range(100)]
+    # A stall of 0.11 s (ten frames missing) in the middle of the second
+    times = [t for t in times if not 1000.40 < t < 1000.50]
+    for t in times:
+        watchdog.frame(t)
+    health = watchdog.sample(now=1001.0)
+
+    assert health["frames"] == len(times) == 90
+    assert health["fps"] == 90
+    assert health["max_gap_ms"] == 110.0
+    assert health["gap_outliers"] == 1
+    assert health["alarms"] == ["gap: no frame for 110 ms"]
+
+
+def test_alarms_are_reported_once_and_written_to_the_log(tmp_path, capsys):
+    stats = {"queued": 0, "dropped": 0, "p99_ms": 5.0}
+    alarms = []
+    watchdog = _started(tmp_path, fps=10, stats=lambda: dict(stats), on_alarm=alarms.extend)
+    for second in range(12):
+        for i in range(10 if second < 11 else 5):
+            watchdog.frame(1000 + second + (i + 0.5) / 10)
+        if second == 11:
+            stats.update(queued=500, dropped=3)
+        watchdog._write(watchdog.sample(now=1001.0 + second))
+    watchdog.stop()
+
+    lines = [json.loads(line) for line in (tmp_path / HEALTH_FILE).read_text().splitlines()]
+    assert len(lines) == 12
+    assert all(line["alarms"] == [] for line in lines[:-1])
+    names = sorted(alarm.split(":")[0] for alarm in lines[-1]["alarms"])
+    assert names == ["dropped", "gap", "queue"]
+    assert lines[-1]["write_p99_ms"] == 5.0
+    assert sorted(a.split(":")[0] for a in alarms) == names
+    assert capsys.readouterr().err.count("ALARM") == 3
+    assert read_health(tmp_path) == lines[-1]
+
+
+def test_rolling_fps_alarm_waits_for_a_full_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(watchdog_module, "ALARM_FSYNC_MS", 1e9)
+    watchdog = _started(tmp_path, fps=10)
+    for second in range(11):
+        for i in range(5):
+            watchdog.frame(1000 + second + (i + 0.5) / 5)
+        health = watchdog.sample(now=1001.0 + second)
+        fps_alarms = [a for a in health["alarms"] if a.startswith("fps")]
+        assert bool(fps_alarms) == (second >= 9)
+    assert health["rolling_fps"] == 5.0
+
+
+def test_native_recording_follows_the_written_count(tmp_path):
+    written = {"written": 0, "queued": 1}
+    watchdog = _started(tmp_path, fps=30, stats=lambda: dict(written), count_frames=False)
+    for second in range(3):
+        written["written"] += 30
+        health = watchdog.sample(now=1001.0 + second)
+    assert health["fps"] == 30 and health["rolling_fps"] == 30
+    assert health["max_gap_ms"] is None and health["alarms"] == []
+
+    watchdog = _started(tmp_path, fps=30, stats=lambda: {"queued": 0}, count_frames=False)
+    health = watchdog.sample(now=1020.0)
+    assert health["fps"] is None and health["alarms"] == []
+    assert "fps" not in format_health(health)
+
+
+def test_thread_writes_a_line_per_interval(tmp_path):
+    watchdog = HealthWatchdog(tmp_path, 50, interval=0.1).start()
+    deadline = time.monotonic() + 0.35
+    while time.monotonic() < deadline:
+        watchdog.frame()
+        time.sleep(0.02)
+    last = watchdog.stop()
+    lines = (tmp_path / HEALTH_FILE).read_text().splitlines()
+    assert len(lines) >= 3
+    assert json.loads(lines[-1]) == last
+    assert not (tmp_path / ".health_probe").exists()
+
+
+def test_sampling_errors_raise_alarms_and_sampling_goes_on(tmp_path, monkeypatch):
+    def full_disk(self):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(HealthWatchdog, "_fsync_ms", full_disk)
+    calls = []
+
+    def stats():
+        calls.append(None)
+        if len(calls) == 2:
+            raise RuntimeError("writer gone")
+        return {"queued": 0}
+
+    watchdog = HealthWatchdog(tmp_path, 50, stats, interval=0.05).start()
+    deadline = time.monotonic() + 5
+    while len(calls) < 4 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    watchdog.stop()
+
+    lines = [json.loads(line) for line in (tmp_path / HEALTH_FILE).read_text().splitlines()]
+    assert len(lines) >= 3
+    assert lines[0]["fsync_ms"] is None
+    assert lines[0]["alarms"] == ["disk: fsync probe failed: [Errno 28] No space left on device"]
+    assert lines[1]["alarms"] == ["watchdog: error while sampling: writer gone"]
+    assert "disk: fsync probe failed" in lines[2]["alarms"][0]
+    assert "fsync" not in format_health(lines[0])
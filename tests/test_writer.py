@@ -0,0 +1,108 @@
+"""Unit tests for the bounded recorder image writer."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from multimaze_recorder.recording.writer import (
+    DROPPED_FILE,
+    SPILL_FILE,
+    STATS_FILE,
+    ImageWriter,
+    ProcessImageWriter,
+    make_writer,
+)
+
+
+@pytest.fixture
+def image():
+    return np.full((12, 16), 128, dtype=np.uint8)
+
+
+def test_unknown_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ImageWriter(tmp_path, policy="ignore")
+
+
+def test_block_policy_writes_everything(tmp_path, image):
+    writer = ImageWriter(tmp_path, workers=2, max_pending=2)
+    for i in range(10):
+        writer.write(tmp_path / f"image{i}.jpg", image)
+    writer.shutdown()
+    assert len(list(tmp_path.glob("image*.jpg"))) == 10
+    assert (tmp_path / STATS_FILE).exists()
+
+
+def test_drop_policy_accounts_for_dropped_images(tmp_path, image):
+    # Without workers the queue never drains, so it is full after one image
+    writer = ImageWriter(tmp_path, workers=0, max_pending=1, policy="drop")
+    assert writer.write(tmp_path / "image0.jpg", image)
+    assert not writer.write(tmp_path / "image1.jpg", image)
+    assert not writer.write(tmp_path / "image2.jpg", image)
+    writer.shutdown()
+
+    dropped = (tmp_path / DROPPED_FILE).read_text().split()
+    assert [p.rsplit("/", 1)[-1] for p in dropped] == ["image1.jpg", "image2.jpg"]
+
+
+def test_spill_policy_recovers_spilled_images(tmp_path, image):
+    writer = ImageWriter(tmp_path, workers=0, max_pending=1, policy="spill")
+    for i in range(3):
+        assert writer.write(tmp_path / f"image{i}.jpg", image + i)
+    assert (tmp_path / SPILL_FILE).exists()
+    writer.shutdown()
+
+    # The queued image is lost with no workers; the two spilled ones are written
+    assert sorted(p.name for p in tmp_path.glob("image*.jpg")) == ["image1.jpg", "image2.jpg"]
+    assert not (tmp_path / SPILL_FILE).exists()
+
+
+@pytest.mark.parametrize("encoder", ["cv2", "pil"])
+def test_process_writer_packs_frames_into_slots(tmp_path, image, encoder):
+    writer = ProcessImageWriter(
+        tmp_path, slot_bytes=2 * image.nbytes, processes=2, encoder=encoder, quality=90
+    )
+    for i in range(4):
+        # Three images per frame: two share a slot, the third spills into another
+        writer.write_many(
+            (tmp_path / f"image{i}_{k}.jpg", image) for k in range(3)
+        )
+    writer.shutdown()
+    assert len(list(tmp_path.glob("image*.jpg"))) == 12
+    assert writer.stats()["errors"] == 0
+
+
+def test_process_writer_copies_views_on_the_frame(tmp_path):
+    frame = np.arange(40 * 60, dtype=np.uint8).reshape(40, 60)
+    writer = ProcessImageWriter(tmp_path, slot_bytes=frame.nbytes, processes=1)
+    writer.write(tmp_path / "image0.png", frame[5:25, 10:50])
+    frame[:] = 0
+    writer.shutdown()
+    saved = np.array(Image.open(tmp_path / "image0.png"))
+    np.testing.assert_array_equal(saved, np.arange(40 * 60, dtype=np.uint8).reshape(40, 60)[5:25, 10:50])
+
+
+def test_process_writer_raises_when_an_encoder_dies(tmp_path, image, monkeypatch):
+    monkeypatch.setattr("multimaze_recorder.recording.writer.SLOT_WAIT", 0.05)
+    writer = ProcessImageWriter(tmp_path, slot_bytes=image.nbytes, processes=1, slots=1)
+    writer._workers[0].kill()
+    writer._workers[0].join()
+    # The task for the only slot is never encoded, so the slot never comes back
+    writer.write(tmp_path / "image0.jpg", image)
+    with pytest.raises(RuntimeError, match="died"):
+        writer.write(tmp_path / "image1.jpg", image)
+    writer.shutdown()
+
+
+def test_make_writer_reads_preset(tmp_path, monkeypatch):
+    monkeypatch.setattr("multimaze_recorder.recording.writer.WRITER_PROCESSES", None)
+    configs = {"format": {"width": 16, "height": 12}, "jpeg_encoder": "pil", "jpeg_quality": 90}
+    writer = make_writer(tmp_path, configs)
+    assert type(writer) is ImageWriter
+    assert (writer.encoder, writer.quality) == ("pil", 90)
+    writer.shutdown()
+
+    writer = make_writer(tmp_path, {**configs, "writer_processes": 1})
+    assert isinstance(writer, ProcessImageWriter)
+    assert writer.slot_bytes == 16 * 12
+    writer.shutdown()